@@ -22,17 +22,45 @@
 #
 # Once it has a list of new update files,
 # it can download them.
-# The downloaded files are not crypto checked,
-# but are mostly good enough to be imported,
+# Lists made from the mirror keep the sha256 of each file,
+# and downloads are checked against it as they are written.
+# The Release file itself is not signature checked.
+# The files are mostly good enough to be imported,
 # by the popular jigdo tool.
 #
 
+import array
+import atexit
+import concurrent.futures
+import email.utils
+import gc
+import gzip
+import hashlib
+import heapq
+import http.client
+import json
+import mmap
 import os
+import queue
+import random
+import re
+import shutil
+import socket
+import stat
+import struct
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
 
 QUOTE = "\""
 NEWLINE = "\n"
 
+LIST_READ_CHUNK_SIZE = 1 << 20
+LIST_LOAD_TARGET_MBS = 40
+
 
 #
 # General string related functions
@@ -42,6 +70,8 @@ class CompareResult:
 	def __init__(self):
 		self.less = False
 		self.greater = False
+		# for --stats-json, where a search counts them
+		self.compareCount = 0
 	
 def strRange(theStr, start, theLen):
 	i = 0
@@ -124,30 +154,236 @@ def compareStrings2(compRes, str1, str2):
 	print(str1 + "," + str2 + "," + myStr + ",")
 
 def getNumberFromString(numStr):
-	accum = 0
-	i = 0
-	while(i < len(numStr)):
-		accum *= 10
-		if(not(numStr[i] >= '0')
-			or not(numStr[i] <= '9')):
-			return None
-		accum += ord(numStr[i]) - ord('0')
-			
-		i += 1
-	return accum
+	if(numStr == ""): return 0
+	if(not numStr.isascii() or not numStr.isdigit()): return None
+	return int(numStr)
 
 def isStringSimpleNumber(numStr):
 	return getNumberFromString(numStr) != None
 
+SHA256_PATTERN = re.compile("[0-9a-f]{64}")
+
+def isStringSha256(hashStr):
+	# lower case hex, like debian writes it
+	return SHA256_PATTERN.fullmatch(hashStr) != None
+
+NO_SHA256_BYTES = bytes(32)
+
+def getShaBytes(hashStr):
+	# For the list columns, all zero stands for no hash
+	if(hashStr == None): return NO_SHA256_BYTES
+	return bytes.fromhex(hashStr)
+
+def getShaFromBytes(buf, pos):
+	shaBytes = buf[pos:(pos + 32)]
+	if(shaBytes == NO_SHA256_BYTES): return None
+	return bytes(shaBytes).hex()
+
 
 #
 # General helper functions
 #
 
+# progress dots are flushed this often, not each time
+PRINT_RAW_FLUSH_SECONDS = 0.5
+
+class PrintRawState:
+	def __init__(self):
+		self.lastFlushTime = 0.0
+
+PRINT_RAW_STATE = PrintRawState()
+
 def printRaw(theStr):
 	s2 = str(theStr)
 	sys.stdout.write(s2)
-	sys.stdout.flush()
+	now = time.monotonic()
+	if(s2.endswith(NEWLINE)
+		or now - PRINT_RAW_STATE.lastFlushTime >= PRINT_RAW_FLUSH_SECONDS):
+
+		sys.stdout.flush()
+		PRINT_RAW_STATE.lastFlushTime = now
+
+
+#
+# Run statistics functions
+#
+
+RUN_STATS_FORMAT_VERSION = 1
+
+class StageStats:
+	def __init__(self):
+		self.wallSeconds = 0.0
+		self.cpuSeconds = 0.0
+		self.callCount = 0
+		self.recordCount = 0
+		self.byteCount = 0
+
+class StageTimer:
+	def __init__(self):
+		self.name = None
+		self.isRunning = False
+		self.wallStart = None
+		self.cpuStart = None
+		self.wallSeconds = 0.0
+		self.cpuSeconds = 0.0
+
+class RunStats:
+	# Wall and cpu time of each stage, and counters, for --stats-json.
+	# A stage started in another stage, in the same thread,
+	# is not counted in the outer one.
+	# The times of a stage run in more threads add up,
+	# so they can be more than the time of the run.
+	# When not enabled, the stage functions return at once.
+	def __init__(self):
+		self.isEnabled = False
+		self.lock = threading.Lock()
+		self.startTime = None
+		self.startCpu = None
+		self.stageDict = {}
+		self.counterDict = {}
+		# the stages running in each thread
+		self.local = threading.local()
+
+	def enable(self):
+		self.startTime = time.perf_counter()
+		self.startCpu = time.process_time()
+		self.isEnabled = True
+
+	def getStack(self):
+		stack = getattr(self.local, "stack", None)
+		if(stack == None):
+			stack = []
+			self.local.stack = stack
+		return stack
+
+	def push(self, timer):
+		stack = self.getStack()
+		wallNow = time.perf_counter()
+		cpuNow = time.thread_time()
+		if(len(stack) > 0 and stack[-1].isRunning):
+			parent = stack[-1]
+			parent.wallSeconds += wallNow - parent.wallStart
+			parent.cpuSeconds += cpuNow - parent.cpuStart
+			parent.isRunning = False
+		timer.wallStart = wallNow
+		timer.cpuStart = cpuNow
+		timer.isRunning = True
+		stack.append(timer)
+
+	def pop(self, timer):
+		stack = self.getStack()
+		wallNow = time.perf_counter()
+		cpuNow = time.thread_time()
+		if(timer not in stack): return
+		# stages left by an exception are dropped
+		while(stack[-1] is not timer): stack.pop()
+		stack.pop()
+		if(timer.isRunning):
+			timer.wallSeconds += wallNow - timer.wallStart
+			timer.cpuSeconds += cpuNow - timer.cpuStart
+			timer.isRunning = False
+		if(len(stack) > 0):
+			parent = stack[-1]
+			parent.wallStart = wallNow
+			parent.cpuStart = cpuNow
+			parent.isRunning = True
+
+	def add(self, timer, recordCount, byteCount):
+		self.lock.acquire()
+		stats = self.stageDict.get(timer.name)
+		if(stats == None):
+			stats = StageStats()
+			self.stageDict[timer.name] = stats
+		stats.wallSeconds += timer.wallSeconds
+		stats.cpuSeconds += timer.cpuSeconds
+		stats.callCount += 1
+		stats.recordCount += recordCount
+		stats.byteCount += byteCount
+		self.lock.release()
+
+	def addCounter(self, name, value):
+		self.lock.acquire()
+		self.counterDict[name] = self.counterDict.get(name, 0) + value
+		self.lock.release()
+
+RUN_STATS = RunStats()
+
+def startStage(name):
+	# Gives the timer for endStage, None when not enabled
+	if(not RUN_STATS.isEnabled): return None
+	timer = StageTimer()
+	timer.name = name
+	RUN_STATS.push(timer)
+	return timer
+
+def endStage(timer, recordCount, byteCount):
+	if(timer == None): return
+	RUN_STATS.pop(timer)
+	RUN_STATS.add(timer, recordCount, byteCount)
+
+def addStatsCounter(name, value):
+	if(not RUN_STATS.isEnabled): return
+	RUN_STATS.addCounter(name, value)
+
+def iterStage(name, itemIter):
+	# The time taken to make each item counts for the stage,
+	# not the time the caller takes with it
+	if(not RUN_STATS.isEnabled): return itemIter
+	return iterStageTimed(name, itemIter)
+
+def iterStageTimed(name, itemIter):
+	itemIter = iter(itemIter)
+	timer = StageTimer()
+	timer.name = name
+	recordCount = 0
+	try:
+		while(True):
+			RUN_STATS.push(timer)
+			try:
+				item = next(itemIter)
+			except StopIteration:
+				break
+			finally:
+				RUN_STATS.pop(timer)
+			recordCount += 1
+			yield item
+	finally:
+		RUN_STATS.add(timer, recordCount, 0)
+	return
+
+def getRunStatsDict():
+	stageDict = {}
+	for name in sorted(RUN_STATS.stageDict.keys()):
+		stats = RUN_STATS.stageDict[name]
+		stageDict[name] = {
+			"wallSeconds": round(stats.wallSeconds, 6),
+			"cpuSeconds": round(stats.cpuSeconds, 6),
+			"calls": stats.callCount,
+			"records": stats.recordCount,
+			"bytes": stats.byteCount,
+		}
+	return {
+		"version": RUN_STATS_FORMAT_VERSION,
+		"wallSeconds": round(time.perf_counter() - RUN_STATS.startTime, 6),
+		"cpuSeconds": round(time.process_time() - RUN_STATS.startCpu, 6),
+		"stages": stageDict,
+		"counters": dict(sorted(RUN_STATS.counterDict.items())),
+	}
+
+def writeRunStatsFile(path):
+	statsDict = getRunStatsDict()
+	for name, stage in statsDict["stages"].items():
+		print("Stage " + name
+			+ ": " + ("%.3f" % stage["wallSeconds"]) + " s"
+			+ ", cpu " + ("%.3f" % stage["cpuSeconds"]) + " s"
+			+ ", records " + str(stage["records"]))
+
+	tempPath = path + ".tmp"
+	fileObj = open(tempPath, "w")
+	json.dump(statsDict, fileObj, indent=1, sort_keys=True)
+	fileObj.write(NEWLINE)
+	fileObj.close()
+	os.replace(tempPath, path)
 
 def getFileSize(path):
 	if(not os.path.isfile(path)): return None
@@ -159,6 +395,73 @@ def getFileSize(path):
 	fileObj.close()
 	return num
 
+def getFileSha256(path):
+	hashObj = hashlib.sha256()
+	fileObj = open(path, "rb")
+	while(True):
+		chunk = fileObj.read(1 << 20)
+		if(not chunk): break
+		hashObj.update(chunk)
+	fileObj.close()
+	return hashObj.hexdigest()
+
+def unzipFileWithSha256(gzPath, path):
+	# The gz file is unzipped to path a chunk at a time,
+	# so it is never all in memory.
+	# Gives the sha256 of the unzipped data.
+	hashObj = hashlib.sha256()
+	inObj = gzip.open(gzPath, "rb")
+	outObj = open(path, "wb")
+	while(True):
+		chunk = inObj.read(1 << 20)
+		if(not chunk): break
+		hashObj.update(chunk)
+		outObj.write(chunk)
+	outObj.close()
+	inObj.close()
+	return hashObj.hexdigest()
+
+def writeDictFile(path, typeName, propDict):
+	# Writes one dict, in the format of list1.csv,
+	# with string properties only
+	tempPath = path + ".tmp"
+	fileObj = open(tempPath, "w")
+	fileObj.write("DictBegin" + NEWLINE)
+	fileObj.write("Type/String" + "," + "type" + "," + typeName + NEWLINE)
+	for propName in sorted(propDict.keys()):
+		valueStr = propDict[propName]
+		if(valueStr == None): continue
+		fileObj.write("Type/String" + "," + propName + "," + valueStr + NEWLINE)
+	fileObj.write("DictEnd" + NEWLINE)
+	fileObj.close()
+	os.replace(tempPath, path)
+
+def parseDictFile(path, typeName):
+	# Reads a dict written by writeDictFile,
+	# a value may have commas in it
+	propDict = {}
+	if(not fileExists(path)): return None
+
+	fileObj = open(path, "r")
+	lineList = fileObj.read().split(NEWLINE)
+	fileObj.close()
+
+	if(len(lineList) < 3
+		or lineList[0] != "DictBegin"
+		or lineList[1] != "Type/String" + "," + "type" + "," + typeName):
+
+		raise Exception("dict file not valid: " + path)
+
+	for line in lineList[2:]:
+		if(line == "DictEnd"): return propDict
+
+		parts = line.split(',', 2)
+		if(len(parts) != 3 or parts[0] != "Type/String"):
+			raise Exception("dict file not valid: " + path)
+		propDict[parts[1]] = parts[2]
+
+	raise Exception("dict file not valid: " + path)
+
 
 #
 # General directory helper functions
@@ -192,7 +495,7 @@ def fileExists(path1):
 
 def makeDirs(path1):
 	if(dirExists2(path1)): return
-	os.makedirs(path1)
+	os.makedirs(path1, exist_ok=True)
 	return
 
 def rebaseIfPathFound(path1, innerPath):
@@ -253,11 +556,15 @@ def rebaseIfPathFound(path1, innerPath):
 #
 
 class RepoFileSpec:
+	__slots__ = ("fileName", "theDir", "fileNameMinusPath", "fileSize", "sha256")
+
 	def __init__(self):
 		self.fileName = None
 		self.theDir = None
 		self.fileNameMinusPath = None
 		self.fileSize = None
+		# hex, from the Packages or Sources file
+		self.sha256 = None
 
 	def calc(self):
 		if(self.fileName == None):
@@ -265,17 +572,11 @@ class RepoFileSpec:
 			self.fileNameMinusPath = None
 			return
 		
-		j = 0
-		lastSlashIndex = 0
-		while(j < len(self.fileName)):
-			c = self.fileName[j]
+		lastSlashIndex = max(
+			self.fileName.rfind('/'),
+			self.fileName.rfind('\\'))
 
-			if(c == '/' or c == '\\'):
-				lastSlashIndex = j
-			
-			j += 1
-			
-		if(lastSlashIndex == 0):
+		if(lastSlashIndex <= 0):
 			raise Exception("file name invalid: " + self.fileName)
 
 		if(lastSlashIndex + 1 >= len(self.fileName)):
@@ -286,56 +587,140 @@ class RepoFileSpec:
 
 		return
 
-def getFileList(theDir):
-	myList1 = []
-	
-	if(not dirExists2(theDir)):
-		return myList1
-	
-	localList2 = os.listdir(theDir)
-	if(localList2 == None):
-		return localList1
-	
-	i = 0
-	while(i < len(localList2)):
-		entry = localList2[i]
-		
-		if(entry == "." or entry == ".."):
-			i += 1
-			continue
-		
-		if(entry == None or entry == ""):
-			i += 1
-			continue
-		
-		if(fileExists(pathCombine2(theDir, entry))):
-			spec = RepoFileSpec()
-			spec.theDir = theDir
-			spec.fileNameMinusPath = entry
-			spec.fileSize = getFileSize(pathCombine2(theDir, entry))
-			
-			myList1.append(spec)
-			i += 1
+def scanDirForFileList(theDir, theDev):
+	# One dir of getFileList.
+	# Gives the specs of the files in it,
+	# and the sub dirs to scan, with their device numbers.
+	specList = []
+	subDirList = []
+
+	for entry in os.scandir(theDir):
+		path = pathCombine2(theDir, entry.name)
+
+		try:
+			if(entry.is_file()):
+				spec = RepoFileSpec()
+				spec.theDir = theDir
+				spec.fileNameMinusPath = entry.name
+				spec.fileSize = entry.stat().st_size
+				specList.append(spec)
+				continue
+
+			if(not entry.is_dir()):
+				# otherwise, ignore path
+				continue
+
+			if(isStringSimpleNumber(entry.name)):
+				subDirList.append((path, entry.stat().st_dev))
+				continue
+
+			if(entry.is_symlink()):
+				continue
+
+			entryDev = entry.stat(follow_symlinks=False).st_dev
+			if(entryDev != theDev):
+				# a mountpoint
+				continue
+
+			subDirList.append((path, entryDev))
+		except FileNotFoundError:
+			# removed while scanning
 			continue
 
-		if(dirExists2(pathCombine2(theDir, entry))):
-			if(isStringSimpleNumber(entry)):
-				myList1.extend(getFileList(pathCombine2(theDir, entry)))
-				i += 1
+	return specList, subDirList
+
+def getFileList(theDir, jobCount):
+	# Gives the specs of the files under theDir.
+	# Links and mount points are not followed,
+	# unless the dir name is a number.
+	# With os.scandir, the file type and size come from one call.
+	# Dirs are scanned on jobCount threads,
+	# and the specs are given as soon as their dir is done.
+	if(not dirExists2(theDir)):
+		return
+
+	for spec in iterDirScan(scanDirForFileList,
+		(theDir, os.stat(theDir).st_dev), jobCount):
+
+		yield spec
+	return
+
+def iterDirScan(scanFunction, firstArgs, jobCount):
+	# scanFunction scans one dir, and gives its specs,
+	# and the args to scan each sub dir with.
+	# Dirs are scanned on jobCount threads.
+	executor = concurrent.futures.ThreadPoolExecutor(jobCount)
+	pendingSet = set()
+	pendingSet.add(executor.submit(scanFunction, *firstArgs))
+
+	try:
+		while(len(pendingSet) > 0):
+			doneSet, pendingSet = concurrent.futures.wait(
+				pendingSet, return_when=concurrent.futures.FIRST_COMPLETED)
+
+			for future in doneSet:
+				specList, subDirList = future.result()
+
+				for args in subDirList:
+					pendingSet.add(executor.submit(scanFunction, *args))
+
+				for spec in specList:
+					yield spec
+	finally:
+		executor.shutdown(wait=True, cancel_futures=True)
+
+	return
+
+def getPoolFileList(poolDir, jobCount):
+	# Like getFileList, for a download pool, which is all ours.
+	# Symlinked dirs and mount points are followed,
+	# each dir is scanned once, so a link loop ends.
+	if(not dirExists2(poolDir)):
+		return
+
+	st = os.stat(poolDir)
+	visitedSet = set()
+	visitedSet.add((st.st_dev, st.st_ino))
+	for spec in iterDirScan(scanPoolDirForFileList,
+		(poolDir, visitedSet, threading.Lock()), jobCount):
+
+		yield spec
+	return
+
+def scanPoolDirForFileList(theDir, visitedSet, lock):
+	# One dir of getPoolFileList
+	specList = []
+	subDirList = []
+
+	for entry in os.scandir(theDir):
+		try:
+			if(entry.is_file()):
+				spec = RepoFileSpec()
+				spec.theDir = theDir
+				spec.fileNameMinusPath = entry.name
+				spec.fileSize = entry.stat().st_size
+				specList.append(spec)
 				continue
 
-		if(dirExists(pathCombine2(theDir, entry))):
-			myList1.extend(getFileList(pathCombine2(theDir, entry)))
-			i += 1
+			if(not entry.is_dir()):
+				continue
+
+			st = entry.stat()
+			lock.acquire()
+			isNew = (st.st_dev, st.st_ino) not in visitedSet
+			visitedSet.add((st.st_dev, st.st_ino))
+			lock.release()
+			if(isNew):
+				subDirList.append((pathCombine2(theDir, entry.name), visitedSet, lock))
+		except FileNotFoundError:
+			# removed while scanning
 			continue
-		
-		# otherwise, ignore path
-		i += 1
-	
-	return myList1
+
+	return specList, subDirList
 
 def replaceBackslash(myList):
 	print("Replacing backslashes in filenames in list...")
+	timer = startStage("filter")
 	i = 0
 	while(i < len(myList)):
 		fileStr = myList[i].theDir
@@ -345,6 +730,7 @@ def replaceBackslash(myList):
 				fileStr[j] = '/'
 			j += 1
 		i += 1
+	endStage(timer, len(myList), 0)
 	return
 	
 def sortListSwapAt(myList, i):
@@ -391,73 +777,167 @@ def sortList(myList):
 		continue
 	return
 
+def getSpecSortKey(spec):
+	# Sorts like comparing theDir first, then fileNameMinusPath,
+	# because no path has a char below the separator
+	return spec.theDir + "\0" + spec.fileNameMinusPath
+
 def sortList2(myList):
-	# On a list of 50000, this takes 15 seconds
+	# Sorts by theDir, then fileNameMinusPath, and removes duplicates.
+	# python string order is the same as compareStrings order.
+	# The sort is stable, so of duplicates the first one is kept.
+	# On a list of 50000, this takes 0.1 seconds,
+	# on a list of 2000000, this takes 7 seconds
+
+	timer = startStage("sort")
+	if(isinstance(myList, ListStore)):
+		print("Sorting list...")
+		myList2 = myList.sorted()
+		endStage(timer, len(myList2), 0)
+		return myList2
 
-	myComp = CompareResult()
-	myList2 = []
-	
 	print("Sorting list...")
-	
-	
-	myLen = len(myList)
 
-	if(myLen == 0):
-		printRaw(NEWLINE)
-		return myList2
-	
-	i = 0
-	lastProgress100 = 0
-	while(i < myLen):
-		progress100 = int(i * 100 / myLen)
-		if(lastProgress100 + 2 < progress100):
-			printRaw(" " + str(progress100) + "%")
-			lastProgress100 = progress100
-		
-		spec = myList[i]
-		
-		insertMax = len(myList2)
-		insertMin = 0
-		
-		while(True):
-			inBetween = int((insertMax + insertMin) / 2)
-			
-			if(insertMin == insertMax):
-				myList2.insert(inBetween, spec)
-				break
+	keyList = [getSpecSortKey(spec) for spec in myList]
+	indexList = sorted(range(len(keyList)), key=keyList.__getitem__)
 
-			if(inBetween >= len(myList2)):
-				myList2.insert(inBetween, spec)
-				break
-			
-			compareStrings(myComp,
-				spec.theDir,
-				myList2[inBetween].theDir)
-			
-			if(not myComp.less and not myComp.greater):
-				compareStrings(myComp,
-					spec.fileNameMinusPath,
-					myList2[inBetween].fileNameMinusPath)
-				
-			if(myComp.greater):
-				insertMin = inBetween + 1
-				continue
-			
-			if(myComp.less):
-				insertMax = inBetween
-				continue
-			
+	myList2 = []
+	lastKey = None
+	for i in indexList:
+		key = keyList[i]
+		if(key == lastKey):
 			# remove duplicate from final list
-			#print("removing duplicate: " + spec.theDir + "," + spec.fileNameMinusPath)
-			break
-		
-		i += 1
-		#print("doing again")
-		continue
-	
-	printRaw(NEWLINE)
+			continue
+
+		myList2.append(myList[i])
+		lastKey = key
+
+	endStage(timer, len(myList2), 0)
 	return myList2
 
+class ListStore:
+	# A compact list of RepoFileSpec, kept in array columns.
+	# Each theDir is stored once, rows only keep its id.
+	# Names are kept as utf-8 in one buffer,
+	# a name ends where the next one begins.
+	# Works like a list of RepoFileSpec,
+	# each spec is made when it is used,
+	# so changing a spec does not change the store.
+	def __init__(self):
+		self.dirList = []
+		self.dirIds = {}
+		self.dirIdColumn = array.array("I")
+		self.nameOffsetColumn = array.array("Q")
+		self.nameBuffer = bytearray()
+		self.sizeColumn = array.array("q")
+		# 32 bytes for each row, all zero if not known
+		self.shaBuffer = bytearray()
+		self.isSorted = False
+
+	def getDirId(self, theDir):
+		dirId = self.dirIds.get(theDir)
+		if(dirId == None):
+			dirId = len(self.dirList)
+			self.dirIds[theDir] = dirId
+			self.dirList.append(theDir)
+		return dirId
+
+	def addRow(self, dirId, nameBytes, fileSize, shaBytes):
+		self.dirIdColumn.append(dirId)
+		self.nameOffsetColumn.append(len(self.nameBuffer))
+		self.nameBuffer += nameBytes
+		self.sizeColumn.append(fileSize)
+		self.shaBuffer += shaBytes
+
+	def append(self, spec):
+		if(spec.theDir == None
+			or spec.fileNameMinusPath == None):
+
+			raise Exception("a RepoFileSpec is bad")
+
+		fileSize = spec.fileSize
+		if(fileSize == None): fileSize = -1
+
+		self.addRow(self.getDirId(spec.theDir),
+			spec.fileNameMinusPath.encode("utf-8"), fileSize,
+			getShaBytes(spec.sha256))
+		self.isSorted = False
+
+	def extend(self, myList):
+		for spec in myList:
+			self.append(spec)
+
+	def __len__(self):
+		return len(self.dirIdColumn)
+
+	def getNameBytes(self, i):
+		start = self.nameOffsetColumn[i]
+		end = len(self.nameBuffer)
+		if(i + 1 < len(self.nameOffsetColumn)):
+			end = self.nameOffsetColumn[i + 1]
+		return bytes(self.nameBuffer[start:end])
+
+	def getShaBytes(self, i):
+		return bytes(self.shaBuffer[(i * 32):(i * 32 + 32)])
+
+	def makeSpec(self, i):
+		spec = RepoFileSpec()
+		spec.theDir = self.dirList[self.dirIdColumn[i]]
+		spec.fileNameMinusPath = self.getNameBytes(i).decode("utf-8")
+		fileSize = self.sizeColumn[i]
+		if(fileSize >= 0): spec.fileSize = fileSize
+		spec.sha256 = getShaFromBytes(self.shaBuffer, i * 32)
+		return spec
+
+	def __getitem__(self, i):
+		if(i < 0): i += len(self.dirIdColumn)
+		if(i < 0 or i >= len(self.dirIdColumn)):
+			raise IndexError("list store index out of range")
+		return self.makeSpec(i)
+
+	def __iter__(self):
+		i = 0
+		while(i < len(self.dirIdColumn)):
+			yield self.makeSpec(i)
+			i += 1
+
+	def sorted(self):
+		# Same order and duplicate removal as sortList2.
+		# Rows are grouped by dir id first,
+		# so names are only compared within a dir.
+		# utf-8 bytes sort in the same order as the strings.
+		rowsByDir = []
+		for theDir in self.dirList: rowsByDir.append([])
+		i = 0
+		for dirId in self.dirIdColumn:
+			rowsByDir[dirId].append(i)
+			i += 1
+
+		# dir ids of the new store are in sorted order
+		store = ListStore()
+		for dirId in sorted(range(len(self.dirList)), key=self.dirList.__getitem__):
+			rowList = rowsByDir[dirId]
+			rowsByDir[dirId] = None
+
+			nameList = []
+			for i in rowList:
+				nameList.append(self.getNameBytes(i))
+			orderList = sorted(range(len(rowList)), key=nameList.__getitem__)
+
+			newDirId = store.getDirId(self.dirList[dirId])
+			lastName = None
+			for j in orderList:
+				nameBytes = nameList[j]
+				if(nameBytes == lastName):
+					# remove duplicate from final list
+					continue
+				store.addRow(newDirId, nameBytes, self.sizeColumn[rowList[j]],
+					self.getShaBytes(rowList[j]))
+				lastName = nameBytes
+
+		store.isSorted = True
+		return store
+
 def dumpList(myList):
 	i = 0
 	while(i < len(myList)):
@@ -467,7 +947,9 @@ def dumpList(myList):
 		i += 1
 
 def writeListToFile(fileObj, myList):
+	specCount = 0
 	for spec in myList:
+		specCount += 1
 		fileObj.write("DictBegin" + NEWLINE)
 		fileObj.write(
 			"Type/String"
@@ -487,9 +969,16 @@ def writeListToFile(fileObj, myList):
 				"Type/Int64"
 				+ "," + "fileSize"
 				+ "," + str(spec.fileSize) + NEWLINE)
-		
+		if(spec.sha256 != None):
+			fileObj.write(
+				"Type/String"
+				+ "," + "sha256"
+				+ "," + spec.sha256 + NEWLINE)
+
 		fileObj.write("DictEnd" + NEWLINE)
 
+	return specCount
+
 def addDictValue(spec, propertyName, valueStr, lineStr, lineNum):
 	#print("spec: " + str(propertyName) + "," + str(valueStr))
 	if(propertyName == "theDir"):
@@ -515,159 +1004,151 @@ def addDictValue(spec, propertyName, valueStr, lineStr, lineNum):
 		spec.fileSize = num
 		return
 
+	if(propertyName == "sha256"):
+		if(not isStringSha256(valueStr)):
+			print("Line Number: " + str(lineNum))
+			raise Exception("sha256 not valid: " + "sha256")
+		spec.sha256 = valueStr
+		return
+
 	print("Line Number: " + str(lineNum))
 	raise Exception("line not recognized: " + lineStr)
 	return
 
 def parseListFromFile(fileObj):
 	myList = []
-	
+
 	print("Reading list from file...")
-	
-	haveDict = False
-	haveSpec = False
-	lineNum = 0
-	spec = None
-	s1 = fileObj.readline()
-	lastSpecCount = 0
-	while(True):
-		if(lastSpecCount + 1000 < len(myList)):
-			printRaw(" .")
-			lastSpecCount = len(myList)
-			continue
 
-		if(s1 == NEWLINE):
-			lineNum += 1
-			s1 = fileObj.readline()
-			continue
-		
-		if(s1 == ""):
-			break
-	
-		line = s1.strip()
-		
-		if(not haveDict):
-			lineLen = getSepListLength(line, ',')
-			#print(lineLen)
-			if(lineLen == 0):
-				csvType = getSepListItem(line, 0, ',')
-				if(csvType == "DictBegin"):
-					haveDict = True
-					s1 = fileObj.readline()
-					lineNum += 1
-					continue
-			
-			print("lineNum: " + str(lineNum))
-			raise Exception("line not recognized: " + line)
-		
-		if(haveDict and not haveSpec):
-			lineLen = getSepListLength(line, ',')
-			if(lineLen == 2):
-				i = 0
-				while(i < 3):
-					if(i == 0):
-						csvType = getSepListItem(line, i, ',')
-						if(csvType == "Type/String"):
-							i += 1
-							continue
-					if(i == 1):
-						csvField = getSepListItem(line, i, ',')
-						if(csvField == "type"):
-							i += 1
-							continue
-					if(i == 2):
-						csvValue = getSepListItem(line, i, ',')
-						if(csvValue == "RepoFileSpec"):
-							i += 1
-							continue
-					
-					print("lineNum: " + str(lineNum))
-					raise Exception("line not recognized: " + line)
-					
-				haveSpec = True
-				spec = RepoFileSpec()
-				s1 = fileObj.readline()
-				lineNum += 1
-				continue
+	# specs do not make reference cycles,
+	# so the garbage collector only slows down the loading
+	gcWasEnabled = gc.isenabled()
+	gc.disable()
+	try:
+		lastSpecCount = 0
+		for spec in iterListFromFile(fileObj):
+			myList.append(spec)
 
-			print("lineNum: " + str(lineNum))
-			raise Exception("line not recognized: " + line)
-						
-		if(haveDict and haveSpec):
-			lineLen = getSepListLength(line, ',')
-			if(lineLen == 2):
-				i = 0
-				while(i < 3):
-					if(i == 0):
-						csvType = getSepListItem(line, i, ',')
-						if(csvType == "Type/String"):
-							i += 1
-							continue
-
-						if(csvType == "Type/Int64"):
-							i += 2
-							continue
-						
-						print("lineNum: " + str(lineNum))
-						raise Exception("line not recognized: " + line)
-						
-								
-					if(i == 1):
-						addDictValue(
-							spec,
-							getSepListItem(line, 1, ','),
-							getSepListItem(line, 2, ','),
-							line,
-							lineNum)
-						break
-
-					if(i == 2):
-						addDictValue(
-							spec,
-							getSepListItem(line, 1, ','),
-							getSepListItem(line, 2, ','),
-							line,
-							lineNum)
-						break
-						
-					print("lineNum: " + str(lineNum))
-					raise Exception("line not recognized: " + line)
-
-				s1 = fileObj.readline()
-				lineNum += 1
-				continue
-			
-			if(lineLen == 0):
-				i = 0
-				while(i < 3):
-					if(i == 0):
-						csvType = getSepListItem(line, i, ',')
-						if(csvType == "DictEnd"):
-							if(spec.theDir == None
-								or spec.fileNameMinusPath == None):
-								
-								print("lineNum: " + str(lineNum))
-								raise Exception("dict not valid: " + line)
-							
-							myList.append(spec)
-							break
-						
-					print("lineNum: " + str(lineNum))
-					raise Exception("line not recognized: " + line)
-
-				spec = None
-				haveDict = False
-				haveSpec = False
-				s1 = fileObj.readline()
-				lineNum += 1
-				continue
-		print("lineNum: " + str(lineNum))
-		raise Exception("line not recognized: " + line)
-		continue
+			if(lastSpecCount + 10000 < len(myList)):
+				printRaw(" .")
+				lastSpecCount = len(myList)
+	finally:
+		if(gcWasEnabled): gc.enable()
 
 	printRaw(NEWLINE)
 	return myList
 
+class ListParseState:
+	def __init__(self):
+		self.haveDict = False
+		self.spec = None
+		self.lineNum = 0
+
+# A whole RepoFileSpec dict, the way writeListToFile writes it
+LIST_DICT_PATTERN = re.compile(
+	"DictBegin\n"
+	+ "Type/String,type,RepoFileSpec\n"
+	+ "Type/String,theDir,([^,\\s]+)\n"
+	+ "Type/String,fileNameMinusPath,([^,\\s]+)\n"
+	+ "(?:Type/Int64,fileSize,([0-9]+)\n)?"
+	+ "(?:Type/String,sha256,([0-9a-f]{64})\n)?"
+	+ "DictEnd\n")
+
+def parseListLine(state, s1):
+	# Gives the spec, once its dict is complete
+	if(s1 == NEWLINE):
+		state.lineNum += 1
+		return None
+
+	line = s1.strip()
+	parts = line.split(',')
+	spec = state.spec
+
+	if(len(parts) == 3 and spec != None):
+		if(parts[0] != "Type/String" and parts[0] != "Type/Int64"):
+			print("lineNum: " + str(state.lineNum))
+			raise Exception("line not recognized: " + line)
+
+		addDictValue(spec, parts[1], parts[2], line, state.lineNum)
+		state.lineNum += 1
+		return None
+
+	if(len(parts) == 1 and spec != None):
+		if(parts[0] != "DictEnd"):
+			print("lineNum: " + str(state.lineNum))
+			raise Exception("line not recognized: " + line)
+
+		if(spec.theDir == None
+			or spec.fileNameMinusPath == None):
+
+			print("lineNum: " + str(state.lineNum))
+			raise Exception("dict not valid: " + line)
+
+		state.spec = None
+		state.haveDict = False
+		state.lineNum += 1
+		return spec
+
+	if(len(parts) == 1 and not state.haveDict):
+		if(parts[0] == "DictBegin"):
+			state.haveDict = True
+			state.lineNum += 1
+			return None
+
+	if(len(parts) == 3 and state.haveDict and spec == None):
+		if(parts[0] == "Type/String"
+			and parts[1] == "type"
+			and parts[2] == "RepoFileSpec"):
+
+			state.spec = RepoFileSpec()
+			state.lineNum += 1
+			return None
+
+	print("lineNum: " + str(state.lineNum))
+	raise Exception("line not recognized: " + line)
+
+def iterListFromFile(fileObj):
+	# Gives the specs one at a time, as they are read.
+	# The file is read in large chunks,
+	# and each dict written like writeListToFile does it,
+	# is matched at once. Anything else goes line by line.
+	state = ListParseState()
+	matchDict = LIST_DICT_PATTERN.match
+	while(True):
+		chunk = fileObj.read(LIST_READ_CHUNK_SIZE)
+		if(chunk == ""): break
+		if(not chunk.endswith(NEWLINE)):
+			chunk += fileObj.readline()
+
+		pos = 0
+		chunkLen = len(chunk)
+		while(pos < chunkLen):
+			if(not state.haveDict):
+				m = matchDict(chunk, pos)
+				if(m != None):
+					spec = RepoFileSpec()
+					spec.theDir = m.group(1)
+					spec.fileNameMinusPath = m.group(2)
+					sizeStr = m.group(3)
+					state.lineNum += 5
+					if(sizeStr != None):
+						spec.fileSize = int(sizeStr)
+						state.lineNum += 1
+					spec.sha256 = m.group(4)
+					if(spec.sha256 != None): state.lineNum += 1
+					pos = m.end()
+					yield spec
+					continue
+
+			endPos = chunk.find(NEWLINE, pos) + 1
+			if(endPos == 0): endPos = chunkLen
+			spec = parseListLine(state, chunk[pos:endPos])
+			pos = endPos
+			if(spec != None):
+				yield spec
+
+	return
+
 def isSpecInList1(myComp, myList1, spec):
 	insertMax = len(myList1)
 	insertMin = 0
@@ -678,6 +1159,7 @@ def isSpecInList1(myComp, myList1, spec):
 		if(insertMin == insertMax): return False
 		if(inBetween >= len(myList1)): return False
 		
+		myComp.compareCount += 1
 		compareStrings(myComp,
 			spec.theDir,
 			myList1[inBetween].theDir)
@@ -705,6 +1187,7 @@ def compareListsSorted(myList1, myList2):
 	myComp = CompareResult()
 	
 	print("Comparing lists...")
+	timer = startStage("compare")
 	
 	i = 0
 	theLen = len(myList2)
@@ -725,26 +1208,189 @@ def compareListsSorted(myList1, myList2):
 		continue
 	
 	printRaw(NEWLINE)
+	endStage(timer, theLen, 0)
+	addStatsCounter("comparisons", myComp.compareCount)
 	return myList3
 
-def insertList2IntoList1Sorted(myList1, myList2):
-	myComp = CompareResult()
-	
-	#print("Adding list to list...")
-	
-	i = 0
-	theLen = len(myList2)
-	lastProgress100 = 0
-	while(i < theLen):
-		progress100 = int(i * 100 / theLen)
-		if(lastProgress100 + 2 < progress100):
-			#printRaw(" " + str(progress100) + "%")
-			lastProgress100 = progress100
+def nextSortedSpec(specIter, lastKey, listName):
+	# Gives the next spec that is not a duplicate, and its key,
+	# or None twice at the end of the list
+	for spec in specIter:
+		key = getSpecSortKey(spec)
+		if(lastKey != None):
+			if(key == lastKey): continue
+			if(key < lastKey):
+				raise Exception("list not sorted, use --compare-lists: " + listName
+					+ ": " + spec.theDir + "," + spec.fileNameMinusPath)
+		return spec, key
+	return None, None
+
+def compareListsStreamed(specIter1, specIter2, listName1, listName2):
+	# Like compareListsSorted, but both lists are walked once,
+	# side by side, so neither list needs to be in memory.
+	# Both lists must be sorted, like sortList2 does it.
+
+	specIter1 = iter(specIter1)
+	specIter2 = iter(specIter2)
+	compareCount = 0
+
+	spec1, key1 = nextSortedSpec(specIter1, None, listName1)
+	spec2, key2 = nextSortedSpec(specIter2, None, listName2)
+	while(spec2 != None):
+		while(spec1 != None and key1 < key2):
+			compareCount += 1
+			spec1, key1 = nextSortedSpec(specIter1, key1, listName1)
+
+		compareCount += 1
+		if(spec1 == None or key1 != key2):
+			yield spec2
+
+		spec2, key2 = nextSortedSpec(specIter2, key2, listName2)
+
+	# read the rest of list 1, to be sure it was sorted
+	while(spec1 != None):
+		spec1, key1 = nextSortedSpec(specIter1, key1, listName1)
+
+	addStatsCounter("comparisons", compareCount)
+	return
 
-		spec = myList2[i]
-		
-		insertMax = len(myList1)
-		insertMin = 0
+def iterMergedSortedLists(listList):
+	# The lists must be sorted, like sortList2 does it.
+	# Gives the specs of all lists in order,
+	# a file that is in more than one list is given once.
+	lastKey = None
+	for spec in heapq.merge(*listList, key=getSpecSortKey):
+		key = getSpecSortKey(spec)
+		if(key == lastKey): continue
+		lastKey = key
+		yield spec
+	return
+
+def iterSortedKeys(specIter, listIndex, listName):
+	# Gives (key, listIndex, spec) for each spec of a sorted list,
+	# without duplicates
+	specIter = iter(specIter)
+	spec, key = nextSortedSpec(specIter, None, listName)
+	while(spec != None):
+		yield (key, listIndex, spec)
+		spec, key = nextSortedSpec(specIter, key, listName)
+	return
+
+def iterListHistory(listDirList):
+	# The lists must be sorted, like sortList2 does it.
+	# All lists are read side by side, in one merge.
+	# Gives (spec, presence) for each file in any of the lists, in order,
+	# presence has True for each list the file is in.
+	# The spec is from the last list that has the file.
+	streamList = []
+	listIndex = 0
+	while(listIndex < len(listDirList)):
+		listDir = listDirList[listIndex]
+		streamList.append(iterSortedKeys(iterListFromDir(listDir), listIndex, listDir))
+		listIndex += 1
+
+	lastKey = None
+	lastSpec = None
+	presence = None
+	for key, listIndex, spec in heapq.merge(*streamList):
+		if(key != lastKey):
+			if(lastKey != None): yield lastSpec, presence
+			lastKey = key
+			presence = [False] * len(listDirList)
+		presence[listIndex] = True
+		lastSpec = spec
+
+	if(lastKey != None): yield lastSpec, presence
+	return
+
+class ListHistoryCounts:
+	def __init__(self):
+		self.fileCount = 0
+		# in each list
+		self.alwaysCount = 0
+		# not in the first list
+		self.appearedCount = 0
+		# not in the last list
+		self.disappearedCount = 0
+		# missing from a list between the first and last it is in
+		self.gapCount = 0
+
+def writeListHistoryToFile(fileObj, listDirList, historyIter):
+	# Writes a dict for each file, in the format of list1.csv,
+	# as the history is made.
+	# firstSeen and lastSeen count the lists from 1,
+	# presence has an X for each list the file is in, like X-XX.
+	# The first dict names the lists.
+	counts = ListHistoryCounts()
+
+	if(fileObj != None):
+		fileObj.write("DictBegin" + NEWLINE)
+		fileObj.write("Type/String" + "," + "type" + "," + "ListHistory" + NEWLINE)
+		listIndex = 0
+		while(listIndex < len(listDirList)):
+			fileObj.write("Type/String"
+				+ "," + "list" + str(listIndex + 1)
+				+ "," + listDirList[listIndex] + NEWLINE)
+			listIndex += 1
+		fileObj.write("DictEnd" + NEWLINE)
+
+	for spec, presence in historyIter:
+		firstSeen = presence.index(True)
+		lastSeen = len(presence) - 1 - presence[::-1].index(True)
+		gapCount = 0
+		listIndex = firstSeen + 1
+		while(listIndex <= lastSeen):
+			if(presence[listIndex] and not presence[listIndex - 1]): gapCount += 1
+			listIndex += 1
+
+		counts.fileCount += 1
+		if(firstSeen == 0 and lastSeen == len(presence) - 1 and gapCount == 0):
+			counts.alwaysCount += 1
+		if(firstSeen > 0): counts.appearedCount += 1
+		if(lastSeen < len(presence) - 1): counts.disappearedCount += 1
+		if(gapCount > 0): counts.gapCount += 1
+
+		if(fileObj == None): continue
+
+		presenceStr = ""
+		for isPresent in presence:
+			if(isPresent): presenceStr += "X"
+			if(not isPresent): presenceStr += "-"
+
+		fileObj.write("DictBegin" + NEWLINE)
+		fileObj.write("Type/String" + "," + "type" + "," + "FileHistory" + NEWLINE)
+		fileObj.write("Type/String" + "," + "theDir" + "," + spec.theDir + NEWLINE)
+		fileObj.write("Type/String"
+			+ "," + "fileNameMinusPath"
+			+ "," + spec.fileNameMinusPath + NEWLINE)
+		if(spec.fileSize != None):
+			fileObj.write("Type/Int64" + "," + "fileSize" + "," + str(spec.fileSize) + NEWLINE)
+		fileObj.write("Type/Int64" + "," + "firstSeen" + "," + str(firstSeen + 1) + NEWLINE)
+		fileObj.write("Type/Int64" + "," + "lastSeen" + "," + str(lastSeen + 1) + NEWLINE)
+		fileObj.write("Type/Int64" + "," + "gaps" + "," + str(gapCount) + NEWLINE)
+		fileObj.write("Type/String" + "," + "presence" + "," + presenceStr + NEWLINE)
+		fileObj.write("DictEnd" + NEWLINE)
+
+	return counts
+
+def insertList2IntoList1Sorted(myList1, myList2):
+	myComp = CompareResult()
+	
+	#print("Adding list to list...")
+	
+	i = 0
+	theLen = len(myList2)
+	lastProgress100 = 0
+	while(i < theLen):
+		progress100 = int(i * 100 / theLen)
+		if(lastProgress100 + 2 < progress100):
+			#printRaw(" " + str(progress100) + "%")
+			lastProgress100 = progress100
+
+		spec = myList2[i]
+		
+		insertMax = len(myList1)
+		insertMin = 0
 		
 		while(True):
 			inBetween = int((insertMax + insertMin) / 2)
@@ -786,163 +1432,490 @@ def insertList2IntoList1Sorted(myList1, myList2):
 	return
 
 
+#
+# Binary list file functions
+#
+# list1.bin holds the same list as list1.csv,
+# in a form that can be mapped into memory, and used without parsing.
+#
+# header, then
+# dir offsets, (dirCount + 1) * uint64, into the dir strings
+# dir strings, utf-8, padded to 8 bytes
+# records, recordCount * (dir id, 0, name offset, file size or -1)
+# names, utf-8, a name ends where the next one begins
+# hashes, recordCount * 32 bytes of sha256, all zero if not known,
+#   only there with BINARY_LIST_HAS_SHA256
+#
+
+BINARY_LIST_MAGIC = b"DLB1"
+BINARY_LIST_VERSION = 1
+BINARY_LIST_SORTED = 1
+BINARY_LIST_HAS_SHA256 = 2
+BINARY_LIST_HEADER = struct.Struct("<4sIIIQQQ")
+BINARY_LIST_OFFSET = struct.Struct("<Q")
+BINARY_LIST_RECORD = struct.Struct("<IIqq")
+
+class BinaryListWriter:
+	# Records and names go to temp files while they are added,
+	# so only the dir strings are kept in memory
+	def __init__(self, path):
+		self.path = path
+		self.dirIds = {}
+		self.dirList = []
+		self.recordCount = 0
+		self.nameOffset = 0
+		self.lastKey = None
+		self.isSorted = True
+		self.hasSha256 = False
+		self.recordFile = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+		self.nameFile = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+		self.shaFile = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+
+	def add(self, spec):
+		dirId = self.dirIds.get(spec.theDir)
+		if(dirId == None):
+			dirId = len(self.dirList)
+			self.dirIds[spec.theDir] = dirId
+			self.dirList.append(spec.theDir)
+
+		key = getSpecSortKey(spec)
+		if(self.lastKey != None and key <= self.lastKey):
+			self.isSorted = False
+		self.lastKey = key
+
+		fileSize = spec.fileSize
+		if(fileSize == None): fileSize = -1
+
+		nameBytes = spec.fileNameMinusPath.encode("utf-8")
+		self.recordFile.write(BINARY_LIST_RECORD.pack(
+			dirId, 0, self.nameOffset, fileSize))
+		self.nameFile.write(nameBytes)
+		self.nameOffset += len(nameBytes)
+		self.recordCount += 1
+
+		if(spec.sha256 != None): self.hasSha256 = True
+		self.shaFile.write(getShaBytes(spec.sha256))
+
+	def finish(self):
+		dirBlob = bytearray()
+		dirOffsets = bytearray()
+		for theDir in self.dirList:
+			dirOffsets += BINARY_LIST_OFFSET.pack(len(dirBlob))
+			dirBlob += theDir.encode("utf-8")
+		dirOffsets += BINARY_LIST_OFFSET.pack(len(dirBlob))
+		while(len(dirBlob) % 8 != 0): dirBlob += b"\0"
+
+		flags = 0
+		if(self.isSorted): flags |= BINARY_LIST_SORTED
+		if(self.hasSha256): flags |= BINARY_LIST_HAS_SHA256
+
+		tempFileList = [self.recordFile, self.nameFile]
+		if(self.hasSha256): tempFileList.append(self.shaFile)
+
+		tempPath = self.path + ".tmp"
+		fileObj = open(tempPath, "wb")
+		fileObj.write(BINARY_LIST_HEADER.pack(
+			BINARY_LIST_MAGIC, BINARY_LIST_VERSION, flags,
+			len(self.dirList), self.recordCount,
+			len(dirBlob), self.nameOffset))
+		fileObj.write(dirOffsets)
+		fileObj.write(dirBlob)
+		for tempFile in tempFileList:
+			tempFile.seek(0, 0)
+			shutil.copyfileobj(tempFile, fileObj)
+		fileObj.close()
+		self.recordFile.close()
+		self.nameFile.close()
+		self.shaFile.close()
+		os.replace(tempPath, self.path)
+
+def writeListToBinaryFile(path, myList):
+	writer = BinaryListWriter(path)
+	for spec in myList:
+		writer.add(spec)
+	writer.finish()
+	return writer.recordCount
+
+class BinaryListView:
+	# A list1.bin mapped into memory.
+	# Works like a list of RepoFileSpec,
+	# each spec is made when it is used.
+	def __init__(self, path):
+		self.path = path
+		fileObj = open(path, "rb")
+		self.mm = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+		fileObj.close()
+
+		if(len(self.mm) < BINARY_LIST_HEADER.size):
+			raise Exception("binary list not valid: " + path)
+		(magic, version, flags, dirCount, recordCount,
+			dirBlobSize, nameBlobSize) = BINARY_LIST_HEADER.unpack_from(self.mm, 0)
+		if(magic != BINARY_LIST_MAGIC or version != BINARY_LIST_VERSION):
+			raise Exception("binary list not valid: " + path)
+
+		self.isSorted = (flags & BINARY_LIST_SORTED) != 0
+		self.recordCount = recordCount
+		self.nameBlobSize = nameBlobSize
+
+		pos = BINARY_LIST_HEADER.size
+		dirBlobStart = pos + (dirCount + 1) * BINARY_LIST_OFFSET.size
+		self.dirList = []
+		i = 0
+		while(i < dirCount):
+			(start, end) = struct.unpack_from("<QQ", self.mm, pos + i * 8)
+			self.dirList.append(
+				self.mm[(dirBlobStart + start):(dirBlobStart + end)].decode("utf-8"))
+			i += 1
+
+		self.recordStart = dirBlobStart + dirBlobSize
+		self.nameStart = self.recordStart + recordCount * BINARY_LIST_RECORD.size
+		self.shaStart = None
+		fileSize = self.nameStart + nameBlobSize
+		if((flags & BINARY_LIST_HAS_SHA256) != 0):
+			self.shaStart = fileSize
+			fileSize += recordCount * 32
+		if(fileSize != len(self.mm)):
+			raise Exception("binary list not valid: " + path)
+
+	def __len__(self):
+		return self.recordCount
+
+	def getNameEnd(self, i):
+		if(i + 1 >= self.recordCount): return self.nameBlobSize
+		return BINARY_LIST_RECORD.unpack_from(
+			self.mm, self.recordStart + (i + 1) * BINARY_LIST_RECORD.size)[2]
+
+	def __getitem__(self, i):
+		if(i < 0): i += self.recordCount
+		if(i < 0 or i >= self.recordCount):
+			raise IndexError("binary list index out of range")
+
+		(dirId, reserved, nameOffset, fileSize) = BINARY_LIST_RECORD.unpack_from(
+			self.mm, self.recordStart + i * BINARY_LIST_RECORD.size)
+		nameEnd = self.getNameEnd(i)
+
+		spec = RepoFileSpec()
+		spec.theDir = self.dirList[dirId]
+		spec.fileNameMinusPath = self.mm[
+			(self.nameStart + nameOffset):(self.nameStart + nameEnd)].decode("utf-8")
+		if(fileSize >= 0): spec.fileSize = fileSize
+		if(self.shaStart != None):
+			spec.sha256 = getShaFromBytes(self.mm, self.shaStart + i * 32)
+		return spec
+
+	def __iter__(self):
+		dirList = self.dirList
+		nameBlob = memoryview(self.mm)[self.nameStart:]
+		records = memoryview(self.mm)[self.recordStart:self.nameStart]
+
+		# The views must be released, before the file can be closed,
+		# also when the specs are not read to the end
+		recordIter = BINARY_LIST_RECORD.iter_unpack(records)
+		try:
+			lastRecord = None
+			i = 0
+			for record in recordIter:
+				if(lastRecord != None):
+					spec = makeSpecFromBinaryRecord(
+						dirList, nameBlob, lastRecord, record[2])
+					if(self.shaStart != None):
+						spec.sha256 = getShaFromBytes(self.mm, self.shaStart + i * 32)
+					i += 1
+					yield spec
+				lastRecord = record
+			if(lastRecord != None):
+				spec = makeSpecFromBinaryRecord(
+					dirList, nameBlob, lastRecord, self.nameBlobSize)
+				if(self.shaStart != None):
+					spec.sha256 = getShaFromBytes(self.mm, self.shaStart + i * 32)
+				yield spec
+		finally:
+			recordIter = None
+			nameBlob.release()
+			records.release()
+
+	def close(self):
+		self.mm.close()
+
+def makeSpecFromBinaryRecord(dirList, nameBlob, record, nameEnd):
+	spec = RepoFileSpec()
+	spec.theDir = dirList[record[0]]
+	spec.fileNameMinusPath = str(nameBlob[record[2]:nameEnd], "utf-8")
+	if(record[3] >= 0): spec.fileSize = record[3]
+	return spec
+
+def writeListToDir(outputDir, myList):
+	# Writes list1.csv, and list1.bin next to it
+	makeDirs(outputDir)
+
+	timer = startStage("write")
+	writer = BinaryListWriter(pathCombine2(outputDir, "list1.bin"))
+	fileObj = open(pathCombine2(outputDir, "list1.csv"), "w")
+	specCount = writeListToFile(fileObj, iterAddToBinaryList(writer, myList))
+	fileObj.close()
+	writer.finish()
+	endStage(timer, specCount,
+		os.path.getsize(pathCombine2(outputDir, "list1.csv"))
+		+ os.path.getsize(pathCombine2(outputDir, "list1.bin")))
+	return specCount
+
+def iterAddToBinaryList(writer, myList):
+	for spec in myList:
+		writer.add(spec)
+		yield spec
+
+def openListFromDir(listDir):
+	# Uses list1.bin, if it is not older than list1.csv,
+	# otherwise list1.csv is parsed
+	csvPath = pathCombine2(listDir, "list1.csv")
+	binPath = pathCombine2(listDir, "list1.bin")
+
+	if(fileExists(binPath)):
+		if(not fileExists(csvPath)
+			or os.path.getmtime(binPath) >= os.path.getmtime(csvPath)):
+
+			print("Opening binary list: " + binPath)
+			return BinaryListView(binPath)
+
+	print("Reading list from file...")
+
+	timer = startStage("parse")
+	fileObj = open(csvPath, "r")
+	myList = ListStore()
+	myList.extend(iterListFromFile(fileObj))
+	fileObj.close()
+	endStage(timer, len(myList), os.path.getsize(csvPath))
+	return myList
+
+def iterListFromDir(listDir):
+	# Like openListFromDir, but the specs are given one at a time
+	csvPath = pathCombine2(listDir, "list1.csv")
+	binPath = pathCombine2(listDir, "list1.bin")
+
+	if(fileExists(binPath)):
+		if(not fileExists(csvPath)
+			or os.path.getmtime(binPath) >= os.path.getmtime(csvPath)):
+
+			myList = BinaryListView(binPath)
+			for spec in iterStage("parse", myList):
+				yield spec
+			myList.close()
+			return
+
+	fileObj = open(csvPath, "r")
+	for spec in iterStage("parse", iterListFromFile(fileObj)):
+		yield spec
+	fileObj.close()
+	return
+
+def sortListIfNeeded(myList):
+	# A binary list, that was written sorted, is used as it is
+	if(isinstance(myList, BinaryListView) and myList.isSorted):
+		return myList
+	if(isinstance(myList, ListStore) and myList.isSorted):
+		return myList
+	return sortList2(myList)
+
+
 #
 # RepoFileSpec list functions,
 # that are dependant on Debian's package naming conventions
 #
 
-def compareListsSorted2(myList1, myList2):
-	myList3 = []
-	myComp = CompareResult()
-	myComp2 = CompareResult()
-	
-	print("Comparing lists...")
-	
+DEBIAN_TAIL_KINDS = [
+	".debian.tar.gz", ".debian.tar.xz", ".debian.tar.bz2",
+	".orig.tar.gz", ".orig.tar.xz", ".orig.tar.bz2",
+	".tar.gz", ".tar.xz", ".tar.bz2",
+	".dsc", ".diff.gz"]
+
+def getDebianNameParts(fileName):
+	# Splits a file name, like debian names them,
+	# into package name, version and tail kind.
+	# Gives None, if the name has no version.
+	parts = fileName.split('_')
+	if(len(parts) < 2): return None
+
+	if(len(parts) >= 3):
+		# Example: bash_5.1-2_amd64.deb
+		return (parts[0], parts[1], str(len(parts)) + "_" + parts[2])
+
+	# Example: bash_5.1-2.dsc
+	tail = parts[1]
+
+	i = tail.find(".orig-")
+	if(i >= 0):
+		# upstream component, Example: foo_1.0.orig-docs.tar.xz
+		return (parts[0], tail[0:i], tail[i:])
+
+	for kind in DEBIAN_TAIL_KINDS:
+		if(tail.endswith(kind)):
+			return (parts[0], tail[0:(len(tail) - len(kind))], kind)
+
+	return (parts[0], tail, "")
+
+def makeDebianNameIndex(myList):
+	# Groups the file names of a list by theDir,
+	# package name and tail kind
+	myIndex = {}
+	for spec in myList:
+		parts = getDebianNameParts(spec.fileNameMinusPath)
+		if(parts == None): continue
+
+		key = (spec.theDir, parts[0], parts[2])
+		nameSet = myIndex.get(key)
+		if(nameSet == None):
+			nameSet = set()
+			myIndex[key] = nameSet
+		nameSet.add(spec.fileNameMinusPath)
+
+	return myIndex
+
+def getDebianVersionPartKey(partStr):
+	# Orders like dpkg does it, for an upstream version or a revision.
+	# Non digit runs are compared char by char, where ~ is before
+	# the end of the run, the end is before letters,
+	# and letters are before other chars.
+	# Digit runs are compared as numbers, a missing one is 0.
+	# Each char is a number in the key, the end of a run is 0,
+	# and the end of the string is 0 too, where the next run would begin.
+	key = []
 	i = 0
-	theLen = len(myList2)
-	lastProgress100 = 0
-	while(i < theLen):
-		myList4 = []
-		
-		progress100 = int(i * 100 / theLen)
-		if(lastProgress100 + 2 < progress100):
-			printRaw(" " + str(progress100) + "%")
-			lastProgress100 = progress100
+	partLen = len(partStr)
+	while(i < partLen):
+		while(i < partLen and not partStr[i].isdigit()):
+			c = partStr[i]
+			if(c == '~'): key.append(-1)
+			if(c != '~' and c.isalpha()): key.append(ord(c))
+			if(c != '~' and not c.isalpha()): key.append(ord(c) + 256)
+			i += 1
+		key.append(0)
+
+		start = i
+		while(i < partLen and partStr[i].isdigit()): i += 1
+		number = 0
+		if(i > start): number = int(partStr[start:i])
+		key.append(number)
+
+	key.append(0)
+	return tuple(key)
+
+def getDebianVersionKey(versionStr):
+	# Gives a key, so keys order like dpkg orders the versions.
+	# A version is [epoch:]upstream[-revision],
+	# in a file name the colon can be %3a.
+	versionStr = versionStr.replace("%3a", ":").replace("%3A", ":")
+
+	epoch = 0
+	i = versionStr.find(":")
+	if(i >= 0):
+		if(not isStringSimpleNumber(versionStr[0:i])):
+			raise Exception("version epoch not valid: " + versionStr)
+		epoch = getNumberFromString(versionStr[0:i])
+		versionStr = versionStr[(i + 1):]
+
+	# no revision is like revision 0
+	revision = "0"
+	i = versionStr.rfind("-")
+	if(i >= 0):
+		revision = versionStr[(i + 1):]
+		versionStr = versionStr[0:i]
+
+	return (epoch,
+		getDebianVersionPartKey(versionStr),
+		getDebianVersionPartKey(revision))
+
+def iterNewestVersions(specIter):
+	# The specs must be sorted, like sortList2 does it.
+	# Of the files with the same theDir, package name and tail kind,
+	# only the one with the newest version is given.
+	# A package's files are next to each other in a sorted list,
+	# so the list is walked once, one package at a time.
+	# Each version is parsed once.
+	versionKeys = {}
+	runKey = None
+	bestDict = {}
+	for spec in specIter:
+		parts = getDebianNameParts(spec.fileNameMinusPath)
+		key = None
+		if(parts != None): key = (spec.theDir, parts[0])
+		if(key != runKey or key == None):
+			for item in iterBestVersions(bestDict): yield item
+			runKey = key
+			bestDict = {}
+			# the cache is only needed for one package
+			versionKeys = {}
+
+		if(parts == None):
+			yield spec
+			continue
 
-		spec = myList2[i]
-		
-		insertMax = len(myList1)
-		insertMin = 0
-		
-		while(True):
-			inBetween = int((insertMax + insertMin) / 2)
-			
-			if(insertMin == insertMax): break
-			if(inBetween >= len(myList1)): break
-			
-			compareStrings(myComp,
-				spec.theDir,
-				myList1[inBetween].theDir)
-			
-			if(not myComp.less and not myComp.greater):
-				compareLikeDebianPackageNames(myComp,
-					spec.fileNameMinusPath,
-					myList1[inBetween].fileNameMinusPath)
-				
-				if(not myComp.less and not myComp.greater):
-					compareStrings(myComp,
-						spec.fileNameMinusPath,
-						myList1[inBetween].fileNameMinusPath)
-					
-					if(myComp.less or myComp.greater):
-						if(not isSpecInList1(myComp2, myList1, spec)):
-							myList4.append(spec)
-				
-			if(myComp.greater):
-				insertMin = inBetween + 1
-				continue
-			
-			if(myComp.less):
-				insertMax = inBetween
+		versionKey = versionKeys.get(parts[1])
+		if(versionKey == None):
+			try:
+				versionKey = getDebianVersionKey(parts[1])
+			except Exception:
+				# not a version, the file is kept
+				bestDict[(None, spec.fileNameMinusPath)] = (None, spec)
 				continue
-			
-			# duplicate
-			# DONT DO ANYTHING
-			break
-		
-		insertList2IntoList1Sorted(myList3, myList4)
-		
-		i += 1
-		#print("doing again")
-		continue
-	
-	printRaw(NEWLINE)
-	return myList3
+			versionKeys[parts[1]] = versionKey
 
-def compareLikeDebianPackageNames(compRes, str1, str2):
-	compRes.less = False
-	compRes.greater = False
-	
-	underscore1Count = getSepListLength(str1, '_')
-	underscore2Count = getSepListLength(str2, '_')
-	if(underscore1Count == underscore2Count):
-		if(underscore1Count >= 1):
-			isOk = False
-			str1Name = getSepListItem(str1, 0, '_')
-			str2Name = getSepListItem(str2, 0, '_')
-			if(str1Name == str2Name): isOk = True
-			if(isOk):
-				if(underscore1Count >= 2):
-					str1Tail = getSepListItem(str1, 2, '_')
-					str2Tail = getSepListItem(str2, 2, '_')
-					if(str1Tail == str2Tail):
-						return
-				
-				if(underscore1Count == 1):
-					str1Tail = getSepListItem(str1, 1, '_')
-					str2Tail = getSepListItem(str2, 1, '_')
-					if(namesHaveLikeDebianTail2(str1Tail, str2Tail)):
-						return
-					
-	compareStrings(compRes, str1, str2)
+		best = bestDict.get(parts[2])
+		if(best == None or versionKey > best[0]):
+			bestDict[parts[2]] = (versionKey, spec)
+
+	for item in iterBestVersions(bestDict): yield item
 	return
 
-def namesHaveLikeDebianTail2(strTail1, strTail2):
-	if(strTail1.endswith(".tar.gz")):
-		if(strTail1.endswith(".tar.gz")
-			!= strTail2.endswith(".tar.gz")):
-			
-			return False
-		if(strTail1.endswith(".debian.tar.gz")):
-			if(strTail1.endswith(".debian.tar.gz")
-				!= strTail2.endswith(".debian.tar.gz")):
-				
-				return False
-		if(strTail1.endswith(".orig.tar.gz")):
-			if(strTail1.endswith(".orig.tar.gz")
-				!= strTail2.endswith(".orig.tar.gz")):
-				
-				return False
-	if(strTail1.endswith(".tar.xz")):
-		if(strTail1.endswith(".tar.xz")
-			!= strTail2.endswith(".tar.xz")):
-			
-			return False
-		if(strTail1.endswith(".debian.tar.xz")):
-			if(strTail1.endswith(".debian.tar.xz")
-				!= strTail2.endswith(".debian.tar.xz")):
-				
-				return False
-		if(strTail1.endswith(".orig.tar.xz")):
-			if(strTail1.endswith(".orig.tar.xz")
-				!= strTail2.endswith(".orig.tar.xz")):
-				
-				return False
-	if(strTail1.endswith(".tar.bz2")):
-		if(strTail1.endswith(".tar.bz2")
-			!= strTail2.endswith(".tar.bz2")):
-			
-			return False
-		if(strTail1.endswith(".debian.tar.bz2")):
-			if(strTail1.endswith(".debian.tar.bz2")
-				!= strTail2.endswith(".debian.tar.bz2")):
-				
-				return False
-		if(strTail1.endswith(".orig.tar.bz2")):
-			if(strTail1.endswith(".orig.tar.bz2")
-				!= strTail2.endswith(".orig.tar.bz2")):
-				
-				return False
-	if(strTail1.endswith(".dsc")):
-		if(strTail1.endswith(".dsc")
-			!= strTail2.endswith(".dsc")):
-			
-			return False
-	
-	return True
+def iterBestVersions(bestDict):
+	# in sorted order, like the list
+	specList = []
+	for versionKey, spec in bestDict.values(): specList.append(spec)
+	specList.sort(key=getSpecSortKey)
+	for spec in specList: yield spec
+	return
+
+def compareListsSorted2(myList1, myList2):
+	# Gives the specs of list 2,
+	# which are another version of a file in list 1.
+	# List 1 is indexed once, so each spec is one lookup.
+	# List 2 must be sorted, like sortList2 does it,
+	# then the result is sorted too.
+
+	print("Comparing lists...")
+	timer = startStage("compare")
+
+	myIndex = makeDebianNameIndex(myList1)
+	myList3 = compareListsIndexed(myIndex, myList2)
+
+	endStage(timer, len(myList2), 0)
+	return myList3
+
+def compareListsIndexed(myIndex, myList2):
+	# Like compareListsSorted2, with the index of list 1
+	# from makeDebianNameIndex, so it can be used again
+	myList3 = []
+	compareCount = 0
+	for spec in myList2:
+		compareCount += 1
+		parts = getDebianNameParts(spec.fileNameMinusPath)
+		if(parts == None): continue
+
+		nameSet = myIndex.get((spec.theDir, parts[0], parts[2]))
+		if(nameSet == None): continue
+
+		if(spec.fileNameMinusPath in nameSet):
+			# same file in both lists
+			continue
+
+		myList3.append(spec)
+
+	# one index lookup for each spec
+	addStatsCounter("comparisons", compareCount)
+	return myList3
 
 def removeNonRepoFiles(myList):
 	print("Removing non repository files in list...")
+	timer = startStage("filter")
 	i = 0
 	while(i < len(myList)):
 		path1 = myList[i].theDir
@@ -971,9 +1944,18 @@ def removeNonRepoFiles(myList):
 				i += 1
 				continue
 		
+		path2 = rebaseIfPathFound(path1, "pool/non-free-firmware")
+		if(path2 != None):
+			path2 = rebaseIfPathFound(path2, "non-free-firmware")
+			if(path2 != None):
+				myList[i].theDir = path2
+				i += 1
+				continue
+		
 		myList.pop(i)
 		continue
 
+	endStage(timer, len(myList), 0)
 	return
 
 
@@ -991,6 +1973,9 @@ class PackageInfo:
 		self.files = []
 		self.fileSizes = []
 		self.theDir = None
+		self.sha256 = None
+		# file name -> sha256, for a source package
+		self.fileSha256s = {}
 
 class ArchInfo:
 	def __init__(self):
@@ -998,36 +1983,73 @@ class ArchInfo:
 		self.longName = None
 		self.listName = None
 		
-def getListFromMirror(outputDir, mirror, distName, archInfo):
+def getListFromMirror(outputDir, mirror, distList, componentList, archList,
+	cacheDir, cacheMaxSize, jobCount):
+
+	# Gives the list of the mirror, for each dist, component and arch.
+	# The indexes are fetched and made into lists at the same time,
+	# and the lists are merged into one.
 	if(dirExists(outputDir)):
 		raise Exception("output dir already exists: " + outputDir)
 
-	relDir = os.getcwd()
-	
-	print("Downloading arch based list...")
-	
+	print("Downloading index files...")
+
 	makeDirs(outputDir)
-	os.chdir(outputDir)
-	
-	webPath = ("https://"
-		+ mirror
-		+ "/" + "debian"
-		+ "/" + "dists" + "/" + distName
-		+ "/" + "main"
-		+ "/" + archInfo.longName
-		+ "/" + archInfo.listName + ".gz")
-	# Example: https://mirrors.xmission.com/debian/dists/testing/main/Packages.gz
-	print("Web path: " + webPath)
-	
-	r = os.system(
-		"wget"
-		+ " --quiet --show-progress --progress=bar"
-		+ " " + webPath)
-	if(r != 0):
-		raise Exception("getting list from mirror failed with error number: " + str(r))
-	
-	os.chdir(relDir)
-	return
+
+	mirrorInfo = getMirrorInfo(mirror)
+	pool = HttpConnectionPool()
+	snapshotCache = ListSnapshotCache(cacheDir, cacheMaxSize)
+	executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobCount)
+
+	listList = []
+	try:
+		# each Release is fetched once, for all indexes of its dist
+		releaseFutures = []
+		for distName in distList:
+			releaseFutures.append(executor.submit(fetchReleaseInfo,
+				pool, mirrorInfo, distName,
+				getDistCacheDir(cacheDir, mirrorInfo, distName)))
+
+		futureList = []
+		i = 0
+		while(i < len(distList)):
+			releaseInfo = releaseFutures[i].result()
+			for component in componentList:
+				for archInfo in archList:
+					futureList.append(executor.submit(getListFromMirrorIndex,
+						outputDir, pool, mirrorInfo, cacheDir, snapshotCache,
+						distList[i], component, archInfo, releaseInfo))
+			i += 1
+
+		for future in futureList:
+			listList.append(future.result())
+	except Exception as e:
+		raise Exception("getting list from mirror failed: " + str(e))
+	finally:
+		executor.shutdown(wait=True, cancel_futures=True)
+		pool.closeAll()
+
+	if(len(listList) == 1): return listList[0]
+
+	print("Merging lists...")
+	return list(iterMergedSortedLists(listList))
+
+def getListFromMirrorIndex(outputDir, pool, mirrorInfo, cacheDir, snapshotCache,
+	distName, component, archInfo, releaseInfo):
+
+	# Gives the sorted list of one index,
+	# which is put in outputDir like it is in the mirror
+	update = fetchMirrorIndex(cacheDir, pool,
+		mirrorInfo, distName, component, archInfo, releaseInfo)
+
+	indexDir = pathCombine2(outputDir, "dists")
+	indexDir = pathCombine2(indexDir, distName)
+	indexDir = pathCombine2(indexDir, component)
+	indexDir = pathCombine2(indexDir, archInfo.longName)
+	makeDirs(indexDir)
+	copyCachedFile(update.plainPath, pathCombine2(indexDir, archInfo.listName))
+
+	return makeListFromIndexUpdate(update, snapshotCache)
 
 def addPropertyLine(pkg, labelStr, lineStr, lineNum):
 	if(labelStr == "Filename"):
@@ -1045,16 +2067,15 @@ def addPropertyLine(pkg, labelStr, lineStr, lineNum):
 		return
 
 	if(labelStr == "Files"):
-		spaceCount = getSepListLength(lineStr, ' ')
-		if(spaceCount != 2):
+		lineParts = lineStr.split(' ')
+		if(len(lineParts) != 3):
 			print("Line Number: " + str(lineNum))
 			raise Exception("property malformed: " + "Files")
-		fsStr = getSepListItem(lineStr, 1, ' ')
-		num = getNumberFromString(fsStr)
+		num = getNumberFromString(lineParts[1])
 		if(num == None):
 			print("Line Number: " + str(lineNum))
 			raise Exception("file sizes not valid numbers: " + "Files")
-		pkg.files.append(getSepListItem(lineStr, 2, ' '))
+		pkg.files.append(lineParts[2])
 		pkg.fileSizes.append(num)
 		return
 
@@ -1068,255 +2089,3357 @@ def addPropertyLine(pkg, labelStr, lineStr, lineNum):
 			raise Exception("file size not valid number: " + "Size")
 		pkg.fileSize = num
 		return
-	
-def parseMirrorList(outputDir, archInfo):
-	if(not dirExists(outputDir)):
-		raise Exception("working dir does not exist: " + outputDir)
 
-	relDir = os.getcwd()
+	if(labelStr == "SHA256"):
+		if(pkg.sha256 != None):
+			print("Line Number: " + str(lineNum))
+			raise Exception("property set twice: " + "SHA256")
+		if(not isStringSha256(lineStr)):
+			print("Line Number: " + str(lineNum))
+			raise Exception("sha256 not valid: " + "SHA256")
+		pkg.sha256 = lineStr
+		return
 
-	print("Unzipping arch list...")
-	
-	os.chdir(outputDir)
-	
-	r = os.system("gunzip"
-		+ " --keep"
-		+ " " + archInfo.listName + ".gz")
-	if(r != 0):
-		raise Exception("unzip error: " + archInfo.listName + ".gz")
-	
-	pkgList = []
-	
-	print("Loading arch list...")
+	if(labelStr == "Checksums-Sha256"):
+		lineParts = lineStr.split(' ')
+		if(len(lineParts) != 3 or not isStringSha256(lineParts[0])):
+			print("Line Number: " + str(lineNum))
+			raise Exception("property malformed: " + "Checksums-Sha256")
+		pkg.fileSha256s[lineParts[2]] = lineParts[0]
+		return
 	
-	f1 = open(archInfo.listName, "r")
-	s1 = NEWLINE
-	havePackage = False
-	pkgName = None
-	lineNum = 0
+def iterPackagesFromIndex(fileObj):
+	# Packages are separated by empty lines.
+	# A line beginning with a space continues the property before it.
 	pkg = None
 	labelStr = None
-	lastPkgCount = 0
-	while(s1 != None):
-		if(lastPkgCount + 1000 < len(pkgList)):
-			printRaw(" .")
-			lastPkgCount = len(pkgList)
+	lineNum = 0
+	for s1 in fileObj:
+		lineNum += 1
+		line = s1.rstrip()
+
+		if(line == ""):
+			if(pkg != None):
+				yield pkg
+			pkg = None
+			labelStr = None
 			continue
-		
-		if(havePackage):
-			if(s1 == NEWLINE):
-				havePackage = False
-				#print("Done with package, lineNo=" + str(lineNum))
-				pkgList.append(pkg)
-				pkg = None
-				s1 = f1.readline()
-				lineNum += 1
-				continue
-			
-			i = 0
-			while(True):
-				if(i >= len(s1)):
-					# ignore string
-					s1 = f1.readline()
-					lineNum += 1
-					break
-
-				c = s1[i]
-				#print("Eating char: " + c)
-				
-				if(labelStr == None):
-					if(i > 0 and c == ':'):
-						labelStr = s1[0:i]
-						#print("Label=" + labelStr)
-						
-						i += 1
-						continue
-					
-					if(c >= 'A' and c <= 'Z'):
-						i += 1
-						continue
-
-					if(c >= 'a' and c <= 'z'):
-						i += 1
-						continue
-
-					if(c >= '0' and c <= '9'):
-						i += 1
-						continue
-
-					if(c == '-'):
-						i += 1
-						continue
-
-				if(labelStr != None):
-					if(c == ' '):
-						# value continuation
-						
-						addPropertyLine(pkg, labelStr, s1[(i + 1):].strip(), lineNum)
-						
-						s1 = f1.readline()
-						lineNum += 1
-						break
-					
-					if(ord(c) == 13):
-						# ignore line
-						s1 = f1.readline()
-						lineNum += 1
-						break
-
-					if(ord(c) == 10):
-						# ignore line
-						s1 = f1.readline()
-						lineNum += 1
-						break
-					
-					if(c == '\n'):
-						# ignore line
-						s1 = f1.readline()
-						lineNum += 1
-						break
-
-					if(i == 0):
-						labelStr = None
-						break
-				
-				print("i: " + str(i))
-				print("Label: " + labelStr)
+
+		if(line[0] == ' ' or line[0] == '\t'):
+			if(pkg == None or labelStr == None):
 				print("Line Number: " + str(lineNum))
-				raise Exception("unexpected char: " + c)
-			
-			pass
-			continue
+				raise Exception("invalid line: " + s1)
 
-		# havePackage is false
-		
-		if(s1 == NEWLINE):
-			s1 = f1.readline()
-			lineNum += 1
+			addPropertyLine(pkg, labelStr, line.strip(), lineNum)
 			continue
-		
-		if(s1.startswith("Package: ")):
-			pkgName = s1[len("Package: "):].strip()
-			#print("Package: " + pkgName)
-			havePackage = True
+
+		i = line.find(':')
+		if(i <= 0 or not line[0:i].replace('-', '').isalnum()):
+			print("Line Number: " + str(lineNum))
+			raise Exception("invalid line: " + s1)
+
+		labelStr = line[0:i]
+		valueStr = line[(i + 1):].strip()
+
+		if(pkg == None):
+			if(labelStr != "Package"):
+				print("Line Number: " + str(lineNum))
+				raise Exception("invalid line: " + s1)
+
 			pkg = PackageInfo()
-			pkg.pkgName = pkgName
-			s1 = f1.readline()
-			lineNum += 1
+			pkg.pkgName = valueStr
 			continue
-		
-		if(s1 == "" or s1 == None): break
-		
-		print("Line Number: " + str(lineNum))
-		raise Exception("invalid line: " + s1)
-	
-	printRaw(NEWLINE)
-	os.chdir(relDir)
-	return pkgList
+
+		if(valueStr != ""):
+			addPropertyLine(pkg, labelStr, valueStr, lineNum)
+
+	if(pkg != None):
+		yield pkg
+	return
 
 
 #
 # Cross logic functions 1
 #
 
-def makeRegularListFromPackageList(pkgList):
-	print("Working on list...")
-
+def makeRegularListFromPackageList(pkgList):
+	# pkgList can be a list, or packages given one at a time,
+	# like iterPackagesFromIndex does
+	print("Working on list...")
+
+	timer = startStage("convert")
+	counter = [0]
+	myList = list(iterRegularListFromPackageList(pkgList, counter))
+	endStage(timer, len(myList), 0)
+
+	print("Package count: " + str(counter[0]))
+	return myList
+
+def iterRegularListFromPackageList(pkgList, counter):
+	# counter[0] is increased for each package
+	for pkg in pkgList:
+		counter[0] += 1
+
+		if(pkg.fileName != None):
+			spec = RepoFileSpec()
+			spec.fileName = pkg.fileName
+			spec.calc()
+			spec.fileSize = pkg.fileSize
+			spec.sha256 = pkg.sha256
+
+			yield spec
+			continue
+
+		if(pkg.theDir != None):
+			j = 0
+
+			if(len(pkg.files) != len(pkg.fileSizes)):
+				raise Exception("pkg not valid: file sizes not valid")
+
+			while(j < len(pkg.files)):
+				spec = RepoFileSpec()
+				spec.theDir = pkg.theDir
+				spec.fileNameMinusPath = pkg.files[j]
+				spec.fileSize = pkg.fileSizes[j]
+				spec.sha256 = pkg.fileSha256s.get(pkg.files[j])
+
+				yield spec
+
+				j += 1
+				continue
+
+			continue
+
+		raise Exception("pkg not valid")
+
+	return
+
+
+#
+# HTTP functions
+#
+
+class MirrorInfo:
+	def __init__(self):
+		self.name = None
+		self.scheme = None
+		self.host = None
+		self.port = None
+		self.basePath = None
+
+def getMirrorInfo(mirror):
+	# mirror is a host name, like mirrors.xmission.com,
+	# or the url of the debian dir, like http://localhost:8000/debian
+	# or a local dir acting as the mirror, like /srv/mirror/debian
+	mirrorUrl = mirror
+	if(mirrorUrl.startswith("/")):
+		mirrorUrl = "file://" + mirror
+	if(mirrorUrl.find("://") < 0):
+		mirrorUrl = "https://" + mirror + "/" + "debian"
+
+	parts = urllib.parse.urlsplit(mirrorUrl)
+	if(parts.scheme != "http" and parts.scheme != "https"
+		and parts.scheme != "file"):
+
+		raise Exception("mirror url not supported: " + mirror)
+	if(parts.hostname == None and parts.scheme != "file"):
+		raise Exception("mirror url not valid: " + mirror)
+
+	info = MirrorInfo()
+	info.name = mirror
+	info.scheme = parts.scheme
+	info.host = parts.hostname
+	info.port = parts.port
+	info.basePath = parts.path.rstrip("/")
+	return info
+
+def getMirrorUrl(mirrorInfo, path):
+	hostStr = ""
+	if(mirrorInfo.host != None): hostStr = mirrorInfo.host
+	if(mirrorInfo.port != None):
+		hostStr += ":" + str(mirrorInfo.port)
+	return (mirrorInfo.scheme + "://" + hostStr
+		+ mirrorInfo.basePath + "/" + urllib.parse.quote(path))
+
+class HttpConnectionPool:
+	# Keeps open connections per host, so they can be used again
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.idleConns = {}
+		self.timeout = 60
+
+	def get(self, hostKey):
+		self.lock.acquire()
+		connList = self.idleConns.get(hostKey)
+		conn = None
+		if(connList):
+			conn = connList.pop()
+		self.lock.release()
+
+		if(conn != None):
+			return conn, True
+
+		if(hostKey[0] == "https"):
+			conn = http.client.HTTPSConnection(
+				hostKey[1], hostKey[2], timeout=self.timeout)
+		if(hostKey[0] == "http"):
+			conn = http.client.HTTPConnection(
+				hostKey[1], hostKey[2], timeout=self.timeout)
+		return conn, False
+
+	def put(self, hostKey, conn):
+		self.lock.acquire()
+		connList = self.idleConns.get(hostKey)
+		if(connList == None):
+			connList = []
+			self.idleConns[hostKey] = connList
+		connList.append(conn)
+		self.lock.release()
+
+	def closeAll(self):
+		self.lock.acquire()
+		for connList in self.idleConns.values():
+			for conn in connList: conn.close()
+		self.idleConns = {}
+		self.lock.release()
+
+class HttpResponse:
+	def __init__(self):
+		self.pool = None
+		self.hostKey = None
+		self.conn = None
+		self.resp = None
+		self.status = None
+		self.url = None
+
+	def getHeader(self, name):
+		return self.resp.getheader(name)
+
+	def read(self, size):
+		return self.resp.read(size)
+
+	def close(self):
+		# A connection can only be used again,
+		# once its response was read to the end
+		if(self.conn == None): return
+		if(self.resp.isclosed() and not self.resp.will_close):
+			self.pool.put(self.hostKey, self.conn)
+		else:
+			self.conn.close()
+		self.conn = None
+
+def httpRequest(pool, url, headers):
+	# Gives the response of a GET request,
+	# after following redirects
+	redirectCount = 0
+	while(True):
+		parts = urllib.parse.urlsplit(url)
+		hostKey = (parts.scheme, parts.hostname, parts.port)
+		if(parts.scheme != "http" and parts.scheme != "https"):
+			raise Exception("url not supported: " + url)
+
+		path = parts.path
+		if(parts.query != ""): path += "?" + parts.query
+
+		tryCount = 0
+		while(True):
+			conn, isReused = pool.get(hostKey)
+			try:
+				conn.request("GET", path, headers=headers)
+				resp = conn.getresponse()
+				break
+			except (http.client.HTTPException, OSError):
+				conn.close()
+				tryCount += 1
+				# An idle connection may have been closed by the server
+				if(not isReused or tryCount > 1): raise
+
+		response = HttpResponse()
+		response.pool = pool
+		response.hostKey = hostKey
+		response.conn = conn
+		response.resp = resp
+		response.status = resp.status
+		response.url = url
+
+		if(resp.status in (301, 302, 303, 307, 308)):
+			location = resp.getheader("Location")
+			resp.read()
+			response.close()
+			redirectCount += 1
+			if(location == None or redirectCount > 5):
+				raise Exception("too many redirects: " + url)
+			url = urllib.parse.urljoin(url, location)
+			continue
+
+		return response
+
+def downloadUrlToFile(pool, url, localPath, fileSize, sha256, stats, limiterList):
+	# Like wget -c, a file that is already there in part,
+	# is continued with a range request.
+	# The bytes are hashed as they are written,
+	# the file is removed if the hash is not sha256.
+	# Gives the sha256 of the file.
+	haveSize = 0
+	if(os.path.isfile(localPath)):
+		haveSize = os.path.getsize(localPath)
+	if(fileSize != None and haveSize > fileSize):
+		# cannot be continued, start again
+		haveSize = 0
+
+	headers = {}
+	if(haveSize > 0):
+		headers["Range"] = "bytes=" + str(haveSize) + "-"
+
+	response = httpRequest(pool, url, headers)
+
+	if(response.status == 416 and haveSize > 0):
+		# the file is already complete
+		response.resp.read()
+		response.close()
+		return checkDownloadHash(localPath, getFileSha256(localPath), sha256, url)
+
+	mode = None
+	if(response.status == 200): mode = "wb"
+	if(response.status == 206):
+		rangeStr = response.getHeader("Content-Range")
+		if(rangeStr == None
+			or not rangeStr.startswith("bytes " + str(haveSize) + "-")):
+
+			response.conn.close()
+			raise Exception("range not valid: " + url)
+		mode = "ab"
+
+	if(mode == None):
+		response.conn.close()
+		raise Exception("http error " + str(response.status) + ": " + url)
+
+	hashObj = hashlib.sha256()
+	if(mode == "ab"):
+		# only the part from before is read again
+		fileObj = open(localPath, "rb")
+		while(True):
+			chunk = fileObj.read(1 << 20)
+			if(not chunk): break
+			hashObj.update(chunk)
+		fileObj.close()
+
+	fileObj = open(localPath, mode)
+	try:
+		while(True):
+			chunk = response.read(65536)
+			if(not chunk): break
+			fileObj.write(chunk)
+			hashObj.update(chunk)
+			stats.addBytes(len(chunk))
+			for limiter in limiterList: limiter.consume(len(chunk))
+	finally:
+		fileObj.close()
+		response.close()
+
+	if(fileSize != None and os.path.getsize(localPath) != fileSize):
+		raise Exception("file size not as expected: " + localPath)
+	return checkDownloadHash(localPath, hashObj.hexdigest(), sha256, url)
+
+def checkDownloadHash(localPath, haveSha256, sha256, url):
+	if(sha256 != None and haveSha256 != sha256):
+		os.remove(localPath)
+		raise Exception("sha256 not as expected: " + url)
+	return haveSha256
+
+class FetchResult:
+	def __init__(self):
+		self.status = None
+		self.etag = None
+		self.lastModified = None
+		self.sha256 = None
+		self.fileSize = None
+
+def fetchUrlToFile(pool, url, localPath, headers):
+	# A whole file GET, which may be conditional.
+	# On 304, localPath is not touched.
+	timer = startStage("fetch")
+	if(url.startswith("file://")):
+		result = fetchLocalUrlToFile(url, localPath, headers)
+		endStage(timer, 1, result.fileSize or 0)
+		return result
+
+	response = httpRequest(pool, url, headers)
+
+	result = FetchResult()
+	result.status = response.status
+
+	if(response.status == 304 or response.status == 404):
+		response.resp.read()
+		response.close()
+		endStage(timer, 1, 0)
+		return result
+
+	if(response.status != 200):
+		response.conn.close()
+		raise Exception("http error " + str(response.status) + ": " + url)
+
+	result.etag = response.getHeader("ETag")
+	result.lastModified = response.getHeader("Last-Modified")
+
+	hashObj = hashlib.sha256()
+	fileSize = 0
+	fileObj = open(localPath, "wb")
+	try:
+		while(True):
+			chunk = response.read(65536)
+			if(not chunk): break
+			fileObj.write(chunk)
+			hashObj.update(chunk)
+			fileSize += len(chunk)
+	finally:
+		fileObj.close()
+		response.close()
+
+	result.sha256 = hashObj.hexdigest()
+	result.fileSize = fileSize
+	endStage(timer, 1, fileSize)
+	return result
+
+def fetchLocalUrlToFile(url, localPath, headers):
+	# Like fetchUrlToFile, for a file:// url,
+	# with http like status codes
+	path = urllib.parse.unquote(urllib.parse.urlsplit(url).path)
+
+	result = FetchResult()
+	if(not os.path.isfile(path)):
+		result.status = 404
+		return result
+
+	st = os.stat(path)
+	result.etag = '"' + format(st.st_mtime_ns, "x") + "-" + format(st.st_size, "x") + '"'
+	result.lastModified = email.utils.formatdate(st.st_mtime, usegmt=True)
+	if(headers.get("If-None-Match") == result.etag):
+		result.status = 304
+		return result
+
+	shutil.copyfile(path, localPath)
+	result.status = 200
+	result.sha256 = getFileSha256(localPath)
+	result.fileSize = os.path.getsize(localPath)
+	return result
+
+
+#
+# Download functions
+#
+
+class DownloadStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.startTime = time.time()
+		self.byteCount = 0
+		self.fileCount = 0
+		self.skipCount = 0
+		# of the files to download, from the sizes in the list
+		self.totalBytes = 0
+		self.totalFiles = 0
+		# for the progress rate
+		self.lastTime = self.startTime
+		self.lastByteCount = 0
+		self.rate = None
+
+	def addBytes(self, byteCount):
+		self.lock.acquire()
+		self.byteCount += byteCount
+		self.lock.release()
+
+	def addFile(self, isSkipped):
+		self.lock.acquire()
+		if(isSkipped): self.skipCount += 1
+		if(not isSkipped): self.fileCount += 1
+		self.lock.release()
+
+	def getProgress(self):
+		# Like: 120.5 of 800.0 MB (15%), 30 of 120 files, 4.20 MB/s, ETA 2m41s
+		self.lock.acquire()
+		now = time.time()
+		byteCount = self.byteCount
+		fileCount = self.fileCount
+		if(now > self.lastTime):
+			newRate = (byteCount - self.lastByteCount) / (now - self.lastTime)
+			# smoothed, so the ETA does not jump around
+			if(self.rate == None): self.rate = newRate
+			self.rate = 0.7 * self.rate + 0.3 * newRate
+			self.lastTime = now
+			self.lastByteCount = byteCount
+		rate = self.rate
+		self.lock.release()
+
+		percent = 100
+		if(self.totalBytes > 0):
+			percent = min(100, int(byteCount * 100 / self.totalBytes))
+		etaStr = "?"
+		if(rate != None and rate > 0):
+			etaStr = getDurationString(max(0, self.totalBytes - byteCount) / rate)
+		if(rate == None): rate = 0.0
+
+		return (("%.1f" % (byteCount / 1000000.0))
+			+ " of " + ("%.1f" % (self.totalBytes / 1000000.0)) + " MB"
+			+ " (" + str(percent) + "%)"
+			+ ", " + str(fileCount) + " of " + str(self.totalFiles) + " files"
+			+ ", " + ("%.2f" % (rate / 1000000.0)) + " MB/s"
+			+ ", ETA " + etaStr)
+
+	def getSummary(self):
+		seconds = time.time() - self.startTime
+		megaBytes = self.byteCount / 1000000.0
+		rate = 0.0
+		if(seconds > 0): rate = megaBytes / seconds
+		return ("Downloaded " + str(self.fileCount) + " files"
+			+ ", skipped " + str(self.skipCount)
+			+ ", " + ("%.1f" % megaBytes) + " MB"
+			+ " in " + ("%.1f" % seconds) + " s"
+			+ ", " + ("%.2f" % rate) + " MB/s")
+
+class AttemptStats:
+	# The bytes one mirror sent for one file,
+	# which are counted in the download stats too
+	def __init__(self, stats):
+		self.lock = threading.Lock()
+		self.stats = stats
+		self.byteCount = 0
+
+	def addBytes(self, byteCount):
+		self.lock.acquire()
+		self.byteCount += byteCount
+		self.lock.release()
+		self.stats.addBytes(byteCount)
+
+def getDurationString(seconds):
+	seconds = int(seconds)
+	if(seconds < 60): return str(seconds) + "s"
+	if(seconds < 3600): return str(seconds // 60) + "m" + str(seconds % 60) + "s"
+	return str(seconds // 3600) + "h" + str(seconds % 3600 // 60) + "m"
+
+class DownloadContext:
+	def __init__(self):
+		self.outputDir = None
+		self.mirrorInfo = None
+		self.pool = None
+		self.stats = None
+		self.digestCache = None
+		self.inventory = None
+		self.journal = None
+		self.limits = None
+		self.mirrors = None
+		self.options = None
+		self.printLock = threading.Lock()
+
+class DownloadOptions:
+	def __init__(self):
+		# a name in DOWNLOAD_ORDERS
+		self.order = "dir"
+		# bytes per second, None for no limit
+		self.rateLimit = None
+		self.mirrorRateLimit = None
+		# downloads at the same time from one mirror, None for --jobs
+		self.mirrorJobCount = None
+		self.progressSeconds = 5.0
+		# files of this size or more are fetched in segments,
+		# segmentJobCount at the same time, None to not do it
+		self.segmentThreshold = 64 * 1024 * 1024
+		self.segmentJobCount = 4
+
+def orderLargestFirst(specList):
+	# big files start early, so they do not hold up the end of the run
+	return sorted(specList, key=getSpecSizeForOrder, reverse=True)
+
+def orderSmallestFirst(specList):
+	return sorted(specList, key=getSpecSizeForOrder)
+
+def orderByDir(specList):
+	# the list order, sorted by dir, so a dir is done in one go
+	return specList
+
+def getSpecSizeForOrder(spec):
+	if(spec.fileSize == None): return 0
+	return spec.fileSize
+
+DOWNLOAD_ORDERS = {
+	"largest-first": orderLargestFirst,
+	"smallest-first": orderSmallestFirst,
+	"dir": orderByDir,
+}
+
+class RateLimiter:
+	# A token bucket, in bytes per second, shared by threads.
+	# Up to one second of bytes can go at once.
+	def __init__(self, bytesPerSecond):
+		self.lock = threading.Lock()
+		self.rate = bytesPerSecond
+		self.allowance = float(bytesPerSecond)
+		self.lastTime = time.monotonic()
+
+	def consume(self, byteCount):
+		self.lock.acquire()
+		now = time.monotonic()
+		self.allowance = min(float(self.rate),
+			self.allowance + (now - self.lastTime) * self.rate)
+		self.lastTime = now
+		self.allowance -= byteCount
+		waitSeconds = 0.0
+		if(self.allowance < 0): waitSeconds = -self.allowance / self.rate
+		self.lock.release()
+
+		if(waitSeconds > 0): time.sleep(waitSeconds)
+
+class MirrorLimit:
+	def __init__(self):
+		self.rateLimiter = None
+		self.semaphore = None
+
+class DownloadLimits:
+	# The global rate limit, and a rate and job limit for each mirror
+	def __init__(self, options, jobCount):
+		self.lock = threading.Lock()
+		self.options = options
+		self.jobCount = jobCount
+		self.globalLimiter = None
+		if(options.rateLimit != None):
+			self.globalLimiter = RateLimiter(options.rateLimit)
+		# mirror name -> MirrorLimit
+		self.mirrorLimits = {}
+
+	def getMirrorLimit(self, mirrorInfo):
+		self.lock.acquire()
+		limit = self.mirrorLimits.get(mirrorInfo.name)
+		if(limit == None):
+			limit = MirrorLimit()
+			if(self.options.mirrorRateLimit != None):
+				limit.rateLimiter = RateLimiter(self.options.mirrorRateLimit)
+			jobCount = self.jobCount
+			if(self.options.mirrorJobCount != None):
+				jobCount = self.options.mirrorJobCount
+			limit.semaphore = threading.Semaphore(jobCount)
+			self.mirrorLimits[mirrorInfo.name] = limit
+		self.lock.release()
+		return limit
+
+	def getLimiterList(self, mirrorLimit):
+		limiterList = []
+		if(self.globalLimiter != None): limiterList.append(self.globalLimiter)
+		if(mirrorLimit.rateLimiter != None): limiterList.append(mirrorLimit.rateLimiter)
+		return limiterList
+
+
+#
+# Mirror selection functions
+#
+
+# errors in a row, before a mirror is not used any more
+MIRROR_MAX_ERRORS = 3
+MIRROR_PROBE_BYTES = 256 * 1024
+
+class MirrorState:
+	def __init__(self):
+		self.info = None
+		# bytes per second, None if not known yet
+		self.speed = None
+		self.latency = None
+		self.fileCount = 0
+		self.byteCount = 0
+		self.seconds = 0.0
+		self.errorCount = 0
+		self.errorRun = 0
+		self.isDown = False
+
+class MirrorSet:
+	# Files are spread over the mirrors, weighted by speed.
+	# The speed comes from the probe, and then from each file done.
+	def __init__(self, mirrorList):
+		self.lock = threading.Lock()
+		self.mirrorList = []
+		for mirror in mirrorList:
+			state = MirrorState()
+			state.info = getMirrorInfo(mirror)
+			self.mirrorList.append(state)
+
+	def pick(self, triedNames):
+		# Gives None, if each mirror was tried
+		self.lock.acquire()
+		candidates = []
+		for state in self.mirrorList:
+			if(state.info.name in triedNames or state.isDown): continue
+			candidates.append(state)
+		if(len(candidates) == 0):
+			# a mirror that is down may still have the file
+			for state in self.mirrorList:
+				if(state.info.name in triedNames): continue
+				candidates.append(state)
+
+		knownList = []
+		for state in candidates:
+			if(state.speed != None): knownList.append(state.speed)
+		defaultSpeed = 1.0
+		if(len(knownList) > 0): defaultSpeed = sum(knownList) / len(knownList)
+
+		weights = []
+		for state in candidates:
+			speed = state.speed
+			if(speed == None): speed = defaultSpeed
+			weights.append(max(speed, 1.0))
+		self.lock.release()
+
+		if(len(candidates) == 0): return None
+		return random.choices(candidates, weights)[0]
+
+	def addDone(self, state, byteCount, seconds):
+		# byteCount is what the mirror sent for the file,
+		# a file it only had to finish does not say much of its speed
+		self.lock.acquire()
+		state.fileCount += 1
+		state.byteCount += byteCount
+		state.seconds += seconds
+		state.errorRun = 0
+		if(seconds > 0 and byteCount > 0):
+			speed = byteCount / seconds
+			if(state.speed == None): state.speed = speed
+			state.speed = 0.8 * state.speed + 0.2 * speed
+		self.lock.release()
+
+	def addError(self, state):
+		# Gives True, if the mirror is down from now on
+		self.lock.acquire()
+		state.errorCount += 1
+		state.errorRun += 1
+		isNowDown = False
+		if(state.errorRun >= MIRROR_MAX_ERRORS and not state.isDown):
+			state.isDown = True
+			isNowDown = True
+		self.lock.release()
+		return isNowDown
+
+	def getSummaryList(self):
+		summaryList = []
+		for state in self.mirrorList:
+			summary = ("Mirror " + state.info.name
+				+ ": " + str(state.fileCount) + " files"
+				+ ", " + ("%.1f" % (state.byteCount / 1000000.0)) + " MB")
+			if(state.speed != None):
+				summary += ", " + ("%.2f" % (state.speed / 1000000.0)) + " MB/s"
+			if(state.latency != None):
+				summary += ", latency " + str(int(state.latency * 1000)) + " ms"
+			summary += ", errors " + str(state.errorCount)
+			if(state.isDown): summary += ", down"
+			summaryList.append(summary)
+		return summaryList
+
+def probeMirrors(context, specList):
+	# The first part of the largest file is fetched from each mirror,
+	# for the latency and the speed to start with
+	if(len(context.mirrors.mirrorList) < 2): return
+	probeSpec = None
+	for spec in specList:
+		if(probeSpec == None
+			or getSpecSizeForOrder(spec) > getSpecSizeForOrder(probeSpec)):
+
+			probeSpec = spec
+	if(probeSpec == None): return
+
+	threadList = []
+	for state in context.mirrors.mirrorList:
+		t = threading.Thread(target=probeMirror,
+			args=(context, state, probeSpec))
+		t.start()
+		threadList.append(t)
+	for t in threadList: t.join()
+
+def probeMirror(context, state, spec):
+	if(state.info.scheme == "file"): return
+	url = getMirrorUrl(state.info,
+		"pool" + "/" + spec.theDir + "/" + spec.fileNameMinusPath)
+
+	try:
+		startTime = time.monotonic()
+		response = httpRequest(context.pool, url,
+			{"Range": "bytes=0-" + str(MIRROR_PROBE_BYTES - 1)})
+		latency = time.monotonic() - startTime
+		byteCount = 0
+		try:
+			if(response.status != 200 and response.status != 206):
+				raise Exception("http status " + str(response.status))
+			while(byteCount < MIRROR_PROBE_BYTES):
+				chunk = response.read(65536)
+				if(not chunk): break
+				byteCount += len(chunk)
+		finally:
+			if(byteCount < MIRROR_PROBE_BYTES): response.conn.close()
+			response.close()
+		seconds = time.monotonic() - startTime
+	except Exception as e:
+		context.mirrors.addError(state)
+		context.printLock.acquire()
+		print("Mirror probe failed: " + state.info.name + ": " + str(e))
+		context.printLock.release()
+		return
+
+	context.mirrors.lock.acquire()
+	state.latency = latency
+	if(seconds > 0): state.speed = byteCount / seconds
+	context.mirrors.lock.release()
+
+	context.printLock.acquire()
+	print("Mirror probe: " + state.info.name
+		+ ", latency " + str(int(latency * 1000)) + " ms"
+		+ ", " + ("%.2f" % (byteCount / max(seconds, 0.001) / 1000000.0)) + " MB/s")
+	context.printLock.release()
+
+class PoolInventory:
+	# The files that are in a download pool, from one scan,
+	# theDir -> (file name -> size)
+	def __init__(self):
+		self.dirs = {}
+		self.fileCount = 0
+
+	def add(self, theDir, fileName, fileSize):
+		fileDict = self.dirs.get(theDir)
+		if(fileDict == None):
+			fileDict = {}
+			self.dirs[theDir] = fileDict
+		fileDict[fileName] = fileSize
+		self.fileCount += 1
+
+	def getSize(self, theDir, fileName):
+		fileDict = self.dirs.get(theDir)
+		if(fileDict == None): return None
+		return fileDict.get(fileName)
+
+	def hasDir(self, theDir):
+		return theDir in self.dirs
+
+	def addDir(self, theDir):
+		if(theDir not in self.dirs): self.dirs[theDir] = {}
+
+def scanPoolInventory(poolDir, jobCount):
+	# The whole pool is scanned once, with getPoolFileList,
+	# so a file does not need its own stat calls when it is checked
+	print("Scanning pool: " + poolDir)
+
+	inventory = PoolInventory()
+	prefixLen = len(poolDir) + 1
+	for spec in getPoolFileList(poolDir, jobCount):
+		theDir = spec.theDir[prefixLen:]
+		inventory.add(theDir, spec.fileNameMinusPath, spec.fileSize)
+
+		# the dirs above it are there too
+		i = theDir.rfind("/")
+		while(i > 0 and not inventory.hasDir(theDir[:i])):
+			inventory.addDir(theDir[:i])
+			i = theDir.rfind("/", 0, i)
+
+	print("Files in pool: " + str(inventory.fileCount))
+	return inventory
+
+# journal entries are fsynced after this many, or this many seconds
+DOWNLOAD_JOURNAL_SYNC_COUNT = 100
+DOWNLOAD_JOURNAL_SYNC_SECONDS = 2.0
+# a journal with more lines than this, over the files done in it,
+# is written again when it is loaded
+DOWNLOAD_JOURNAL_COMPACT_LINES = 10000
+# with more files left than this, the pool is scanned once,
+# instead of a stat call for each file
+DOWNLOAD_STAT_MAX_COUNT = 100
+
+class DownloadJournal:
+	# An append only file in the download dir, with a line for each
+	# file that was downloaded, or that failed:
+	# done,size,sha256,theDir,name
+	# failed,-,-,theDir,name
+	# removed,-,-,theDir,name
+	# A later line for the same file wins.
+	# A line cut short by a crash is not used.
+	# When loaded, a journal with many old lines is written again,
+	# with a line for each file done.
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		# (theDir, name) -> (size, sha256), both can be None
+		self.doneDict = {}
+		self.lineCount = 0
+		self.isCut = False
+		self.unsyncedCount = 0
+		self.lastSyncTime = time.time()
+		if(fileExists(path)):
+			self.load()
+			# a cut line would run into the next one written
+			if(self.isCut
+				or self.lineCount - len(self.doneDict) > DOWNLOAD_JOURNAL_COMPACT_LINES):
+
+				self.compact()
+		self.fileObj = open(path, "a")
+
+	def load(self):
+		fileObj = open(self.path, "r", encoding="utf-8", errors="surrogateescape")
+		lineNum = 0
+		for line in fileObj:
+			lineNum += 1
+			if(not line.endswith(NEWLINE)):
+				self.isCut = True
+				break
+
+			parts = line[:-1].split(",", 4)
+			if(len(parts) != 5 or (parts[0] != "done" and parts[0] != "failed"
+				and parts[0] != "removed")):
+
+				fileObj.close()
+				print("Line Number: " + str(lineNum))
+				raise Exception("download journal not valid: " + self.path)
+
+			key = (parts[3], parts[4])
+			self.lineCount += 1
+			if(parts[0] == "failed" or parts[0] == "removed"):
+				# a removed file is downloaded again, if it is listed again
+				self.doneDict.pop(key, None)
+				continue
+
+			fileSize = None
+			if(parts[1] != "-"): fileSize = getNumberFromString(parts[1])
+			sha256 = None
+			if(parts[2] != "-"): sha256 = parts[2]
+			self.doneDict[key] = (fileSize, sha256)
+		fileObj.close()
+
+	def compact(self):
+		# Written to a new file, which then takes the place of the old one,
+		# so a crash leaves one of them whole
+		tempPath = self.path + ".part"
+		fileObj = open(tempPath, "w", encoding="utf-8", errors="surrogateescape")
+		for key, entry in self.doneDict.items():
+			sizeStr = "-"
+			if(entry[0] != None): sizeStr = str(entry[0])
+			sha256 = entry[1]
+			if(sha256 == None): sha256 = "-"
+			fileObj.write("done," + sizeStr + "," + sha256
+				+ "," + key[0] + "," + key[1] + NEWLINE)
+		fileObj.flush()
+		os.fsync(fileObj.fileno())
+		fileObj.close()
+		os.replace(tempPath, self.path)
+		print("Download journal compacted: " + str(self.lineCount)
+			+ " lines to " + str(len(self.doneDict)))
+		self.lineCount = len(self.doneDict)
+		self.isCut = False
+
+	def isDone(self, spec):
+		entry = self.doneDict.get((spec.theDir, spec.fileNameMinusPath))
+		if(entry == None): return False
+		if(spec.fileSize != None and entry[0] != spec.fileSize): return False
+		if(spec.sha256 != None and entry[1] != None and entry[1] != spec.sha256):
+			return False
+		return True
+
+	def addLine(self, kindStr, spec, fileSize, sha256):
+		sizeStr = "-"
+		if(fileSize != None): sizeStr = str(fileSize)
+		if(sha256 == None): sha256 = "-"
+
+		self.lock.acquire()
+		try:
+			self.fileObj.write(kindStr
+				+ "," + sizeStr
+				+ "," + sha256
+				+ "," + spec.theDir
+				+ "," + spec.fileNameMinusPath + NEWLINE)
+			self.lineCount += 1
+			self.unsyncedCount += 1
+			if(self.unsyncedCount >= DOWNLOAD_JOURNAL_SYNC_COUNT
+				or time.time() - self.lastSyncTime >= DOWNLOAD_JOURNAL_SYNC_SECONDS):
+
+				self.sync()
+		finally:
+			self.lock.release()
+
+	def addDone(self, spec, fileSize, sha256):
+		self.addLine("done", spec, fileSize, sha256)
+
+	def addFailed(self, spec):
+		self.addLine("failed", spec, None, None)
+
+	def addRemoved(self, spec):
+		self.addLine("removed", spec, None, None)
+
+	def sync(self):
+		self.fileObj.flush()
+		os.fsync(self.fileObj.fileno())
+		self.unsyncedCount = 0
+		self.lastSyncTime = time.time()
+
+	def close(self):
+		self.lock.acquire()
+		self.sync()
+		self.fileObj.close()
+		self.lock.release()
+
+def downloadFiles(outputDir, mirrorList, myList, jobCount, digestCache, options):
+	# jobCount files are downloaded at the same time,
+	# each with an absolute path, so the current dir is not used.
+	# Each file comes from one of the mirrors in mirrorList,
+	# and from another one, if that fails.
+
+	for spec in myList:
+		if(spec.theDir == None
+			or spec.fileNameMinusPath == None):
+
+			raise Exception("a RepoFileSpec is bad")
+
+	context = DownloadContext()
+	context.outputDir = os.path.abspath(outputDir)
+	context.mirrors = MirrorSet(mirrorList)
+	context.pool = HttpConnectionPool()
+	context.stats = DownloadStats()
+	context.digestCache = digestCache
+	context.journal = DownloadJournal(
+		pathCombine2(context.outputDir, "download-journal.csv"))
+	context.limits = DownloadLimits(options, jobCount)
+	context.options = options
+
+	# files done in an earlier run are skipped,
+	# without looking at the file system
+	remainList = []
+	for spec in myList:
+		if(context.journal.isDone(spec)):
+			context.stats.addFile(True)
+			continue
+		remainList.append(spec)
+
+	# The files left may already be in the pool, which is scanned once.
+	# Only a few files left are checked one at a time.
+	useInventory = (len(remainList) > DOWNLOAD_STAT_MAX_COUNT)
+	context.inventory = PoolInventory()
+	if(useInventory):
+		context.inventory = scanPoolInventory(
+			pathCombine2(context.outputDir, "pool"), jobCount)
+
+	# files that are there, with the size in the list, are skipped
+	workList = []
+	for spec in remainList:
+		haveSize = None
+		if(useInventory):
+			haveSize = context.inventory.getSize(spec.theDir, spec.fileNameMinusPath)
+		if(not useInventory and spec.fileSize != None):
+			haveSize = getLocalFileSize(context, spec)
+
+		if(spec.fileSize != None and haveSize == spec.fileSize
+			and not hasSegmentFile(context, spec, useInventory)):
+
+			context.stats.addFile(True)
+			context.journal.addDone(spec, haveSize, None)
+			continue
+		workList.append(spec)
+
+	workQueue = queue.Queue()
+	for spec in DOWNLOAD_ORDERS[options.order](workList):
+		workQueue.put(spec)
+		context.stats.totalBytes += getSpecSizeForOrder(spec)
+	context.stats.totalFiles = len(workList)
+
+	print("Downloading files: " + str(len(workList))
+		+ " of " + str(len(myList))
+		+ ", " + ("%.1f" % (context.stats.totalBytes / 1000000.0)) + " MB")
+
+	probeMirrors(context, workList)
+
+	progressDone = threading.Event()
+	progressThread = threading.Thread(target=printDownloadProgress,
+		args=(context, options.progressSeconds, progressDone))
+	progressThread.start()
+
+	failedList = []
+	timer = startStage("download")
+	try:
+		failedList = runDownloadWorkers(context, workQueue, jobCount)
+
+		if(len(failedList) > 0):
+			print("Trying failed files again: " + str(len(failedList)))
+			for item in failedList: workQueue.put(item[0])
+			failedList = runDownloadWorkers(context, workQueue, jobCount)
+	finally:
+		progressDone.set()
+		progressThread.join()
+		context.pool.closeAll()
+		context.journal.close()
+		digestCache.save()
+	endStage(timer, context.stats.fileCount, context.stats.byteCount)
+	addStatsCounter("filesDownloaded", context.stats.fileCount)
+	addStatsCounter("filesSkipped", context.stats.skipCount)
+	addStatsCounter("filesFailed", len(failedList))
+	addStatsCounter("bytesDownloaded", context.stats.byteCount)
+
+	print(context.stats.getSummary())
+	if(len(context.mirrors.mirrorList) > 1):
+		for summary in context.mirrors.getSummaryList(): print(summary)
+
+	if(len(failedList) > 0):
+		raise Exception("download failed for " + str(len(failedList)) + " files"
+			+ ", they are tried again on the next run"
+			+ ", first error: " + str(failedList[0][1]))
+	return
+
+def getLocalFileSize(context, spec):
+	localPath = pathCombine2(context.outputDir, "pool")
+	localPath = pathCombine2(localPath, spec.theDir)
+	localPath = pathCombine2(localPath, spec.fileNameMinusPath)
+	try:
+		return os.stat(localPath).st_size
+	except FileNotFoundError:
+		return None
+
+def hasSegmentFile(context, spec, useInventory):
+	# A file with segments left has its full size already
+	segmentName = spec.fileNameMinusPath + DOWNLOAD_SEGMENTS_SUFFIX
+	if(useInventory):
+		return context.inventory.getSize(spec.theDir, segmentName) != None
+	localPath = pathCombine2(context.outputDir, "pool")
+	localPath = pathCombine2(localPath, spec.theDir)
+	return fileExists(pathCombine2(localPath, segmentName))
+
+def printDownloadProgress(context, seconds, progressDone):
+	while(not progressDone.wait(seconds)):
+		context.printLock.acquire()
+		print("Progress: " + context.stats.getProgress())
+		context.printLock.release()
+
+def runDownloadWorkers(context, workQueue, jobCount):
+	# Gives the failed files, as (spec, exception)
+	failedList = []
+
+	threadList = []
+	i = 0
+	while(i < jobCount):
+		t = threading.Thread(target=downloadWorker,
+			args=(context, workQueue, failedList))
+		t.start()
+		threadList.append(t)
+		i += 1
+
+	for t in threadList: t.join()
+	return failedList
+
+def downloadWorker(context, workQueue, failedList):
+	# A failed file is put in the journal,
+	# and the other files are still downloaded
+	while(True):
+		try:
+			spec = workQueue.get_nowait()
+		except queue.Empty:
+			return
+
+		try:
+			downloadFile(context, spec)
+		except Exception as e:
+			context.journal.addFailed(spec)
+			failedList.append((spec, e))
+
+			context.printLock.acquire()
+			print("failed: " + spec.theDir + "/" + spec.fileNameMinusPath
+				+ ": " + str(e))
+			context.printLock.release()
+
+def downloadFile(context, spec):
+	downPath = pathCombine2(context.outputDir, "pool")
+	downPath = pathCombine2(downPath, spec.theDir)
+	localPath = pathCombine2(downPath, spec.fileNameMinusPath)
+
+	if(not context.inventory.hasDir(spec.theDir)):
+		makeDirs(downPath)
+		context.inventory.addDir(spec.theDir)
+
+	# on an error, the next mirror continues the part file
+	triedNames = set()
+	lastError = None
+	while(True):
+		state = context.mirrors.pick(triedNames)
+		if(state == None):
+			raise Exception("file download failed: "
+				+ spec.fileNameMinusPath + ": " + str(lastError))
+		triedNames.add(state.info.name)
+
+		attemptStats = AttemptStats(context.stats)
+		try:
+			startTime = time.monotonic()
+			sha256 = downloadFileFromMirror(context, spec, localPath, state,
+				attemptStats)
+			seconds = time.monotonic() - startTime
+			break
+		except Exception as e:
+			lastError = e
+			isNowDown = context.mirrors.addError(state)
+
+			context.printLock.acquire()
+			if(isNowDown): print("Mirror down: " + state.info.name)
+			if(len(triedNames) < len(context.mirrors.mirrorList)):
+				print("trying another mirror: " + spec.theDir + "/"
+					+ spec.fileNameMinusPath + ": " + str(e))
+			context.printLock.release()
+
+	# so --verify does not read it again
+	st = os.stat(localPath)
+	context.mirrors.addDone(state, attemptStats.byteCount, seconds)
+	context.digestCache.put(localPath, st, sha256)
+	context.journal.addDone(spec, st.st_size, sha256)
+
+	context.stats.addFile(False)
+
+	context.printLock.acquire()
+	print("downloaded: " + spec.theDir + "/" + spec.fileNameMinusPath)
+	context.printLock.release()
+	return
+
+def downloadFileFromMirror(context, spec, localPath, state, attemptStats):
+	webPath = getMirrorUrl(state.info,
+		"pool" + "/" + spec.theDir + "/" + spec.fileNameMinusPath)
+
+	mirrorLimit = context.limits.getMirrorLimit(state.info)
+	if(spec.fileSize != None
+		and context.options.segmentThreshold != None
+		and spec.fileSize >= context.options.segmentThreshold):
+
+		sha256 = downloadUrlToFileSegmented(context, webPath, localPath,
+			spec.fileSize, spec.sha256, mirrorLimit, attemptStats)
+		if(sha256 != None): return sha256
+		# the mirror has no range requests, so it is one stream
+
+	mirrorLimit.semaphore.acquire()
+	try:
+		return downloadUrlToFile(context.pool, webPath, localPath,
+			spec.fileSize, spec.sha256, attemptStats,
+			context.limits.getLimiterList(mirrorLimit))
+	finally:
+		mirrorLimit.semaphore.release()
+
+
+#
+# Segmented download functions
+#
+
+DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+DOWNLOAD_SEGMENTS_SUFFIX = ".segments"
+
+class SegmentedDownload:
+	# A big file, fetched in byte ranges over more connections,
+	# into a file with its full size from the start.
+	# The segments done are kept in a dict file next to it,
+	# so a download that was cut short goes on where it was.
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.url = None
+		self.localPath = None
+		self.segmentPath = None
+		self.fileSize = None
+		self.segmentCount = None
+		self.doneSet = set()
+		self.workQueue = queue.Queue()
+		self.errorList = []
+		self.isRangeNotSupported = False
+		self.stats = None
+
+	def getRange(self, index):
+		start = index * DOWNLOAD_SEGMENT_SIZE
+		end = min(self.fileSize, start + DOWNLOAD_SEGMENT_SIZE) - 1
+		return start, end
+
+	def save(self):
+		doneList = []
+		for index in sorted(self.doneSet): doneList.append(str(index))
+		writeDictFile(self.segmentPath, "SegmentedDownload", {
+			"fileSize": str(self.fileSize),
+			"segmentSize": str(DOWNLOAD_SEGMENT_SIZE),
+			"done": ",".join(doneList),
+		})
+
+def openSegmentedDownload(url, localPath, fileSize):
+	download = SegmentedDownload()
+	download.url = url
+	download.localPath = localPath
+	download.segmentPath = localPath + DOWNLOAD_SEGMENTS_SUFFIX
+	download.fileSize = fileSize
+	download.segmentCount = ((fileSize + DOWNLOAD_SEGMENT_SIZE - 1)
+		// DOWNLOAD_SEGMENT_SIZE)
+
+	haveSegmentFile = os.path.isfile(download.segmentPath)
+	propDict = None
+	try:
+		if(haveSegmentFile):
+			propDict = parseDictFile(download.segmentPath, "SegmentedDownload")
+	except Exception:
+		propDict = None
+
+	haveSize = None
+	if(os.path.isfile(localPath)):
+		haveSize = os.path.getsize(localPath)
+
+	# the saved segments are only used with the file they were saved for
+	isResumed = False
+	if(propDict != None
+		and propDict.get("fileSize") == str(fileSize)
+		and propDict.get("segmentSize") == str(DOWNLOAD_SEGMENT_SIZE)
+		and haveSize == fileSize):
+
+		for indexStr in propDict.get("done", "").split(","):
+			if(isStringSimpleNumber(indexStr)):
+				download.doneSet.add(getNumberFromString(indexStr))
+		isResumed = True
+
+	if(not isResumed):
+		# A part file from a plain download keeps the segments it has.
+		# After a segmented one, what is in it is not known.
+		if(haveSize == None or haveSize > fileSize or haveSegmentFile):
+			haveSize = 0
+		index = 0
+		while(index < download.segmentCount):
+			if(download.getRange(index)[1] < haveSize):
+				download.doneSet.add(index)
+			index += 1
+
+		# Saved before the file gets its full size,
+		# so a full size file is never there without it.
+		# The segments are only used with a file of the full size.
+		download.save()
+
+		fd = os.open(localPath, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			if(haveSize == 0): os.ftruncate(fd, 0)
+			if(hasattr(os, "posix_fallocate")):
+				os.posix_fallocate(fd, 0, fileSize)
+			os.ftruncate(fd, fileSize)
+		finally:
+			os.close(fd)
+
+	index = 0
+	while(index < download.segmentCount):
+		if(index not in download.doneSet): download.workQueue.put(index)
+		index += 1
+	return download
+
+def downloadUrlToFileSegmented(context, url, localPath, fileSize, sha256,
+	mirrorLimit, attemptStats):
+
+	# Gives the sha256 of the file,
+	# or None, if the mirror does not do range requests
+	download = openSegmentedDownload(url, localPath, fileSize)
+	download.stats = attemptStats
+	jobCount = min(context.options.segmentJobCount, download.workQueue.qsize())
+
+	threadList = []
+	i = 0
+	while(i < jobCount):
+		t = threading.Thread(target=segmentWorker,
+			args=(context, download, mirrorLimit))
+		t.start()
+		threadList.append(t)
+		i += 1
+	for t in threadList: t.join()
+
+	if(download.isRangeNotSupported):
+		# The segments done are of no use with this mirror,
+		# the file is fetched again in one stream.
+		# The file goes first, so it is not left without its segments.
+		os.remove(localPath)
+		os.remove(download.segmentPath)
+		return None
+	if(len(download.errorList) > 0):
+		raise download.errorList[0]
+
+	if(os.path.getsize(localPath) != fileSize):
+		# what is in it is not known, it is fetched again
+		os.remove(localPath)
+		os.remove(download.segmentPath)
+		raise Exception("file size not as expected: " + localPath)
+
+	# the segments are written out of order, so it is hashed once at the end
+	os.remove(download.segmentPath)
+	return checkDownloadHash(localPath, getFileSha256(localPath), sha256, url)
+
+def segmentWorker(context, download, mirrorLimit):
+	# After an error, no more segments are started
+	while(len(download.errorList) == 0):
+		try:
+			index = download.workQueue.get_nowait()
+		except queue.Empty:
+			return
+
+		mirrorLimit.semaphore.acquire()
+		try:
+			fetchSegment(context, download, index,
+				context.limits.getLimiterList(mirrorLimit))
+		except Exception as e:
+			download.lock.acquire()
+			download.errorList.append(e)
+			download.lock.release()
+			return
+		finally:
+			mirrorLimit.semaphore.release()
+
+		download.lock.acquire()
+		download.doneSet.add(index)
+		download.save()
+		download.lock.release()
+
+def fetchSegment(context, download, index, limiterList):
+	start, end = download.getRange(index)
+	response = httpRequest(context.pool, download.url,
+		{"Range": "bytes=" + str(start) + "-" + str(end)})
+
+	if(response.status == 200):
+		download.isRangeNotSupported = True
+		response.conn.close()
+		response.close()
+		raise Exception("range not supported: " + download.url)
+	if(response.status != 206):
+		response.conn.close()
+		response.close()
+		raise Exception("http error " + str(response.status) + ": " + download.url)
+
+	rangeStr = response.getHeader("Content-Range")
+	if(rangeStr == None
+		or not rangeStr.startswith("bytes " + str(start) + "-" + str(end) + "/")):
+
+		response.conn.close()
+		response.close()
+		raise Exception("range not valid: " + download.url)
+
+	byteCount = 0
+	fileObj = open(download.localPath, "r+b")
+	try:
+		fileObj.seek(start)
+		while(True):
+			chunk = response.read(65536)
+			if(not chunk): break
+			fileObj.write(chunk)
+			byteCount += len(chunk)
+			download.stats.addBytes(len(chunk))
+			for limiter in limiterList: limiter.consume(len(chunk))
+	finally:
+		fileObj.close()
+		response.close()
+
+	if(byteCount != end - start + 1):
+		raise Exception("segment cut short: " + download.url)
+
+
+#
+# Verify functions
+#
+
+class FileDigestCache:
+	# The sha256 of local files, by absolute path.
+	# A digest is used while the size, modified time and inode
+	# of the file are the same, so a file is not hashed again.
+	# Lines are sha256,size,mtime in ns,inode,path
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.digests = {}
+		self.isChanged = False
+		if(fileExists(path)): self.load()
+
+	def load(self):
+		fileObj = open(self.path, "r", encoding="utf-8", errors="surrogateescape")
+		lineNum = 0
+		for line in fileObj:
+			lineNum += 1
+			parts = line.rstrip(NEWLINE).split(",", 4)
+			if(len(parts) != 5
+				or not isStringSha256(parts[0])
+				or not isStringSimpleNumber(parts[1])
+				or not isStringSimpleNumber(parts[2])
+				or not isStringSimpleNumber(parts[3])):
+
+				fileObj.close()
+				print("Line Number: " + str(lineNum))
+				raise Exception("digest cache not valid: " + self.path)
+
+			self.digests[parts[4]] = (
+				int(parts[1]), int(parts[2]), int(parts[3]), parts[0])
+		fileObj.close()
+
+	def get(self, path, st):
+		self.lock.acquire()
+		entry = self.digests.get(path)
+		self.lock.release()
+
+		if(entry == None): return None
+		if(entry[0] != st.st_size
+			or entry[1] != st.st_mtime_ns
+			or entry[2] != st.st_ino):
+
+			return None
+		return entry[3]
+
+	def put(self, path, st, sha256):
+		self.lock.acquire()
+		self.digests[path] = (st.st_size, st.st_mtime_ns, st.st_ino, sha256)
+		self.isChanged = True
+		self.lock.release()
+
+	def save(self):
+		self.lock.acquire()
+		try:
+			if(not self.isChanged): return
+			makeDirs(os.path.dirname(self.path))
+			tempPath = self.path + ".tmp"
+			fileObj = open(tempPath, "w", encoding="utf-8", errors="surrogateescape")
+			for path in sorted(self.digests.keys()):
+				entry = self.digests[path]
+				fileObj.write(entry[3]
+					+ "," + str(entry[0])
+					+ "," + str(entry[1])
+					+ "," + str(entry[2])
+					+ "," + path + NEWLINE)
+			fileObj.close()
+			os.replace(tempPath, self.path)
+			self.isChanged = False
+		finally:
+			self.lock.release()
+
+class VerifyStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.startTime = time.time()
+		self.okCount = 0
+		self.badCount = 0
+		self.missingCount = 0
+		self.noHashCount = 0
+		self.hashedCount = 0
+		self.hashedBytes = 0
+
+	def addResult(self, resultName):
+		self.lock.acquire()
+		if(resultName == "ok"): self.okCount += 1
+		if(resultName == "bad"): self.badCount += 1
+		if(resultName == "missing"): self.missingCount += 1
+		if(resultName == "noHash"): self.noHashCount += 1
+		self.lock.release()
+
+	def addHashed(self, byteCount):
+		self.lock.acquire()
+		self.hashedCount += 1
+		self.hashedBytes += byteCount
+		self.lock.release()
+
+	def getSummary(self):
+		seconds = time.time() - self.startTime
+		megaBytes = self.hashedBytes / 1000000.0
+		rate = 0.0
+		if(seconds > 0): rate = megaBytes / seconds
+		return ("Verified " + str(self.okCount) + " files"
+			+ ", not valid " + str(self.badCount)
+			+ ", missing " + str(self.missingCount)
+			+ ", without sha256 " + str(self.noHashCount)
+			+ ", hashed " + str(self.hashedCount)
+			+ " (" + ("%.1f" % megaBytes) + " MB"
+			+ ", " + ("%.2f" % rate) + " MB/s)"
+			+ " in " + ("%.1f" % seconds) + " s")
+
+class VerifyContext:
+	def __init__(self):
+		self.outputDir = None
+		self.digestCache = None
+		self.journal = None
+		self.stats = None
+		self.printLock = threading.Lock()
+
+def verifyFiles(outputDir, myList, jobCount, digestCache):
+	# Checks the downloaded files against the sizes and sha256 in the list.
+	# jobCount files are hashed at the same time.
+	context = VerifyContext()
+	context.outputDir = os.path.abspath(outputDir)
+	context.digestCache = digestCache
+	context.stats = VerifyStats()
+
+	# files that are not valid, or missing, are put in the
+	# download journal as failed, so --download gets them again
+	journalPath = pathCombine2(context.outputDir, "download-journal.csv")
+	if(fileExists(journalPath)):
+		context.journal = DownloadJournal(journalPath)
+
+	print("Verifying files...")
+
+	workQueue = queue.Queue()
+	for spec in myList: workQueue.put(spec)
+	errorList = []
+
+	threadList = []
+	i = 0
+	while(i < jobCount):
+		t = threading.Thread(target=verifyWorker,
+			args=(context, workQueue, errorList))
+		t.start()
+		threadList.append(t)
+		i += 1
+
+	for t in threadList: t.join()
+	digestCache.save()
+	if(context.journal != None): context.journal.close()
+
+	print(context.stats.getSummary())
+
+	if(len(errorList) > 0):
+		raise errorList[0]
+	if(context.stats.badCount > 0):
+		raise Exception("verify failed: "
+			+ str(context.stats.badCount) + " files not valid")
+	return
+
+def verifyWorker(context, workQueue, errorList):
+	while(len(errorList) == 0):
+		try:
+			spec = workQueue.get_nowait()
+		except queue.Empty:
+			return
+
+		try:
+			verifyFile(context, spec)
+		except Exception as e:
+			errorList.append(e)
+			return
+
+def verifyFile(context, spec):
+	localPath = pathCombine2(context.outputDir, "pool")
+	localPath = pathCombine2(localPath, spec.theDir)
+	localPath = pathCombine2(localPath, spec.fileNameMinusPath)
+
+	try:
+		st = os.stat(localPath)
+	except FileNotFoundError:
+		context.stats.addResult("missing")
+		if(context.journal != None and context.journal.isDone(spec)):
+			context.journal.addFailed(spec)
+		return
+
+	reasonStr = None
+	if(spec.fileSize != None and st.st_size != spec.fileSize):
+		reasonStr = "size not as expected"
+
+	if(reasonStr == None and spec.sha256 == None):
+		context.stats.addResult("noHash")
+		return
+
+	if(reasonStr == None):
+		sha256 = context.digestCache.get(localPath, st)
+		if(sha256 == None):
+			sha256 = getFileSha256(localPath)
+			context.stats.addHashed(st.st_size)
+			# not kept, if the file changed while it was read
+			if(os.stat(localPath).st_mtime_ns == st.st_mtime_ns):
+				context.digestCache.put(localPath, st, sha256)
+
+		if(sha256 != spec.sha256):
+			reasonStr = "sha256 not as expected"
+
+	if(reasonStr != None):
+		context.stats.addResult("bad")
+		if(context.journal != None): context.journal.addFailed(spec)
+		context.printLock.acquire()
+		print("not valid: " + spec.theDir + "/" + spec.fileNameMinusPath
+			+ ": " + reasonStr)
+		context.printLock.release()
+		return
+
+	context.stats.addResult("ok")
+	return
+
+#
+# Prune functions
+#
+
+# files are removed in batches of up to this many, all in one dir
+PRUNE_BATCH_SIZE = 256
+
+class PruneStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.startTime = time.time()
+		self.fileCount = 0
+		self.byteCount = 0
+		self.keptCount = 0
+		self.dirCount = 0
+
+	def addRemoved(self, byteCount):
+		self.lock.acquire()
+		self.fileCount += 1
+		if(byteCount != None): self.byteCount += byteCount
+		self.lock.release()
+
+	def getSummary(self):
+		seconds = time.time() - self.startTime
+		return ("Removed " + str(self.fileCount) + " files"
+			+ " (" + ("%.1f" % (self.byteCount / 1000000.0)) + " MB)"
+			+ ", kept old versions " + str(self.keptCount)
+			+ ", removed empty dirs " + str(self.dirCount)
+			+ " in " + ("%.1f" % seconds) + " s")
+
+class PruneContext:
+	def __init__(self):
+		self.poolDir = None
+		self.journal = None
+		self.stats = None
+		self.printLock = threading.Lock()
+
+def pruneFiles(outputDir, myList, keepCount, jobCount, isDryRun):
+	# Removes the files in the pool, that are not in the list,
+	# but keeps the keepCount newest of them for each package.
+	# The list must be sorted, like sortList2 does it.
+	# With isDryRun, the files are only printed.
+	context = PruneContext()
+	context.poolDir = pathCombine2(os.path.abspath(outputDir), "pool")
+	context.stats = PruneStats()
+
+	localList = scanPoolFiles(context.poolDir, jobCount)
+
+	timer = startStage("compare")
+	specIter = iterUnreferencedFiles(localList, myList)
+	if(keepCount > 0):
+		specIter = iterPrunedVersions(specIter, keepCount, context.stats)
+	pruneList = list(specIter)
+	endStage(timer, len(localList), 0)
+
+	pruneBytes = 0
+	for spec in pruneList:
+		if(spec.fileSize != None): pruneBytes += spec.fileSize
+
+	if(isDryRun):
+		for spec in pruneList:
+			print(pathCombine2(spec.theDir, spec.fileNameMinusPath))
+
+	print("Files to remove: " + str(len(pruneList))
+		+ " of " + str(len(localList))
+		+ ", " + ("%.1f" % (pruneBytes / 1000000.0)) + " MB"
+		+ ", kept old versions " + str(context.stats.keptCount))
+	if(isDryRun): return
+
+	# so --download gets a removed file again,
+	# if it is in a later list
+	journalPath = pathCombine2(os.path.abspath(outputDir), "download-journal.csv")
+	if(fileExists(journalPath)):
+		context.journal = DownloadJournal(journalPath)
+
+	# the list is sorted, so the files of a dir are next to each other
+	workQueue = queue.Queue()
+	dirSet = set()
+	batchList = []
+	for spec in pruneList:
+		if(len(batchList) > 0 and (spec.theDir != batchList[0].theDir
+			or len(batchList) >= PRUNE_BATCH_SIZE)):
+
+			workQueue.put(batchList)
+			batchList = []
+		batchList.append(spec)
+		dirSet.add(spec.theDir)
+	if(len(batchList) > 0): workQueue.put(batchList)
+
+	failedList = []
+	timer = startStage("prune")
+	try:
+		threadList = []
+		i = 0
+		while(i < jobCount):
+			t = threading.Thread(target=pruneWorker,
+				args=(context, workQueue, failedList))
+			t.start()
+			threadList.append(t)
+			i += 1
+
+		for t in threadList: t.join()
+	finally:
+		if(context.journal != None): context.journal.close()
+	removeEmptyDirs(context, dirSet)
+	endStage(timer, context.stats.fileCount, context.stats.byteCount)
+	addStatsCounter("filesRemoved", context.stats.fileCount)
+	addStatsCounter("bytesRemoved", context.stats.byteCount)
+
+	print(context.stats.getSummary())
+
+	if(len(failedList) > 0):
+		raise Exception("prune failed for " + str(len(failedList)) + " files"
+			+ ", first error: " + str(failedList[0][1]))
+	return
+
+def scanPoolFiles(poolDir, jobCount):
+	# The files in a download pool, with theDir relative to the pool,
+	# sorted like sortList2 does it
+	print("Scanning pool: " + poolDir)
+
+	timer = startStage("scan")
+	prefixLen = len(poolDir) + 1
+	localList = []
+	for spec in getPoolFileList(poolDir, jobCount):
+		spec.theDir = spec.theDir[prefixLen:]
+		localList.append(spec)
+	localList.sort(key=getSpecSortKey)
+	endStage(timer, len(localList), 0)
+
+	print("Files in pool: " + str(len(localList)))
+	return localList
+
+def iterUnreferencedFiles(localList, myList):
+	# One merge pass over the two sorted lists,
+	# gives the files of the pool, that are not in the list.
+	# The segments file of a download, that is in the list, is kept.
+	listIter = iter(myList)
+	listKey = getNextSpecSortKey(listIter)
+	refDir = None
+	refNameSet = set()
+	for spec in localList:
+		key = getSpecSortKey(spec)
+		while(listKey != None and listKey < key):
+			listKey = getNextSpecSortKey(listIter)
+
+		if(spec.theDir != refDir):
+			refDir = spec.theDir
+			refNameSet = set()
+
+		if(listKey == key):
+			refNameSet.add(spec.fileNameMinusPath)
+			continue
+
+		name = spec.fileNameMinusPath
+		if(name.endswith(DOWNLOAD_SEGMENTS_SUFFIX)
+			and name[:-len(DOWNLOAD_SEGMENTS_SUFFIX)] in refNameSet):
+
+			continue
+
+		yield spec
+	return
+
+def getNextSpecSortKey(listIter):
+	# None at the end of the list
+	for spec in listIter: return getSpecSortKey(spec)
+	return None
+
+def iterPrunedVersions(specIter, keepCount, stats):
+	# Of the sorted files, that are not in the list, gives the ones
+	# to remove. Of the files with the same theDir, package name
+	# and tail kind, the keepCount newest versions are kept.
+	# A package's files are next to each other, like in iterNewestVersions.
+	runKey = None
+	runList = []
+	for spec in specIter:
+		parts = getDebianNameParts(spec.fileNameMinusPath)
+		key = None
+		if(parts != None): key = (spec.theDir, parts[0])
+		if(key != runKey or key == None):
+			for item in iterPrunedRun(runList, keepCount, stats): yield item
+			runKey = key
+			runList = []
+
+		if(parts == None):
+			yield spec
+			continue
+		runList.append((parts, spec))
+
+	for item in iterPrunedRun(runList, keepCount, stats): yield item
+	return
+
+def iterPrunedRun(runList, keepCount, stats):
+	# One package of iterPrunedVersions.
+	# Files that are not a version, and downloads with segments left,
+	# are not kept.
+	segmentSet = set()
+	for parts, spec in runList:
+		if(spec.fileNameMinusPath.endswith(DOWNLOAD_SEGMENTS_SUFFIX)):
+			segmentSet.add(spec.fileNameMinusPath)
+
+	versionKeys = {}
+	groupDict = {}
+	pruneList = []
+	for parts, spec in runList:
+		name = spec.fileNameMinusPath
+		if(name.endswith(DOWNLOAD_SEGMENTS_SUFFIX)
+			or name + DOWNLOAD_SEGMENTS_SUFFIX in segmentSet):
+
+			pruneList.append(spec)
+			continue
+
+		versionKey = versionKeys.get(parts[1])
+		if(versionKey == None):
+			try:
+				versionKey = getDebianVersionKey(parts[1])
+			except Exception:
+				pruneList.append(spec)
+				continue
+			versionKeys[parts[1]] = versionKey
+
+		groupList = groupDict.get(parts[2])
+		if(groupList == None):
+			groupList = []
+			groupDict[parts[2]] = groupList
+		groupList.append((versionKey, spec))
+
+	for groupList in groupDict.values():
+		groupList.sort(key=lambda item: item[0], reverse=True)
+		stats.keptCount += min(keepCount, len(groupList))
+		for versionKey, spec in groupList[keepCount:]: pruneList.append(spec)
+
+	# in sorted order, like the list
+	pruneList.sort(key=getSpecSortKey)
+	for spec in pruneList: yield spec
+	return
+
+def pruneWorker(context, workQueue, failedList):
+	# A file that cannot be removed is in failedList,
+	# and the other files are still removed
+	while(True):
+		try:
+			batchList = workQueue.get_nowait()
+		except queue.Empty:
+			return
+
+		pruneBatch(context, batchList, failedList)
+
+def pruneBatch(context, batchList, failedList):
+	# The files are all in one dir, which is opened once,
+	# so each file is removed without its path being looked up again
+	dirPath = pathCombine2(context.poolDir, batchList[0].theDir)
+	dirFd = None
+	if(os.unlink in os.supports_dir_fd):
+		try:
+			dirFd = os.open(dirPath, os.O_RDONLY)
+		except OSError:
+			dirFd = None
+
+	try:
+		for spec in batchList:
+			try:
+				if(dirFd != None): os.unlink(spec.fileNameMinusPath, dir_fd=dirFd)
+				if(dirFd == None): os.unlink(pathCombine2(dirPath, spec.fileNameMinusPath))
+			except FileNotFoundError:
+				# removed since the scan
+				pass
+			except OSError as e:
+				failedList.append((spec, e))
+				context.printLock.acquire()
+				print("failed: " + pathCombine2(spec.theDir, spec.fileNameMinusPath)
+					+ ": " + str(e))
+				context.printLock.release()
+				continue
+
+			context.stats.addRemoved(spec.fileSize)
+			if(context.journal != None): context.journal.addRemoved(spec)
+	finally:
+		if(dirFd != None): os.close(dirFd)
+
+def removeEmptyDirs(context, dirSet):
+	# The dirs files were removed from, and the dirs above them,
+	# are removed if they are empty now.
+	# The longest paths are done first, so sub dirs go before their parent.
+	for theDir in sorted(dirSet, key=len, reverse=True):
+		while(theDir != ""):
+			try:
+				os.rmdir(pathCombine2(context.poolDir, theDir))
+			except OSError:
+				# not empty, or already removed
+				break
+			context.stats.dirCount += 1
+
+			i = theDir.rfind("/")
+			if(i < 0): break
+			theDir = theDir[:i]
+
+
+#
+# Mirror index cache functions
+#
+
+class ReleaseInfo:
+	def __init__(self):
+		self.acquireByHash = False
+		# path in dist dir -> (sha256, fileSize)
+		self.sha256Files = {}
+
+def parseReleaseFile(path):
+	info = ReleaseInfo()
+	labelStr = None
+	lineNum = 0
+
+	fileObj = open(path, "r", encoding="utf-8", errors="replace")
+	for s1 in fileObj:
+		lineNum += 1
+		line = s1.rstrip()
+		if(line == ""): continue
+
+		if(line[0] == ' '):
+			if(labelStr != "SHA256"): continue
+			parts = line.split()
+			if(len(parts) != 3 or not isStringSimpleNumber(parts[1])):
+				fileObj.close()
+				print("Line Number: " + str(lineNum))
+				raise Exception("release file not valid: " + path)
+			info.sha256Files[parts[2]] = (parts[0], int(parts[1]))
+			continue
+
+		i = line.find(':')
+		if(i <= 0):
+			fileObj.close()
+			print("Line Number: " + str(lineNum))
+			raise Exception("release file not valid: " + path)
+		labelStr = line[:i]
+		if(labelStr == "Acquire-By-Hash"):
+			info.acquireByHash = (line[i + 1:].strip().lower() == "yes")
+	fileObj.close()
+	return info
+
+def getDefaultCacheDir():
+	cacheDir = os.environ.get("XDG_CACHE_HOME")
+	if(not cacheDir):
+		cacheDir = pathCombine2(os.path.expanduser("~"), ".cache")
+	return pathCombine2(cacheDir, "deblistnow")
+
+def getMirrorCacheName(mirrorInfo):
+	# Example: mirrors.xmission.com_debian
+	name = mirrorInfo.scheme
+	if(mirrorInfo.host != None): name = mirrorInfo.host
+	if(mirrorInfo.port != None): name += "_" + str(mirrorInfo.port)
+	name += mirrorInfo.basePath.replace("/", "_")
+	return name
+
+def fetchCachedFile(pool, url, cachePath, expectedHash, hashUrl):
+	# Brings the file at cachePath up to date.
+	# With the hash from Release, nothing is asked from the mirror
+	# when the cached copy has it, and the new copy is
+	# got from by-hash if it can be.
+	# Without, the cached copy is revalidated with ETag and Last-Modified.
+	# Gives True if the file was downloaded.
+	metaPath = cachePath + ".meta"
+	meta = parseDictFile(metaPath, "CachedFile")
+	if(meta != None and not fileExists(cachePath)): meta = None
+
+	if(meta != None and expectedHash != None):
+		if(meta.get("sha256") == expectedHash): return False
+
+	headers = {}
+	if(meta != None and expectedHash == None):
+		if(meta.get("etag") != None):
+			headers["If-None-Match"] = meta["etag"]
+		if(meta.get("lastModified") != None):
+			headers["If-Modified-Since"] = meta["lastModified"]
+
+	tempPath = cachePath + ".part"
+	result = None
+	if(hashUrl != None):
+		result = fetchUrlToFile(pool, hashUrl, tempPath, {})
+		# a mirror may not have by-hash files yet
+		if(result.status == 404): result = None
+	if(result == None):
+		result = fetchUrlToFile(pool, url, tempPath, headers)
+
+	if(result.status == 304): return False
+	if(result.status == 404):
+		raise Exception("http error 404: " + url)
+
+	if(expectedHash != None and result.sha256 != expectedHash):
+		os.remove(tempPath)
+		raise Exception("hash not as expected: " + url)
+
+	os.replace(tempPath, cachePath)
+
+	meta = {}
+	meta["url"] = url
+	meta["sha256"] = result.sha256
+	meta["etag"] = result.etag
+	meta["lastModified"] = result.lastModified
+	writeDictFile(metaPath, "CachedFile", meta)
+	return True
+
+def getDistCacheDir(cacheDir, mirrorInfo, distName):
+	distCacheDir = pathCombine2(cacheDir, "index")
+	distCacheDir = pathCombine2(distCacheDir, getMirrorCacheName(mirrorInfo))
+	return pathCombine2(distCacheDir, distName)
+
+def fetchReleaseInfo(pool, mirrorInfo, distName, distCacheDir):
+	# Gives None, if the mirror has no usable Release file
+	makeDirs(distCacheDir)
+	releasePath = pathCombine2(distCacheDir, "Release")
+	try:
+		fetchCachedFile(pool,
+			getMirrorUrl(mirrorInfo, "dists" + "/" + distName + "/" + "Release"),
+			releasePath, None, None)
+		return parseReleaseFile(releasePath)
+	except Exception as e:
+		print("Release not used: " + str(e))
+	return None
+
+def fetchDistFile(pool, mirrorInfo, distName, filePath, cachePath, releaseInfo):
+	# filePath is in the dist dir, like main/binary-amd64/Packages.gz
+	# Gives True if the file was downloaded.
+	distPath = "dists" + "/" + distName
+	webPath = getMirrorUrl(mirrorInfo, distPath + "/" + filePath)
+
+	expectedHash = None
+	hashUrl = None
+	if(releaseInfo != None):
+		entry = releaseInfo.sha256Files.get(filePath)
+		if(entry != None): expectedHash = entry[0]
+		if(entry != None and releaseInfo.acquireByHash):
+			hashUrl = getMirrorUrl(mirrorInfo,
+				distPath + "/" + filePath[:filePath.rfind("/")]
+				+ "/" + "by-hash" + "/" + "SHA256" + "/" + expectedHash)
+
+	return fetchCachedFile(pool, webPath, cachePath, expectedHash, hashUrl)
+
+def copyCachedFile(cachePath, localPath):
+	# a hard link is enough, cached files are only ever replaced
+	try:
+		os.link(cachePath, localPath)
+	except OSError:
+		shutil.copyfile(cachePath, localPath)
+
+
+#
+# Index patch functions
+#
+
+# Packages.diff/Index lists the patches, that bring an older
+# Packages file up to date. Each patch is an ed script, like diff --ed makes.
+
+class DiffIndexInfo:
+	def __init__(self):
+		self.currentHash = None
+		self.currentSize = None
+		# (sha256 of the file before the patch, fileSize, patch name)
+		self.historyList = []
+		# patch name -> (sha256, fileSize)
+		self.patchFiles = {}
+		self.downloadFiles = {}
+		# each patch goes from its history entry, right to the current file
+		self.isMerged = False
+
+def parseDiffIndexFile(path):
+	info = DiffIndexInfo()
+	labelStr = None
+	lineNum = 0
+
+	fileObj = open(path, "r", encoding="utf-8", errors="replace")
+	for s1 in fileObj:
+		lineNum += 1
+		line = s1.rstrip()
+		if(line == ""): continue
+
+		if(line[0] == ' '):
+			parts = line.split()
+			if(len(parts) != 3 or not isStringSimpleNumber(parts[1])):
+				fileObj.close()
+				print("Line Number: " + str(lineNum))
+				raise Exception("patch index not valid: " + path)
+
+			entry = (parts[0], int(parts[1]))
+			if(labelStr == "SHA256-History"):
+				info.historyList.append((parts[0], int(parts[1]), parts[2]))
+			if(labelStr == "SHA256-Patches"): info.patchFiles[parts[2]] = entry
+			if(labelStr == "SHA256-Download"): info.downloadFiles[parts[2]] = entry
+			continue
+
+		i = line.find(':')
+		if(i <= 0):
+			fileObj.close()
+			print("Line Number: " + str(lineNum))
+			raise Exception("patch index not valid: " + path)
+
+		labelStr = line[:i]
+		valueStr = line[(i + 1):].strip()
+
+		if(labelStr == "SHA256-Current"):
+			parts = valueStr.split()
+			if(len(parts) != 2 or not isStringSimpleNumber(parts[1])):
+				fileObj.close()
+				print("Line Number: " + str(lineNum))
+				raise Exception("patch index not valid: " + path)
+			info.currentHash = parts[0]
+			info.currentSize = int(parts[1])
+
+		if(labelStr == "X-Patch-Precedence"):
+			info.isMerged = (valueStr == "merged")
+	fileObj.close()
+	return info
+
+ED_COMMAND_PATTERN = re.compile(rb"([0-9]+)(?:,([0-9]+))?([acd])")
+
+def parseEdPatch(patchData):
+	# Gives the changes of an ed script as (start, end, lineList),
+	# lines start to end (0 based, end not included) become lineList.
+	# The script changes the last lines first,
+	# so the changes are given reversed, in ascending order.
+	patchLines = patchData.split(b"\n")
+	if(len(patchLines) > 0 and patchLines[-1] == b""): patchLines.pop()
+
+	changeList = []
+	i = 0
+	while(i < len(patchLines)):
+		cmd = patchLines[i]
+		i += 1
+
+		lineList = None
+
+		if(cmd == b"s/.//" or cmd == b"a"):
+			# A line of just "." is written as "..", then the
+			# text is ended, fixed with s/.//, and continued with a.
+			if(len(changeList) == 0 or len(changeList[-1][2]) == 0):
+				raise Exception("patch not valid: " + cmd.decode("ascii") + " without text")
+			lineList = changeList[-1][2]
+			if(cmd == b"s/.//"):
+				lineList[-1] = lineList[-1][1:]
+				continue
+
+		if(lineList == None):
+			m = ED_COMMAND_PATTERN.fullmatch(cmd)
+			if(m == None):
+				raise Exception("patch command not valid: "
+					+ cmd.decode("utf-8", "replace"))
+
+			start = int(m.group(1))
+			end = start
+			if(m.group(2) != None): end = int(m.group(2))
+			op = m.group(3)
+
+			lineList = []
+			change = (start, start, lineList)
+			if(op != b"a"):
+				if(start < 1 or end < start):
+					raise Exception("patch command not valid: "
+						+ cmd.decode("ascii"))
+				change = (start - 1, end, lineList)
+
+			if(len(changeList) > 0 and change[1] > changeList[-1][0]):
+				raise Exception("patch not valid: changes not in descending order")
+			changeList.append(change)
+
+			if(op == b"d"): continue
+
+		while(True):
+			if(i >= len(patchLines)):
+				raise Exception("patch not valid: text not ended")
+			line = patchLines[i]
+			i += 1
+			if(line == b"."): break
+			lineList.append(line)
+
+	changeList.reverse()
+	return changeList
+
+def applyEdPatch(lineList, changeList):
+	# Gives a new list of lines, lineList is not changed
+	newList = []
+	pos = 0
+	for change in changeList:
+		if(change[1] > len(lineList)):
+			raise Exception("patch not valid: line number out of range")
+		newList.extend(lineList[pos:change[0]])
+		newList.extend(change[2])
+		pos = change[1]
+	newList.extend(lineList[pos:])
+	return newList
+
+def patchIndexData(pool, mirrorInfo, distName, indexPath, diffCacheDir,
+	releaseInfo, oldData, oldHash, expectedHash):
+
+	# Brings oldData up to date, with the patches in <indexPath>.diff.
+	# Raises an exception, if the patches do not reach from oldHash
+	# to expectedHash.
+	diffPath = indexPath + ".diff"
+	makeDirs(diffCacheDir)
+
+	diffIndexPath = pathCombine2(diffCacheDir, "Index")
+	fetchDistFile(pool, mirrorInfo, distName,
+		diffPath + "/" + "Index", diffIndexPath, releaseInfo)
+	info = parseDiffIndexFile(diffIndexPath)
+
+	if(info.currentHash != expectedHash):
+		raise Exception("patch index is not for the current index")
+
+	i = 0
+	while(i < len(info.historyList)):
+		if(info.historyList[i][0] == oldHash): break
+		i += 1
+	if(i >= len(info.historyList)):
+		raise Exception("patches do not reach the cached index")
+
+	patchNameList = []
+	while(i < len(info.historyList)):
+		patchNameList.append(info.historyList[i][2])
+		i += 1
+	if(info.isMerged): patchNameList = patchNameList[:1]
+
+	lineList = oldData.split(b"\n")
+	if(len(lineList) > 0 and lineList[-1] == b""): lineList.pop()
+
+	for patchName in patchNameList:
+		entry = info.downloadFiles.get(patchName + ".gz")
+		if(entry == None):
+			raise Exception("patch not in patch index: " + patchName)
+
+		patchUrl = getMirrorUrl(mirrorInfo, "dists" + "/" + distName
+			+ "/" + diffPath + "/" + patchName + ".gz")
+		tempPath = pathCombine2(diffCacheDir, patchName + ".gz")
+		result = fetchUrlToFile(pool, patchUrl, tempPath, {})
+		if(result.status != 200):
+			raise Exception("http error " + str(result.status) + ": " + patchUrl)
+		if(result.sha256 != entry[0]):
+			os.remove(tempPath)
+			raise Exception("hash not as expected: " + patchUrl)
+
+		timer = startStage("decompress")
+		fileObj = gzip.open(tempPath, "rb")
+		patchData = fileObj.read()
+		fileObj.close()
+		os.remove(tempPath)
+		endStage(timer, 1, len(patchData))
+
+		entry = info.patchFiles.get(patchName)
+		if(entry != None and hashlib.sha256(patchData).hexdigest() != entry[0]):
+			raise Exception("hash not as expected: " + patchName)
+
+		lineList = applyEdPatch(lineList, parseEdPatch(patchData))
+
+	newData = b""
+	if(len(lineList) > 0): newData = b"\n".join(lineList) + b"\n"
+	if(hashlib.sha256(newData).hexdigest() != expectedHash):
+		raise Exception("patched index hash not as expected")
+
+	print("Index patched: " + str(len(patchNameList)) + " patches")
+	return newData
+
+class IndexUpdate:
+	def __init__(self):
+		self.indexCacheDir = None
+		# the index, not compressed
+		self.plainPath = None
+		self.sha256 = None
+		# set if the index changed, and there was one before
+		self.oldData = None
+		self.oldSha256 = None
+		self.newData = None
+
+def fetchMirrorIndex(cacheDir, pool, mirrorInfo, distName, component, archInfo,
+	releaseInfo):
+
+	# Gives the IndexUpdate of the cached index file, which is kept
+	# not compressed and fetched only if it changed on the mirror.
+	# It is brought up to date with patches when it can be.
+	# releaseInfo is from fetchReleaseInfo, it can be None.
+	distCacheDir = getDistCacheDir(cacheDir, mirrorInfo, distName)
+	indexCacheDir = pathCombine2(distCacheDir, component)
+	indexCacheDir = pathCombine2(indexCacheDir, archInfo.longName)
+	makeDirs(indexCacheDir)
+
+	indexPath = component + "/" + archInfo.longName + "/" + archInfo.listName
+
+	update = IndexUpdate()
+	update.indexCacheDir = indexCacheDir
+	update.plainPath = pathCombine2(indexCacheDir, archInfo.listName)
+
+	plainMeta = parseDictFile(update.plainPath + ".meta", "CachedFile")
+	if(plainMeta != None and not fileExists(update.plainPath)): plainMeta = None
+
+	expectedHash = None
+	if(releaseInfo != None):
+		entry = releaseInfo.sha256Files.get(indexPath)
+		if(entry != None): expectedHash = entry[0]
+
+	if(plainMeta != None and expectedHash != None
+		and plainMeta.get("sha256") == expectedHash):
+
+		print("Index not changed, cached: " + update.plainPath)
+		update.sha256 = expectedHash
+		return update
+
+	oldData = None
+	if(plainMeta != None):
+		fileObj = open(update.plainPath, "rb")
+		oldData = fileObj.read()
+		fileObj.close()
+
+	tempPath = update.plainPath + ".tmp"
+	newData = None
+	if(oldData != None and expectedHash != None
+		and releaseInfo.sha256Files.get(indexPath + ".diff/Index") != None):
+
+		try:
+			newData = patchIndexData(pool, mirrorInfo, distName, indexPath,
+				pathCombine2(indexCacheDir, archInfo.listName + ".diff"),
+				releaseInfo, oldData, plainMeta.get("sha256"), expectedHash)
+		except Exception as e:
+			print("Index patches not used: " + str(e))
+
+	if(newData == None):
+		print("Web path: " + getMirrorUrl(mirrorInfo,
+			"dists" + "/" + distName + "/" + indexPath + ".gz"))
+
+		gzPath = update.plainPath + ".gz"
+		isFetched = fetchDistFile(pool, mirrorInfo, distName,
+			indexPath + ".gz", gzPath, releaseInfo)
+
+		if(not isFetched and oldData != None):
+			print("Index not changed, cached: " + update.plainPath)
+			update.sha256 = plainMeta.get("sha256")
+			return update
+
+		print("Index downloaded: " + gzPath)
+		timer = startStage("decompress")
+		update.sha256 = unzipFileWithSha256(gzPath, tempPath)
+		endStage(timer, 1, getFileSize(tempPath))
+
+	if(newData != None):
+		update.sha256 = hashlib.sha256(newData).hexdigest()
+		fileObj = open(tempPath, "wb")
+		fileObj.write(newData)
+		fileObj.close()
+
+	if(expectedHash != None and update.sha256 != expectedHash):
+		os.remove(tempPath)
+		raise Exception("index hash not as expected: " + indexPath)
+	os.replace(tempPath, update.plainPath)
+
+	meta = {}
+	meta["sha256"] = update.sha256
+	writeDictFile(update.plainPath + ".meta", "CachedFile", meta)
+
+	if(oldData != None):
+		# only the changed packages are parsed, which needs both indexes
+		if(newData == None):
+			fileObj = open(update.plainPath, "rb")
+			newData = fileObj.read()
+			fileObj.close()
+		update.oldData = oldData
+		update.oldSha256 = plainMeta.get("sha256")
+		update.newData = newData
+	return update
+
+def splitIndexStanzas(data):
+	stanzaList = []
+	for stanza in data.split(b"\n\n"):
+		stanza = stanza.strip(b"\n")
+		if(stanza != b""): stanzaList.append(stanza)
+	return stanzaList
+
+def getStanzaPackageName(stanza):
+	# the first line is Package: name
+	i = stanza.find(b"\n")
+	if(i < 0): i = len(stanza)
+	return stanza[len(b"Package:"):i].strip()
+
+def iterPackagesFromStanzas(stanzaList):
+	text = b"\n\n".join(stanzaList).decode("utf-8")
+	return iterPackagesFromIndex(text.split("\n"))
+
+def updateListFromIndexDiff(oldList, oldData, newData):
+	# Gives the list of newData, from oldList, the list of oldData.
+	# Only the packages that changed are parsed.
+	timer = startStage("convert")
+	oldStanzas = set(splitIndexStanzas(oldData))
+	newStanzaList = splitIndexStanzas(newData)
+	newStanzas = set(newStanzaList)
+
+	removedList = [stanza for stanza in oldStanzas if stanza not in newStanzas]
+	addedList = [stanza for stanza in newStanzaList if stanza not in oldStanzas]
+	print("Changed packages: " + str(len(removedList)) + " removed, "
+		+ str(len(addedList)) + " added")
+
+	# A file can be in more than one package, like an orig tarball
+	# in two versions of a source package,
+	# so it stays while a package of that name still has it.
+	# The files of those packages are found like for the list,
+	# so only whole names, in the same dir, match.
+	pkgNames = set()
+	for stanza in removedList: pkgNames.add(getStanzaPackageName(stanza))
+	keptList = []
+	for stanza in newStanzaList:
+		if(getStanzaPackageName(stanza) in pkgNames): keptList.append(stanza)
+
+	keptKeys = set()
+	for spec in iterRegularListFromPackageList(
+		iterPackagesFromStanzas(keptList), [0]):
+
+		keptKeys.add(getSpecSortKey(spec))
+
+	counter = [0]
+	removedSpecs = []
+	for spec in iterRegularListFromPackageList(
+		iterPackagesFromStanzas(removedList), counter):
+
+		if(getSpecSortKey(spec) not in keptKeys): removedSpecs.append(spec)
+
+	addedSpecs = list(iterRegularListFromPackageList(
+		iterPackagesFromStanzas(addedList), counter))
+	endStage(timer, len(removedSpecs) + len(addedSpecs), 0)
+
+	replaceBackslash(removedSpecs)
+	removeNonRepoFiles(removedSpecs)
+	replaceBackslash(addedSpecs)
+	removeNonRepoFiles(addedSpecs)
+
+	removedKeys = set()
+	for spec in removedSpecs: removedKeys.add(getSpecSortKey(spec))
+
+	myList = []
+	for spec in oldList:
+		if(getSpecSortKey(spec) not in removedKeys): myList.append(spec)
+	myList.extend(addedSpecs)
+	return sortList2(myList)
+
+# The version of the way lists are made from indexes,
+# a list cached by an older version is not used
+LIST_CACHE_VERSION = 2
+
+class ListSnapshotCache:
+	# The sorted lists made from indexes, as list1.bin files,
+	# by the sha256 of the index.
+	# When the files are bigger than maxSize, the least recently used go.
+	def __init__(self, cacheDir, maxSize):
+		self.snapshotDir = pathCombine2(cacheDir, "lists")
+		self.maxSize = maxSize
+		self.lock = threading.Lock()
+		# not removed while this run uses them
+		self.usedPaths = set()
+		makeDirs(self.snapshotDir)
+
+	def getPath(self, indexSha256):
+		return pathCombine2(self.snapshotDir,
+			indexSha256 + "-" + "v" + str(LIST_CACHE_VERSION) + ".bin")
+
+	def get(self, indexSha256):
+		# Gives a BinaryListView, or None
+		path = self.getPath(indexSha256)
+		self.lock.acquire()
+		try:
+			if(not fileExists(path)): return None
+			# the modified time is the last used time
+			os.utime(path)
+			self.usedPaths.add(path)
+		finally:
+			self.lock.release()
+		return BinaryListView(path)
+
+	def put(self, indexSha256, myList):
+		path = self.getPath(indexSha256)
+		# two indexes can be the same, so each write has its own temp file
+		tempPath = path + "." + str(threading.get_ident()) + ".tmp"
+		writeListToBinaryFile(tempPath, myList)
+
+		self.lock.acquire()
+		try:
+			os.replace(tempPath, path)
+			self.usedPaths.add(path)
+			self.removeOld()
+		finally:
+			self.lock.release()
+
+	def removeOld(self):
+		fileList = []
+		totalSize = 0
+		for entry in os.scandir(self.snapshotDir):
+			if(not entry.name.endswith(".bin")): continue
+			st = entry.stat()
+			fileList.append((st.st_mtime, entry.path, st.st_size))
+			totalSize += st.st_size
+
+		fileList.sort()
+		for item in fileList:
+			if(totalSize <= self.maxSize): break
+			if(item[1] in self.usedPaths): continue
+			os.remove(item[1])
+			totalSize -= item[2]
+
+def makeListFromIndexUpdate(update, snapshotCache):
+	# Gives the sorted list of the index.
+	# A list made before, for the same index, is used as it is.
+	# For a changed index, the list of the index before
+	# is only changed where the index changed.
+	myList = snapshotCache.get(update.sha256)
+	if(myList != None):
+		print("List not changed, cached: " + myList.path)
+		return myList
+
+	if(update.oldData != None):
+		oldList = snapshotCache.get(update.oldSha256)
+		if(oldList != None):
+			myList = updateListFromIndexDiff(oldList, update.oldData, update.newData)
+			oldList.close()
+
+	if(myList == None):
+		fileObj = open(update.plainPath, "r")
+		myList = makeRegularListFromPackageList(
+			iterStage("parse", iterPackagesFromIndex(fileObj)))
+		fileObj.close()
+		replaceBackslash(myList)
+		removeNonRepoFiles(myList)
+		myList = sortList2(myList)
+
+	snapshotCache.put(update.sha256, myList)
+	return myList
+
+
+#
+# List daemon functions
+#
+
+# seconds a client has to send its request, and to read the answer,
+# as a connection that hangs would hold up all the others
+DAEMON_CONNECTION_TIMEOUT = 10.0
+
+class DaemonList:
+	# A list dir, kept in memory sorted,
+	# with the stat of its files, to see when it changes
+	def __init__(self):
+		self.name = None
+		self.listDir = None
+		self.myList = None
+		self.fileStats = None
+		# from makeDebianNameIndex, made when first needed
+		self.nameIndex = None
+
+	def getFileStats(self):
+		fileStats = []
+		for fileName in ("list1.csv", "list1.bin"):
+			try:
+				st = os.stat(pathCombine2(self.listDir, fileName))
+				fileStats.append((st.st_ino, st.st_size, st.st_mtime_ns))
+			except FileNotFoundError:
+				fileStats.append(None)
+		return fileStats
+
+	def load(self):
+		print("Loading list: " + self.name + ": " + self.listDir)
+		fileStats = self.getFileStats()
+		myList = sortListIfNeeded(openListFromDir(self.listDir))
+		self.close()
+		self.myList = myList
+		self.fileStats = fileStats
+		self.nameIndex = None
+
+	def loadIfChanged(self):
+		if(self.myList == None or self.getFileStats() != self.fileStats):
+			self.load()
+
+	def getNameIndex(self):
+		if(self.nameIndex == None):
+			self.nameIndex = makeDebianNameIndex(self.myList)
+		return self.nameIndex
+
+	def find(self, theDir, fileName):
+		# Gives the spec, or None, with a binary search
+		key = theDir + "\0" + fileName
+		low = 0
+		high = len(self.myList)
+		while(low < high):
+			middle = (low + high) // 2
+			spec = self.myList[middle]
+			middleKey = getSpecSortKey(spec)
+			if(middleKey == key): return spec
+			if(middleKey < key): low = middle + 1
+			if(middleKey > key): high = middle
+		return None
+
+	def close(self):
+		if(isinstance(self.myList, BinaryListView)): self.myList.close()
+		self.myList = None
+
+class ListDaemon:
+	# Answers requests about named lists, over a unix socket.
+	# A request is one line of JSON, like
+	# {"command": "compare", "list1": "old", "list2": "new"},
+	# the answer is one line of JSON, with "ok" true or false.
+	# With "newestOnly": true, only the newest version of a package is given.
+	# Requests are answered one at a time.
+	def __init__(self, socketPath):
+		self.socketPath = socketPath
+		self.lists = {}
+		self.isStopped = False
+
+	def addList(self, name, listDir):
+		if(name in self.lists):
+			raise Exception("daemon list name used twice: " + name)
+		daemonList = DaemonList()
+		daemonList.name = name
+		daemonList.listDir = os.path.abspath(listDir)
+		daemonList.load()
+		self.lists[name] = daemonList
+
+	def getList(self, request, propName):
+		name = request.get(propName)
+		daemonList = self.lists.get(name)
+		if(daemonList == None):
+			raise Exception("list not found: " + str(name))
+		daemonList.loadIfChanged()
+		return daemonList
+
+	def serve(self):
+		if(os.path.exists(self.socketPath)):
+			if(not stat.S_ISSOCK(os.stat(self.socketPath).st_mode)):
+				raise Exception("daemon socket path is not a socket: " + self.socketPath)
+			os.remove(self.socketPath)
+
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			server.bind(self.socketPath)
+			os.chmod(self.socketPath, 0o600)
+			server.listen(16)
+			print("Daemon listening: " + self.socketPath)
+			while(not self.isStopped):
+				conn, addr = server.accept()
+				conn.settimeout(DAEMON_CONNECTION_TIMEOUT)
+				try:
+					self.serveConnection(conn)
+				except socket.timeout:
+					print("daemon connection timed out")
+				except OSError as e:
+					print("daemon connection failed: " + str(e))
+				finally:
+					conn.close()
+		finally:
+			server.close()
+			os.remove(self.socketPath)
+			for daemonList in self.lists.values(): daemonList.close()
+
+	def serveConnection(self, conn):
+		fileObj = conn.makefile("rwb")
+		try:
+			line = fileObj.readline()
+			try:
+				request = json.loads(line.decode("utf-8"))
+				if(not isinstance(request, dict)):
+					raise Exception("request not valid")
+				response = self.handleRequest(request)
+				response["ok"] = True
+			except Exception as e:
+				response = {"ok": False, "error": str(e)}
+			fileObj.write(json.dumps(response).encode("utf-8") + b"\n")
+			fileObj.flush()
+		finally:
+			fileObj.close()
+
+	def handleRequest(self, request):
+		command = request.get("command")
+
+		if(command == "lists"):
+			listDict = {}
+			for name in sorted(self.lists.keys()):
+				daemonList = self.lists[name]
+				daemonList.loadIfChanged()
+				listDict[name] = {
+					"listDir": daemonList.listDir,
+					"length": len(daemonList.myList),
+				}
+			return {"lists": listDict}
+
+		if(command == "reload"):
+			for daemonList in self.lists.values(): daemonList.load()
+			return {}
+
+		if(command == "contains"):
+			daemonList = self.getList(request, "list")
+			theDir = request.get("theDir")
+			fileName = request.get("fileNameMinusPath")
+			if(not isinstance(theDir, str) or not isinstance(fileName, str)):
+				raise Exception("contains needs theDir and fileNameMinusPath")
+			spec = daemonList.find(theDir, fileName)
+			if(spec == None): return {"found": False}
+			return {"found": True, "fileSize": spec.fileSize, "sha256": spec.sha256}
+
+		if(command == "compare" or command == "find-updates"):
+			daemonList1 = self.getList(request, "list1")
+			daemonList2 = self.getList(request, "list2")
+			if(command == "compare"):
+				specIter = compareListsStreamed(daemonList1.myList,
+					daemonList2.myList, daemonList1.name, daemonList2.name)
+			if(command == "find-updates"):
+				specIter = compareListsIndexed(daemonList1.getNameIndex(),
+					daemonList2.myList)
+			return self.writeResult(request, specIter)
+
+		if(command == "export"):
+			daemonList = self.getList(request, "list")
+			return self.writeResult(request, daemonList.myList)
+
+		if(command == "stop"):
+			self.isStopped = True
+			return {}
+
+		raise Exception("command not supported: " + str(command))
+
+	def writeResult(self, request, specIter):
+		# Without an outputDir, only the length is given
+		if(request.get("newestOnly") == True):
+			specIter = iterNewestVersions(specIter)
+		outputDir = request.get("outputDir")
+		if(outputDir == None):
+			specCount = 0
+			for spec in specIter: specCount += 1
+			return {"length": specCount}
+
+		if(not isinstance(outputDir, str) or not os.path.isabs(outputDir)):
+			raise Exception("outputDir must be an absolute path")
+		if(dirExists2(outputDir)):
+			raise Exception("outputDir already exists: " + outputDir)
+		specCount = writeListToDir(outputDir, specIter)
+		return {"length": specCount, "outputDir": outputDir}
+
+def sendDaemonRequest(socketPath, requestStr):
+	# Gives the answer of the daemon, as a dict
+	request = json.loads(requestStr)
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		client.connect(socketPath)
+		fileObj = client.makefile("rwb")
+		fileObj.write(json.dumps(request).encode("utf-8") + b"\n")
+		fileObj.flush()
+		line = fileObj.readline()
+		fileObj.close()
+	finally:
+		client.close()
+
+	if(line == b""):
+		raise Exception("daemon gave no answer: " + socketPath)
+	return json.loads(line.decode("utf-8"))
+
+
+#
+# Benchmark functions
+#
+
+def getPoolPrefix(srcName):
+	if(srcName.startswith("lib") and len(srcName) > 3):
+		return srcName[0:4]
+	return srcName[0:1]
+
+def makeSyntheticList(count, seed):
+	# Builds a shuffled list that looks like a debian pool,
+	# with some duplicates in it
+	rand = random.Random(seed)
+	components = ["main", "main", "main", "contrib", "non-free"]
+	namePrefixes = ["lib", "python3-", "golang-", "node-", "r-cran-", ""]
+	archNames = ["amd64", "amd64", "i386", "all"]
+
+	myList = []
+	i = 0
+	while(len(myList) < count):
+		srcName = (namePrefixes[rand.randrange(len(namePrefixes))]
+			+ "abcdefghijklmnopqrstuvwxyz"[rand.randrange(26)]
+			+ "pkg" + str(i))
+		theDir = (components[rand.randrange(len(components))]
+			+ "/" + getPoolPrefix(srcName)
+			+ "/" + srcName)
+		version = (str(rand.randrange(10)) + "." + str(rand.randrange(100))
+			+ "-" + str(rand.randrange(1, 5)))
+
+		j = 0
+		binCount = rand.randrange(1, 6)
+		while(j < binCount):
+			spec = RepoFileSpec()
+			spec.theDir = theDir
+			spec.fileNameMinusPath = (srcName + "-bin" + str(j)
+				+ "_" + version
+				+ "_" + archNames[rand.randrange(len(archNames))] + ".deb")
+			spec.fileSize = rand.randrange(1000, 50000000)
+			myList.append(spec)
+
+			if(rand.randrange(20) == 0):
+				spec2 = RepoFileSpec()
+				spec2.theDir = spec.theDir
+				spec2.fileNameMinusPath = spec.fileNameMinusPath
+				spec2.fileSize = spec.fileSize
+				myList.append(spec2)
+
+			j += 1
+
+		i += 1
+
+	del myList[count:]
+	rand.shuffle(myList)
+	return myList
+
+def benchmarkSort(countList):
+	print("Benchmarking sort...")
+
+	for count in countList:
+		myList = makeSyntheticList(count, count)
+
+		startTime = time.perf_counter()
+		myList2 = sortList2(myList)
+		sortTime = time.perf_counter() - startTime
+		print("sortList2: count=" + str(count)
+			+ " unique=" + str(len(myList2))
+			+ " seconds=" + ("%.3f" % sortTime))
+	return
+
+def benchmarkMemory(countList):
+	# Memory of a plain list of RepoFileSpec,
+	# against the same list in a ListStore
+	print("Benchmarking list memory...")
+
+	for count in countList:
+		myList = makeSyntheticList(count, count)
+		fileSizeList = []
+		for spec in myList:
+			fileSizeList.append(spec.fileSize)
+
+		tracemalloc.start()
+		myList2 = []
+		for spec in myList:
+			spec2 = RepoFileSpec()
+			spec2.theDir = "".join(spec.theDir)
+			spec2.fileNameMinusPath = "".join(spec.fileNameMinusPath)
+			spec2.fileSize = spec.fileSize
+			myList2.append(spec2)
+		listBytes = tracemalloc.get_traced_memory()[0]
+		del myList2
+		tracemalloc.stop()
+
+		tracemalloc.start()
+		store = ListStore()
+		for spec in myList:
+			spec2 = RepoFileSpec()
+			spec2.theDir = "".join(spec.theDir)
+			spec2.fileNameMinusPath = "".join(spec.fileNameMinusPath)
+			spec2.fileSize = spec.fileSize
+			store.append(spec2)
+		storeBytes = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+
+		print("memory: count=" + str(count)
+			+ " list MB=" + ("%.1f" % (listBytes / 1000000.0))
+			+ " ListStore MB=" + ("%.1f" % (storeBytes / 1000000.0)))
+
+		startTime = time.perf_counter()
+		store2 = sortList2(store)
+		sortTime = time.perf_counter() - startTime
+		print("ListStore sort: count=" + str(count)
+			+ " unique=" + str(len(store2))
+			+ " seconds=" + ("%.3f" % sortTime))
+
+		if(count <= 500000):
+			myList3 = sortList2(myList)
+			if(list(map(getSpecTuple, myList3))
+				!= list(map(getSpecTuple, store2))):
+
+				raise Exception("sort results differ, count: " + str(count))
+	return
+
+def getSpecTuple(spec):
+	return (spec.theDir, spec.fileNameMinusPath, spec.fileSize)
+
+def benchmarkListLoad(countList):
+	print("Benchmarking list loading...")
+
+	for count in countList:
+		myList = sortList2(makeSyntheticList(count, count))
+
+		tempDir = tempfile.mkdtemp()
+		listPath = pathCombine2(tempDir, "list1.csv")
+		fileObj = open(listPath, "w")
+		writeListToFile(fileObj, myList)
+		fileObj.close()
+		megaBytes = os.path.getsize(listPath) / 1000000.0
+
+		fileObj = open(listPath, "r")
+		startTime = time.perf_counter()
+		myList2 = parseListFromFile(fileObj)
+		loadTime = time.perf_counter() - startTime
+		fileObj.close()
+
+		rate = megaBytes / loadTime
+		resultStr = "ok"
+		if(rate < LIST_LOAD_TARGET_MBS): resultStr = "below target"
+		print("parseListFromFile: count=" + str(count)
+			+ " MB=" + ("%.1f" % megaBytes)
+			+ " seconds=" + ("%.3f" % loadTime)
+			+ " MB/s=" + ("%.1f" % rate)
+			+ " target=" + str(LIST_LOAD_TARGET_MBS)
+			+ " " + resultStr)
+
+		if(len(myList2) != len(myList)):
+			raise Exception("load count not valid, count: " + str(count))
+
+		os.remove(listPath)
+		os.rmdir(tempDir)
+	return
+
+
+#
+# Benchmark suite functions
+#
+
+BENCHMARK_FORMAT_VERSION = 1
+# a time this much over the baseline is a regression
+BENCHMARK_REGRESSION_FACTOR = 1.25
+# times below this are too short to say anything
+BENCHMARK_MIN_SECONDS = 0.05
+# small counts are timed more than once, and the best time is kept
+BENCHMARK_REPEAT_MAX_COUNT = 50000
+BENCHMARK_REPEAT_COUNT = 3
+# threads for getFileList, like the --jobs default
+BENCHMARK_JOB_COUNT = 4
+
+def iterSyntheticPackages(count, seed):
+	# Gives (component, srcName, version, binNames) for each source,
+	# named like in makeSyntheticList,
+	# until there are count binaries, up to 5 for a source
+	rand = random.Random(seed)
+	components = ["main", "main", "main", "contrib", "non-free"]
+	namePrefixes = ["lib", "python3-", "golang-", "node-", "r-cran-", ""]
+
+	binCount = 0
 	i = 0
-	pLen = len(pkgList)
-	myList = []
-	while(i < pLen):
-		pkg = pkgList[i]
+	while(binCount < count):
+		srcName = (namePrefixes[rand.randrange(len(namePrefixes))]
+			+ "abcdefghijklmnopqrstuvwxyz"[rand.randrange(26)]
+			+ "pkg" + str(i))
+		version = (str(rand.randrange(10)) + "." + str(rand.randrange(100))
+			+ "-" + str(rand.randrange(1, 5)))
+
+		binNames = []
+		srcBinCount = rand.randrange(1, 6)
+		j = 0
+		while(j < srcBinCount and binCount < count):
+			binNames.append(srcName + "-bin" + str(j))
+			binCount += 1
+			j += 1
 
-		if(pkg.fileName != None):
-			spec = RepoFileSpec()
-			spec.fileName = pkg.fileName
-			spec.calc()
-			spec.fileSize = pkg.fileSize
+		yield (components[rand.randrange(len(components))],
+			srcName, version, binNames)
+		i += 1
+	return
 
-			myList.append(spec)
-			
-			i += 1
-			continue
-		
-		if(pkg.theDir != None):
-			j = 0
-			
-			if(len(pkg.files) != len(pkg.fileSizes)):
-				raise Exception("pkg not valid: file sizes not valid")
-			
-			while(j < len(pkg.files)):
-				spec = RepoFileSpec()
-				spec.theDir = pkg.theDir
-				spec.fileNameMinusPath = pkg.files[j]
-				spec.fileSize = pkg.fileSizes[j]
-				
-				myList.append(spec)
-			
-				j += 1
-				continue
-			
-			i += 1
-			continue
-		
-		raise Exception("pkg not valid")
-	
-	return myList
+def makeSyntheticPackagesText(count, seed):
+	# A Packages index with count stanzas
+	rand = random.Random(seed)
+	archNames = ["amd64", "amd64", "i386", "all"]
+	parts = []
+	for component, srcName, version, binNames in iterSyntheticPackages(count, seed):
+		theDir = "pool/" + component + "/" + getPoolPrefix(srcName) + "/" + srcName
+		for binName in binNames:
+			archName = archNames[rand.randrange(len(archNames))]
+			parts.append("Package: " + binName + NEWLINE
+				+ "Source: " + srcName + NEWLINE
+				+ "Version: " + version + NEWLINE
+				+ "Installed-Size: " + str(rand.randrange(10, 100000)) + NEWLINE
+				+ "Maintainer: Debian Synthetic <synthetic@lists.debian.org>" + NEWLINE
+				+ "Architecture: " + archName + NEWLINE
+				+ "Depends: libc6 (>= 2.36), " + srcName + "-common (= " + version + ")" + NEWLINE
+				+ "Description: synthetic package " + binName + NEWLINE
+				+ "Section: misc" + NEWLINE
+				+ "Priority: optional" + NEWLINE
+				+ "Filename: " + theDir + "/" + binName + "_" + version + "_" + archName + ".deb" + NEWLINE
+				+ "Size: " + str(rand.randrange(1000, 50000000)) + NEWLINE
+				+ "SHA256: " + ("%064x" % rand.getrandbits(256)) + NEWLINE
+				+ NEWLINE)
+	return "".join(parts)
+
+def makeSyntheticSourcesText(count, seed):
+	# A Sources index with count stanzas
+	rand = random.Random(seed)
+	parts = []
+	srcCount = 0
+	for component, srcName, version, binNames in iterSyntheticPackages(count * 5, seed):
+		if(srcCount >= count): break
+		srcCount += 1
+
+		upstream = version[:version.find("-")]
+		fileList = [
+			(srcName + "_" + version + ".dsc", rand.randrange(1000, 5000)),
+			(srcName + "_" + upstream + ".orig.tar.xz", rand.randrange(10000, 500000000)),
+			(srcName + "_" + version + ".debian.tar.xz", rand.randrange(1000, 100000)),
+		]
+		filesStr = ""
+		shaStr = ""
+		for fileName, fileSize in fileList:
+			filesStr += (" " + ("%032x" % rand.getrandbits(128))
+				+ " " + str(fileSize) + " " + fileName + NEWLINE)
+			shaStr += (" " + ("%064x" % rand.getrandbits(256))
+				+ " " + str(fileSize) + " " + fileName + NEWLINE)
+
+		parts.append("Package: " + srcName + NEWLINE
+			+ "Binary: " + ", ".join(binNames) + NEWLINE
+			+ "Version: " + version + NEWLINE
+			+ "Maintainer: Debian Synthetic <synthetic@lists.debian.org>" + NEWLINE
+			+ "Architecture: any" + NEWLINE
+			+ "Format: 3.0 (quilt)" + NEWLINE
+			+ "Files:" + NEWLINE + filesStr
+			+ "Checksums-Sha256:" + NEWLINE + shaStr
+			+ "Directory: pool/" + component + "/" + getPoolPrefix(srcName) + "/" + srcName + NEWLINE
+			+ "Priority: optional" + NEWLINE
+			+ "Section: misc" + NEWLINE
+			+ NEWLINE)
+	return "".join(parts)
+
+def copySpecList(myList):
+	myList2 = []
+	for spec in myList:
+		spec2 = RepoFileSpec()
+		spec2.theDir = spec.theDir
+		spec2.fileNameMinusPath = spec.fileNameMinusPath
+		spec2.fileSize = spec.fileSize
+		spec2.sha256 = spec.sha256
+		myList2.append(spec2)
+	return myList2
 
+class BenchmarkData:
+	# The inputs for one count, made once for all benchmarks
+	def __init__(self):
+		self.count = None
+		self.tempDir = None
+		# sorted, without duplicates
+		self.myList = None
+		# like myList, a tenth removed, and as many added
+		self.myList2 = None
+		self.listPath = None
+
+def makeBenchmarkData(count, tempDir):
+	data = BenchmarkData()
+	data.count = count
+	data.tempDir = tempDir
+	data.myList = sortList2(makeSyntheticList(count, count))
 
-#
-# Download functions
-#
+	myList2 = []
+	i = 0
+	while(i < len(data.myList)):
+		if(i % 10 != 0): myList2.append(data.myList[i])
+		i += 1
+	myList2.extend(makeSyntheticList(count // 10, count + 1))
+	data.myList2 = sortList2(myList2)
+
+	data.listPath = pathCombine2(tempDir, "list1.csv")
+	fileObj = open(data.listPath, "w")
+	writeListToFile(fileObj, data.myList)
+	fileObj.close()
+	return data
 
-def downloadFiles(outputDir, mirror, myList):
-	relDir = os.getcwd()
+def benchMakeListFromIndex(data, text):
+	# like makeListFromIndexUpdate, from an index the cache has unzipped
+	indexPath = pathCombine2(data.tempDir, "index")
+	fileObj = open(indexPath, "w")
+	fileObj.write(text)
+	fileObj.close()
+
+	startTime = time.perf_counter()
+	fileObj = open(indexPath, "r")
+	myList = makeRegularListFromPackageList(iterPackagesFromIndex(fileObj))
+	fileObj.close()
+	seconds = time.perf_counter() - startTime
+
+	os.remove(indexPath)
+	if(len(myList) < data.count):
+		raise Exception("benchmark list count not valid: " + str(len(myList)))
+	return seconds
+
+def benchMakeListFromPackages(data):
+	return benchMakeListFromIndex(data,
+		makeSyntheticPackagesText(data.count, data.count))
+
+def benchMakeListFromSources(data):
+	return benchMakeListFromIndex(data,
+		makeSyntheticSourcesText(data.count, data.count))
+
+def benchIterListFromFile(data):
+	fileObj = open(data.listPath, "r")
+	startTime = time.perf_counter()
+	specCount = 0
+	for spec in iterListFromFile(fileObj): specCount += 1
+	seconds = time.perf_counter() - startTime
+	fileObj.close()
+	return seconds
+
+def benchWriteListToDir(data):
+	listDir = pathCombine2(data.tempDir, "list2")
+	startTime = time.perf_counter()
+	writeListToDir(listDir, data.myList)
+	seconds = time.perf_counter() - startTime
+	shutil.rmtree(listDir)
+	return seconds
+
+def benchOpenListFromDir(data):
+	# the binary list, read all through
+	listDir = pathCombine2(data.tempDir, "list2")
+	writeListToDir(listDir, data.myList)
+
+	startTime = time.perf_counter()
+	myList = openListFromDir(listDir)
+	specCount = 0
+	for spec in myList: specCount += 1
+	seconds = time.perf_counter() - startTime
+
+	if(isinstance(myList, BinaryListView)): myList.close()
+	shutil.rmtree(listDir)
+	return seconds
+
+def benchParseListFromFile(data):
+	fileObj = open(data.listPath, "r")
+	startTime = time.perf_counter()
+	parseListFromFile(fileObj)
+	seconds = time.perf_counter() - startTime
+	fileObj.close()
+	return seconds
 
+def benchWriteListToFile(data):
+	listPath = pathCombine2(data.tempDir, "list2.csv")
+	fileObj = open(listPath, "w")
+	startTime = time.perf_counter()
+	writeListToFile(fileObj, data.myList)
+	fileObj.close()
+	seconds = time.perf_counter() - startTime
+	os.remove(listPath)
+	return seconds
+
+def benchSortList2(data):
+	myList = makeSyntheticList(data.count, data.count)
+	startTime = time.perf_counter()
+	sortList2(myList)
+	return time.perf_counter() - startTime
+
+def benchCompareListsSorted2(data):
+	startTime = time.perf_counter()
+	compareListsSorted2(data.myList, data.myList2)
+	return time.perf_counter() - startTime
+
+def benchCompareListsStreamed(data):
+	startTime = time.perf_counter()
+	specCount = 0
+	for spec in compareListsStreamed(data.myList, data.myList2, "list1", "list2"):
+		specCount += 1
+	return time.perf_counter() - startTime
+
+def benchCompareListsSorted(data):
+	startTime = time.perf_counter()
+	compareListsSorted(data.myList, data.myList2)
+	return time.perf_counter() - startTime
+
+def benchRemoveNonRepoFiles(data):
+	# paths like from --make-list-from-dir,
+	# with some files that are not in the pool
+	myList = copySpecList(data.myList)
 	i = 0
 	while(i < len(myList)):
-		spec = myList[i]
-		
-		if(spec.theDir == None
-			or spec.fileNameMinusPath == None):
-			
-			raise Exception("a RepoFileSpec is bad")
+		myList[i].theDir = "/srv/mirror/debian/pool/" + myList[i].theDir
+		if(i % 100 == 0): myList[i].theDir = "/srv/mirror/debian/dists/testing"
+		i += 1
 
-		downloadFile(outputDir, mirror, spec)
+	startTime = time.perf_counter()
+	removeNonRepoFiles(myList)
+	return time.perf_counter() - startTime
+
+def makeBenchmarkPool(data):
+	# empty files, in the dirs of the list
+	poolDir = pathCombine2(data.tempDir, "pool")
+	for spec in data.myList:
+		theDir = pathCombine2(poolDir, spec.theDir)
+		makeDirs(theDir)
+		open(pathCombine2(theDir, spec.fileNameMinusPath), "w").close()
+	return poolDir
+
+def benchGetFileList(data):
+	poolDir = makeBenchmarkPool(data)
+
+	startTime = time.perf_counter()
+	myList = list(getFileList(poolDir, BENCHMARK_JOB_COUNT))
+	seconds = time.perf_counter() - startTime
+
+	shutil.rmtree(poolDir)
+	if(len(myList) != len(data.myList)):
+		raise Exception("benchmark file count not valid: " + str(len(myList)))
+	return seconds
+
+# name, function, and the largest count it is run with,
+# as some of the older functions would take hours on big lists.
+# The functions the commands use come first,
+# the ones they replaced are kept to compare with.
+BENCHMARK_SUITE = [
+	("makeListFromIndex/Packages", benchMakeListFromPackages, 500000),
+	("makeListFromIndex/Sources", benchMakeListFromSources, 500000),
+	("iterListFromFile", benchIterListFromFile, None),
+	("writeListToDir", benchWriteListToDir, None),
+	("openListFromDir", benchOpenListFromDir, None),
+	("sortList2", benchSortList2, None),
+	("compareListsSorted2", benchCompareListsSorted2, None),
+	("compareListsStreamed", benchCompareListsStreamed, None),
+	("removeNonRepoFiles", benchRemoveNonRepoFiles, None),
+	("getFileList", benchGetFileList, 50000),
+	("parseListFromFile", benchParseListFromFile, None),
+	("writeListToFile", benchWriteListToFile, None),
+	("compareListsSorted", benchCompareListsSorted, 500000),
+]
+
+def runBenchmarkSuite(countList, nameList):
+	# Gives the results, as a list of dicts
+	resultList = []
+	for count in countList:
+		tempDir = tempfile.mkdtemp()
+		try:
+			data = None
+			for name, function, maxCount in BENCHMARK_SUITE:
+				if(nameList != None and name not in nameList): continue
+				if(maxCount != None and count > maxCount): continue
+				if(data == None): data = makeBenchmarkData(count, tempDir)
+
+				repeatCount = 1
+				if(count <= BENCHMARK_REPEAT_MAX_COUNT):
+					repeatCount = BENCHMARK_REPEAT_COUNT
+				seconds = None
+				i = 0
+				while(i < repeatCount):
+					runSeconds = function(data)
+					if(seconds == None or runSeconds < seconds): seconds = runSeconds
+					i += 1
+
+				print("benchmark: " + name + " count=" + str(count)
+					+ " seconds=" + ("%.3f" % seconds))
+				resultList.append({
+					"name": name,
+					"count": count,
+					"seconds": round(seconds, 6),
+				})
+		finally:
+			shutil.rmtree(tempDir)
+	return resultList
+
+def writeBenchmarkFile(path, resultList):
+	fileObj = open(path, "w")
+	json.dump({
+		"version": BENCHMARK_FORMAT_VERSION,
+		"python": sys.version.split()[0],
+		"time": int(time.time()),
+		"results": resultList,
+	}, fileObj, indent=1, sort_keys=True)
+	fileObj.write(NEWLINE)
+	fileObj.close()
 
-		os.chdir(relDir)
-		
-		i += 1
+def readBenchmarkFile(path):
+	fileObj = open(path, "r")
+	try:
+		propDict = json.load(fileObj)
+	except ValueError as e:
+		raise Exception("benchmark file not valid: " + path + ": " + str(e))
+	finally:
+		fileObj.close()
 
-	os.chdir(relDir)
-	return
+	if(not isinstance(propDict, dict)
+		or propDict.get("version") != BENCHMARK_FORMAT_VERSION
+		or not isinstance(propDict.get("results"), list)):
 
-def downloadFile(outputDir, mirror, spec):
-	print("filename: " + spec.fileNameMinusPath)
-	print("thedir: " + spec.theDir)
-	
-	downPath = pathCombine2(outputDir, "pool")
-	downPath = pathCombine2(downPath, spec.theDir)
-	makeDirs(downPath)
-	os.chdir(downPath)
-	
-	webPath = ("https://"
-		+ mirror
-		+ "/" + "debian"
-		+ "/" + "pool"
-		+ "/" + spec.theDir + "/" + spec.fileNameMinusPath)
-	
-	downloadFileSize = getFileSize(spec.fileNameMinusPath)
-	if(downloadFileSize != None):
-		if(downloadFileSize == spec.fileSize):
-			return
-	
-	r = os.system(
-		"wget -c"
-		+ " --quiet --show-progress --progress=bar"
-		+ " " + webPath)
-	if(r != 0):
-		raise Exception("file download failed: " + spec.fileNameMinusPath)
-	
-	return
+		raise Exception("benchmark file not valid: " + path)
+	return propDict["results"]
+
+def compareBenchmarkResults(resultList, baselineList):
+	# Gives the regressions, as strings
+	baselineDict = {}
+	for result in baselineList:
+		baselineDict[(result["name"], result["count"])] = result["seconds"]
+
+	regressionList = []
+	for result in resultList:
+		baseSeconds = baselineDict.get((result["name"], result["count"]))
+		if(baseSeconds == None): continue
+		seconds = result["seconds"]
+		if(seconds < BENCHMARK_MIN_SECONDS): continue
+		if(seconds <= baseSeconds * BENCHMARK_REGRESSION_FACTOR): continue
+		regressionList.append(result["name"] + " count=" + str(result["count"])
+			+ " seconds=" + ("%.3f" % seconds)
+			+ " baseline=" + ("%.3f" % baseSeconds))
+	return regressionList
 
 
 #
@@ -1324,8 +5447,8 @@ def downloadFile(outputDir, mirror, spec):
 #
 
 def main():
-	mirror = "mirrors.xmission.com"
-	#mirror = "cdimage.debian.org"
+	mirrorList = ["mirrors.xmission.com"]
+	#mirrorList = ["cdimage.debian.org"]
 	
 	distName = "testing"
 
@@ -1350,14 +5473,42 @@ def main():
 	getList2 = False
 	getList3 = False
 	download = False
+	verify = False
+	prune = False
+	pruneKeepCount = 0
+	pruneDryRun = False
 	compareLists = False
 	compareLists2 = False
+	compareLists3 = False
+	compareLists4 = False
+	historyDirList = None
+	newestOnly = False
+	benchmarkSort1 = False
+	benchmarkLoad1 = False
+	benchmarkMemory1 = False
+	benchmark = False
+	benchmarkCountList = [50000, 500000, 2000000]
+	benchmarkNameList = None
+	benchmarkOutput = None
+	benchmarkBaseline = None
+	statsJsonPath = None
+	daemonSocket = None
+	daemonLists = []
+	querySocket = None
+	queryStr = None
 	outputDir = None
 	inputDir = None
-	arch = None
+	archList = None
+	componentList = None
+	distList = None
 	listDir1 = None
 	listDir2 = None
-	
+	mirrorSet = False
+	jobCount = 4
+	cacheDir = None
+	cacheMaxSize = 1024 * 1024 * 1024
+	downloadOptions = DownloadOptions()
+
 	i = 1
 	count = len(sys.argv)
 	while(i < count):
@@ -1369,6 +5520,14 @@ def main():
 		if(arg == "--get-list-from-mirror"): getList2 = True
 		if(arg == "--get-list-from-dir"): getList3 = True
 		if(arg == "--download"): download = True
+		if(arg == "--verify"): verify = True
+		if(arg == "--prune"): prune = True
+		if(arg == "--prune-dry-run"): pruneDryRun = True
+		if(arg == "--benchmark-sort"): benchmarkSort1 = True
+		if(arg == "--benchmark-load"): benchmarkLoad1 = True
+		if(arg == "--benchmark-memory"): benchmarkMemory1 = True
+		if(arg == "--benchmark"): benchmark = True
+		if(arg == "--newest-only"): newestOnly = True
 		
 		if(arg == "--compare-lists"):
 			nextArg2 = None
@@ -1401,7 +5560,40 @@ def main():
 			compareLists2 = True
 			i += 3
 			continue
-			
+
+		if(arg == "--compare-lists-streamed"):
+			nextArg2 = None
+			if(i + 2 < count): nextArg2 = sys.argv[i + 2]
+
+			if(nextArg == None or nextArg2 == None):
+				raise Exception("--compare-lists-streamed needs two list directories as params")
+
+			if(not dirExists2(nextArg) or not dirExists2(nextArg2)):
+				raise Exception("--compare-lists-streamed needs two list directories as params")
+
+			listDir1 = nextArg
+			listDir2 = nextArg2
+			compareLists3 = True
+			i += 3
+			continue
+
+		if(arg == "--compare-lists-history"):
+			# the list dirs, oldest first, up to the next option
+			historyDirList = []
+			j = i + 1
+			while(j < count and not sys.argv[j].startswith("--")):
+				if(not dirExists2(sys.argv[j])):
+					raise Exception("--compare-lists-history list dir does not exist: "
+						+ sys.argv[j])
+				historyDirList.append(sys.argv[j])
+				j += 1
+
+			if(len(historyDirList) < 2):
+				raise Exception("--compare-lists-history needs two or more list directories as params")
+			compareLists4 = True
+			i = j
+			continue
+
 		if(arg == "--input-dir"):
 			if(inputDir != None):
 				raise Exception("--input-dir set twice")
@@ -1419,20 +5611,233 @@ def main():
 			continue
 		
 		if(arg == "--arch"):
-			if(arch != None):
+			# like amd64,i386,source
+			if(archList != None):
 				raise Exception("arch cannot be set twice")
 			if(nextArg == None):
 				raise Exception("--arch param not given")
-			if(nextArg == "amd64"): arch = "amd64"
-			if(nextArg == "i386"): arch = "i386"
-			if(nextArg == "source"): arch = "source"
-			if(arch == None):
-				raise Exception("unknown --arch param: " + nextArg)
+			archList = []
+			for archName in nextArg.split(","):
+				archInfo = None
+				if(archName == "amd64"): archInfo = amd64
+				if(archName == "i386"): archInfo = i386
+				if(archName == "source"): archInfo = source
+				if(archInfo == None):
+					raise Exception("unknown --arch param: " + archName)
+				if(archInfo not in archList): archList.append(archInfo)
 			i += 2
 			continue
-		
+
+		if(arg == "--component"):
+			# like main,contrib,non-free,non-free-firmware
+			if(componentList != None):
+				raise Exception("--component set twice")
+			if(nextArg == None):
+				raise Exception("--component param not given")
+			componentList = []
+			for component in nextArg.split(","):
+				if(component != "main"
+					and component != "contrib"
+					and component != "non-free"
+					and component != "non-free-firmware"):
+
+					raise Exception("unknown --component param: " + component)
+				if(component not in componentList): componentList.append(component)
+			i += 2
+			continue
+
+		if(arg == "--dist"):
+			# like testing,stable
+			if(distList != None):
+				raise Exception("--dist set twice")
+			if(nextArg == None):
+				raise Exception("--dist param not given")
+			distList = []
+			for distName in nextArg.split(","):
+				if(distName == "" or distName.find("/") >= 0):
+					raise Exception("--dist param not valid: " + nextArg)
+				if(distName not in distList): distList.append(distName)
+			i += 2
+			continue
+
+		if(arg == "--mirror"):
+			if(mirrorSet):
+				raise Exception("--mirror set twice")
+			if(nextArg == None):
+				raise Exception("--mirror param not given")
+			# like --arch, can be a list, like mirror1,mirror2
+			mirrorList = []
+			for mirror in nextArg.split(","):
+				getMirrorInfo(mirror)
+				if(mirror not in mirrorList): mirrorList.append(mirror)
+			mirrorSet = True
+			i += 2
+			continue
+
+		if(arg == "--cache-dir"):
+			if(cacheDir != None):
+				raise Exception("--cache-dir set twice")
+			if(nextArg == None):
+				raise Exception("--cache-dir param not given")
+			cacheDir = nextArg
+			i += 2
+			continue
+
+		if(arg == "--cache-max-size"):
+			# in MB, for the cached lists
+			if(nextArg == None or not isStringSimpleNumber(nextArg)):
+				raise Exception("--cache-max-size needs a number as param")
+			cacheMaxSize = getNumberFromString(nextArg) * 1024 * 1024
+			i += 2
+			continue
+
+		if(arg == "--segment-threshold"):
+			# in MB, 0 to not fetch files in segments
+			if(nextArg == None or not isStringSimpleNumber(nextArg)):
+				raise Exception("--segment-threshold needs a number as param")
+			downloadOptions.segmentThreshold = getNumberFromString(nextArg) * 1024 * 1024
+			if(downloadOptions.segmentThreshold == 0):
+				downloadOptions.segmentThreshold = None
+			i += 2
+			continue
+
+		if(arg == "--segment-jobs"):
+			if(nextArg == None or not isStringSimpleNumber(nextArg)
+				or getNumberFromString(nextArg) < 1):
+
+				raise Exception("--segment-jobs needs a number as param")
+			downloadOptions.segmentJobCount = getNumberFromString(nextArg)
+			i += 2
+			continue
+
+		if(arg == "--benchmark-counts"):
+			# like 50000,500000
+			if(nextArg == None):
+				raise Exception("--benchmark-counts param not given")
+			benchmarkCountList = []
+			for countStr in nextArg.split(","):
+				if(not isStringSimpleNumber(countStr)
+					or getNumberFromString(countStr) < 1):
+
+					raise Exception("--benchmark-counts param not valid: " + nextArg)
+				benchmarkCountList.append(getNumberFromString(countStr))
+			i += 2
+			continue
+
+		if(arg == "--benchmark-only"):
+			# like sortList2,getFileList
+			if(nextArg == None):
+				raise Exception("--benchmark-only param not given")
+			benchmarkNameList = nextArg.split(",")
+			for name in benchmarkNameList:
+				isFound = False
+				for item in BENCHMARK_SUITE:
+					if(item[0] == name): isFound = True
+				if(not isFound):
+					raise Exception("benchmark not found: " + name)
+			i += 2
+			continue
+
+		if(arg == "--benchmark-output" or arg == "--benchmark-baseline"):
+			if(nextArg == None):
+				raise Exception(arg + " param not given")
+			if(arg == "--benchmark-output"): benchmarkOutput = nextArg
+			if(arg == "--benchmark-baseline"): benchmarkBaseline = nextArg
+			i += 2
+			continue
+
+		if(arg == "--daemon"):
+			# like --daemon /run/deblist.sock --daemon-list old=dir1
+			if(nextArg == None):
+				raise Exception("--daemon param not given")
+			daemonSocket = os.path.abspath(nextArg)
+			i += 2
+			continue
+
+		if(arg == "--daemon-list"):
+			if(nextArg == None or nextArg.find("=") <= 0):
+				raise Exception("--daemon-list needs name=dir as param")
+			name, listDir = nextArg.split("=", 1)
+			if(not dirExists(listDir)):
+				raise Exception("--daemon-list dir does not exist: " + listDir)
+			daemonLists.append((name, listDir))
+			i += 2
+			continue
+
+		if(arg == "--query"):
+			# like --query /run/deblist.sock '{"command": "lists"}'
+			nextArg2 = None
+			if(i + 2 < count): nextArg2 = sys.argv[i + 2]
+			if(nextArg == None or nextArg2 == None):
+				raise Exception("--query needs a socket path and a request")
+			querySocket = nextArg
+			queryStr = nextArg2
+			i += 3
+			continue
+
+		if(arg == "--stats-json"):
+			if(nextArg == None):
+				raise Exception("--stats-json param not given")
+			statsJsonPath = os.path.abspath(nextArg)
+			i += 2
+			continue
+
+		if(arg == "--order"):
+			if(nextArg == None or nextArg not in DOWNLOAD_ORDERS):
+				raise Exception("--order needs one of: "
+					+ ", ".join(sorted(DOWNLOAD_ORDERS.keys())))
+			downloadOptions.order = nextArg
+			i += 2
+			continue
+
+		if(arg == "--rate-limit" or arg == "--mirror-rate-limit"):
+			# in KB/s
+			if(nextArg == None or not isStringSimpleNumber(nextArg)
+				or getNumberFromString(nextArg) < 1):
+
+				raise Exception(arg + " needs a number as param")
+			rateLimit = getNumberFromString(nextArg) * 1000
+			if(arg == "--rate-limit"): downloadOptions.rateLimit = rateLimit
+			if(arg == "--mirror-rate-limit"): downloadOptions.mirrorRateLimit = rateLimit
+			i += 2
+			continue
+
+		if(arg == "--mirror-jobs"):
+			if(nextArg == None or not isStringSimpleNumber(nextArg)
+				or getNumberFromString(nextArg) < 1):
+
+				raise Exception("--mirror-jobs needs a number as param")
+			downloadOptions.mirrorJobCount = getNumberFromString(nextArg)
+			i += 2
+			continue
+
+		if(arg == "--jobs"):
+			if(nextArg == None or not isStringSimpleNumber(nextArg)):
+				raise Exception("--jobs needs a number as param")
+			jobCount = getNumberFromString(nextArg)
+			if(jobCount < 1):
+				raise Exception("--jobs needs a number as param")
+			i += 2
+			continue
+
+		if(arg == "--prune-keep"):
+			# old versions kept for each package
+			if(nextArg == None or not isStringSimpleNumber(nextArg)):
+				raise Exception("--prune-keep needs a number as param")
+			pruneKeepCount = getNumberFromString(nextArg)
+			i += 2
+			continue
+
 		i += 1
 
+	if(cacheDir == None): cacheDir = getDefaultCacheDir()
+	cacheDir = os.path.abspath(cacheDir)
+
+	if(statsJsonPath != None):
+		RUN_STATS.enable()
+		# written at the end, also when the run fails
+		atexit.register(writeRunStatsFile, statsJsonPath)
+
 	if(getList1):
 		os.chdir(relDir1)
 
@@ -1444,51 +5849,35 @@ def main():
 			if(dirExists2(outputDir)):
 				raise Exception("--output-dir already exists")
 
-		myList = getFileList(inputDir)
+		myList = list(getFileList(inputDir, jobCount))
 		replaceBackslash(myList)
 		removeNonRepoFiles(myList)
 		myList = sortList2(myList)
 		print("List length: " + str(len(myList)))
 
 		if(outputDir != None):
-			makeDirs(outputDir)
-			fileObj = open(pathCombine2(outputDir, "list1.csv"), "w")
-			fileObj.seek(0, 0)
-			writeListToFile(fileObj, myList)
-			fileObj.close()
+			writeListToDir(outputDir, myList)
 
 	if(getList2):
 		os.chdir(relDir1)
 		
-		if(arch == None):
+		if(archList == None):
 			raise Exception("with --get-list-from-mirror, --arch must be set")
-		archInfo = None
-		if(arch == "amd64"): archInfo = amd64
-		if(arch == "i386"): archInfo = i386
-		if(arch == "source"): archInfo = source
-		
+		if(componentList == None): componentList = ["main"]
+		if(distList == None): distList = [distName]
+
 		if(outputDir == None):
 			raise Exception("with --get-list-from-mirror, --output-dir must be set")
 		if(dirExists2(outputDir)):
 			raise Exception("--output-dir already exists")
 
-		getListFromMirror(outputDir, mirror, distName, archInfo)
-		
-		pkgList = parseMirrorList(outputDir, archInfo)
-		print("Package count: " + str(len(pkgList)))
-		
-		myList = makeRegularListFromPackageList(pkgList)
-		replaceBackslash(myList)
-		removeNonRepoFiles(myList)
-		myList = sortList2(myList)
+		# the lists come from the first mirror
+		myList = getListFromMirror(outputDir, mirrorList[0],
+			distList, componentList, archList, cacheDir, cacheMaxSize, jobCount)
 		print("List length: " + str(len(myList)))
 
 		if(outputDir != None):
-			makeDirs(outputDir)
-			fileObj = open(pathCombine2(outputDir, "list1.csv"), "w")
-			fileObj.seek(0, 0)
-			writeListToFile(fileObj, myList)
-			fileObj.close()
+			writeListToDir(outputDir, myList)
 
 	if(getList3):
 		os.chdir(relDir1)
@@ -1498,13 +5887,10 @@ def main():
 		if(not dirExists(inputDir)):
 			raise Exception("--input-dir does not exist")
 		
-		fileObj = open(pathCombine2(inputDir, "list1.csv"), "r")
-		fileObj.seek(0, 0)
-		myList = parseListFromFile(fileObj)
-		fileObj.close()
+		myList = openListFromDir(inputDir)
 		#dumpList(myList)
 		
-		myList = sortList2(myList)
+		myList = sortListIfNeeded(myList)
 
 	if(compareLists):
 		os.chdir(relDir1)
@@ -1513,28 +5899,20 @@ def main():
 			if(dirExists2(outputDir)):
 				raise Exception("--output-dir already exists")
 		
-		fileObj = open(pathCombine2(listDir1, "list1.csv"), "r")
-		fileObj.seek(0, 0)
-		myList1 = parseListFromFile(fileObj)
-		fileObj.close()
+		myList1 = openListFromDir(listDir1)
 		
-		myList1 = sortList2(myList1)
+		myList1 = sortListIfNeeded(myList1)
 		
-		fileObj = open(pathCombine2(listDir2, "list1.csv"), "r")
-		fileObj.seek(0, 0)
-		myList2 = parseListFromFile(fileObj)
-		fileObj.close()
+		myList2 = openListFromDir(listDir2)
 		
-		myList2 = sortList2(myList2)
+		myList2 = sortListIfNeeded(myList2)
 		
 		myList3 = compareListsSorted(myList1, myList2)
 
+		if(newestOnly): myList3 = list(iterNewestVersions(myList3))
+
 		if(outputDir != None):
-			makeDirs(outputDir)
-			fileObj = open(pathCombine2(outputDir, "list1.csv"), "w")
-			fileObj.seek(0, 0)
-			writeListToFile(fileObj, myList3)
-			fileObj.close()
+			writeListToDir(outputDir, myList3)
 
 	if(compareLists2):
 		os.chdir(relDir1)
@@ -1543,28 +5921,74 @@ def main():
 			if(dirExists2(outputDir)):
 				raise Exception("--output-dir already exists")
 		
-		fileObj = open(pathCombine2(listDir1, "list1.csv"), "r")
-		fileObj.seek(0, 0)
-		myList1 = parseListFromFile(fileObj)
-		fileObj.close()
+		myList1 = openListFromDir(listDir1)
 		
-		myList1 = sortList2(myList1)
+		myList1 = sortListIfNeeded(myList1)
 		
-		fileObj = open(pathCombine2(listDir2, "list1.csv"), "r")
-		fileObj.seek(0, 0)
-		myList2 = parseListFromFile(fileObj)
-		fileObj.close()
+		myList2 = openListFromDir(listDir2)
 		
-		myList2 = sortList2(myList2)
+		myList2 = sortListIfNeeded(myList2)
 
 		myList3 = compareListsSorted2(myList1, myList2)
 
+		if(newestOnly):
+			myList3 = list(iterNewestVersions(myList3))
+			print("Newest versions: " + str(len(myList3)))
+
+		if(outputDir != None):
+			writeListToDir(outputDir, myList3)
+
+	if(compareLists3):
+		os.chdir(relDir1)
+
+		if(outputDir != None):
+			if(dirExists2(outputDir)):
+				raise Exception("--output-dir already exists")
+
+		print("Comparing lists...")
+
+		specIter3 = iterStage("compare", compareListsStreamed(
+			iterListFromDir(listDir1),
+			iterListFromDir(listDir2),
+			listDir1,
+			listDir2))
+
+		if(newestOnly): specIter3 = iterNewestVersions(specIter3)
+
+		specCount = 0
+		if(outputDir == None):
+			for spec in specIter3: specCount += 1
+
+		if(outputDir != None):
+			specCount = writeListToDir(outputDir, specIter3)
+
+		print("List length: " + str(specCount))
+
+	if(compareLists4):
+		os.chdir(relDir1)
+
+		if(outputDir != None):
+			if(dirExists2(outputDir)):
+				raise Exception("--output-dir already exists")
+
+		print("Comparing lists: " + str(len(historyDirList)))
+
+		historyIter = iterStage("compare", iterListHistory(historyDirList))
+		fileObj = None
 		if(outputDir != None):
 			makeDirs(outputDir)
-			fileObj = open(pathCombine2(outputDir, "list1.csv"), "w")
-			fileObj.seek(0, 0)
-			writeListToFile(fileObj, myList3)
-			fileObj.close()
+			fileObj = open(pathCombine2(outputDir, "history.csv"), "w")
+
+		timer = startStage("write")
+		counts = writeListHistoryToFile(fileObj, historyDirList, historyIter)
+		endStage(timer, counts.fileCount, 0)
+		if(fileObj != None): fileObj.close()
+
+		print("Files: " + str(counts.fileCount)
+			+ ", in each list: " + str(counts.alwaysCount)
+			+ ", appeared: " + str(counts.appearedCount)
+			+ ", disappeared: " + str(counts.disappearedCount)
+			+ ", with gaps: " + str(counts.gapCount))
 
 	if(download):
 		os.chdir(relDir1)
@@ -1573,6 +5997,9 @@ def main():
 			raise Exception("with --download, --input-dir must be set")
 		if(outputDir == None):
 			raise Exception("with --download, --output-dir must be set")
+		for mirror in mirrorList:
+			if(getMirrorInfo(mirror).scheme == "file"):
+				raise Exception("--download needs an http or https mirror: " + mirror)
 		
 		if(not dirExists2(outputDir)):
 			makeDirs(outputDir)
@@ -1581,13 +6008,88 @@ def main():
 		if(not dirExists2(pathCombine2(outputDir, "pool"))):
 			raise Exception("--output-dir does not seem to be a download dir")
 
-		fileObj = open(pathCombine2(inputDir, "list1.csv"), "r")
-		fileObj.seek(0, 0)
-		myList = parseListFromFile(fileObj)
-		fileObj.close()
+		myList = openListFromDir(inputDir)
 		
-		downloadFiles(outputDir, mirror, myList)
+		downloadFiles(outputDir, mirrorList, myList, jobCount,
+			FileDigestCache(pathCombine2(cacheDir, "digests.csv")),
+			downloadOptions)
+
+	if(verify):
+		os.chdir(relDir1)
+
+		if(inputDir == None):
+			raise Exception("with --verify, --input-dir must be set")
+		if(outputDir == None):
+			raise Exception("with --verify, --output-dir must be set")
+		if(not dirExists2(pathCombine2(outputDir, "pool"))):
+			raise Exception("--output-dir does not seem to be a download dir")
+
+		myList = openListFromDir(inputDir)
+
+		verifyFiles(outputDir, myList, jobCount,
+			FileDigestCache(pathCombine2(cacheDir, "digests.csv")))
+
+	if(prune):
+		os.chdir(relDir1)
+
+		if(inputDir == None):
+			raise Exception("with --prune, --input-dir must be set")
+		if(outputDir == None):
+			raise Exception("with --prune, --output-dir must be set")
+		if(not dirExists2(pathCombine2(outputDir, "pool"))):
+			raise Exception("--output-dir does not seem to be a download dir")
+
+		myList = openListFromDir(inputDir)
+
+		myList = sortListIfNeeded(myList)
+
+		pruneFiles(outputDir, myList, pruneKeepCount, jobCount, pruneDryRun)
+
+	if(benchmarkSort1):
+		benchmarkSort([50000, 500000, 2000000])
+
+	if(benchmarkLoad1):
+		benchmarkListLoad([50000, 500000, 2000000])
+
+	if(benchmarkMemory1):
+		benchmarkMemory([50000, 500000, 2000000])
+
+	if(benchmark):
+		os.chdir(relDir1)
+		baselineList = None
+		if(benchmarkBaseline != None):
+			baselineList = readBenchmarkFile(benchmarkBaseline)
+
+		resultList = runBenchmarkSuite(benchmarkCountList, benchmarkNameList)
+		if(benchmarkOutput != None):
+			writeBenchmarkFile(benchmarkOutput, resultList)
+
+		if(baselineList != None):
+			regressionList = compareBenchmarkResults(resultList, baselineList)
+			for regression in regressionList:
+				print("regression: " + regression)
+			if(len(regressionList) > 0):
+				raise Exception("benchmark regressions: " + str(len(regressionList)))
+			print("No benchmark regressions")
+
+	if(daemonSocket != None):
+		os.chdir(relDir1)
+		if(len(daemonLists) == 0):
+			raise Exception("with --daemon, --daemon-list must be set")
+
+		daemon = ListDaemon(daemonSocket)
+		for name, listDir in daemonLists:
+			daemon.addList(name, listDir)
+		daemon.serve()
+
+	if(querySocket != None):
+		os.chdir(relDir1)
+		response = sendDaemonRequest(querySocket, queryStr)
+		print(json.dumps(response, indent=1, sort_keys=True))
+		if(not response.get("ok")):
+			raise Exception("daemon request failed: " + str(response.get("error")))
 
 	print("DONE.")
 
-main()
+if(__name__ == "__main__"):
+	main()
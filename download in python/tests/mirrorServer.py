@@ -0,0 +1,116 @@
+#
+# A local http.server stand-in for a mirror, for the tests
+#
+
+import http.server
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import DebList
+
+class MirrorHandler(http.server.BaseHTTPRequestHandler):
+	# keep-alive, like a real mirror, so connections are used again
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, *args):
+		return
+
+	def do_GET(self):
+		mirror = self.server.mirror
+		rangeStr = self.headers.get("Range")
+		if(not mirror.isRangeSupported): rangeStr = None
+		mirror.addRequest(self.path, rangeStr)
+
+		if(mirror.delay > 0): time.sleep(mirror.delay)
+
+		if(mirror.errorStatus != None):
+			self.sendBody(mirror.errorStatus, b"error", {})
+			return
+
+		path = os.path.join(mirror.rootDir,
+			urllib.parse.unquote(self.path).lstrip("/"))
+		if(not os.path.isfile(path)):
+			self.sendBody(404, b"not found", {})
+			return
+
+		fileObj = open(path, "rb")
+		data = fileObj.read()
+		fileObj.close()
+
+		if(rangeStr == None):
+			self.sendBody(200, data, {})
+			return
+
+		# only bytes=start- and bytes=start-end
+		parts = rangeStr[len("bytes="):].split("-")
+		start = int(parts[0])
+		end = len(data) - 1
+		if(parts[1] != ""): end = min(end, int(parts[1]))
+		if(start >= len(data)):
+			self.sendBody(416, b"", {"Content-Range": "bytes */" + str(len(data))})
+			return
+
+		self.sendBody(206, data[start:(end + 1)], {"Content-Range": "bytes "
+			+ str(start) + "-" + str(end) + "/" + str(len(data))})
+
+	def sendBody(self, status, body, headers):
+		self.send_response(status)
+		self.send_header("Content-Length", str(len(body)))
+		for name in headers: self.send_header(name, headers[name])
+		self.end_headers()
+		self.wfile.write(body)
+
+class MirrorServer:
+	# Serves the files in rootDir, on a port of its own.
+	# delay is added to each request, and with errorStatus,
+	# each request gets that status.
+	def __init__(self, rootDir):
+		self.rootDir = rootDir
+		self.delay = 0.0
+		self.errorStatus = None
+		self.isRangeSupported = True
+		self.lock = threading.Lock()
+		# (path, range header), for each request
+		self.requestList = []
+		self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), MirrorHandler)
+		self.httpd.daemon_threads = True
+		self.httpd.mirror = self
+		self.thread = threading.Thread(target=self.httpd.serve_forever)
+		self.thread.start()
+
+	def addRequest(self, path, rangeStr):
+		self.lock.acquire()
+		self.requestList.append((path, rangeStr))
+		self.lock.release()
+
+	def getFileRequestCount(self):
+		# requests for whole files, not the probe of the mirror
+		count = 0
+		self.lock.acquire()
+		for item in self.requestList:
+			if(item[1] == None or not item[1].startswith("bytes=0-")): count += 1
+		self.lock.release()
+		return count
+
+	def getUrl(self, path):
+		return "http://127.0.0.1:" + str(self.httpd.server_address[1]) + path
+
+	def close(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+		self.thread.join()
+
+def getRefusingUrl(path):
+	# A port nothing listens on, so each connection is refused
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.bind(("127.0.0.1", 0))
+	port = sock.getsockname()[1]
+	sock.close()
+	return "http://127.0.0.1:" + str(port) + path
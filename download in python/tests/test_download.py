@@ -0,0 +1,119 @@
+#
+# downloadUrlToFile against a local mirror,
+# continuing part files like wget -c
+#
+
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from mirrorServer import DebList, MirrorServer
+
+FILE_SIZE = 200 * 1024
+
+class DownloadTest(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.data = random.Random(2).randbytes(FILE_SIZE)
+		self.sha256 = hashlib.sha256(self.data).hexdigest()
+
+		mirrorDir = os.path.join(self.tempDir, "mirror")
+		os.makedirs(mirrorDir)
+		fileObj = open(os.path.join(mirrorDir, "file.deb"), "wb")
+		fileObj.write(self.data)
+		fileObj.close()
+
+		self.server = MirrorServer(mirrorDir)
+		self.url = self.server.getUrl("/file.deb")
+		self.localPath = os.path.join(self.tempDir, "file.deb")
+		self.pool = DebList.HttpConnectionPool()
+		self.stats = DebList.DownloadStats()
+
+	def tearDown(self):
+		self.pool.closeAll()
+		self.server.close()
+		shutil.rmtree(self.tempDir)
+
+	def writePart(self, data):
+		fileObj = open(self.localPath, "wb")
+		fileObj.write(data)
+		fileObj.close()
+
+	def download(self, fileSize, sha256):
+		return DebList.downloadUrlToFile(self.pool, self.url, self.localPath,
+			fileSize, sha256, self.stats, [])
+
+	def readLocal(self):
+		fileObj = open(self.localPath, "rb")
+		data = fileObj.read()
+		fileObj.close()
+		return data
+
+	def testWholeFile(self):
+		self.assertEqual(self.download(FILE_SIZE, self.sha256), self.sha256)
+		self.assertEqual(self.readLocal(), self.data)
+		self.assertEqual(self.server.requestList, [("/file.deb", None)])
+		self.assertEqual(self.stats.byteCount, FILE_SIZE)
+
+	def testPartFileIsContinued(self):
+		haveSize = 70000
+		self.writePart(self.data[:haveSize])
+		self.assertEqual(self.download(FILE_SIZE, self.sha256), self.sha256)
+		self.assertEqual(self.readLocal(), self.data)
+		self.assertEqual(self.server.requestList,
+			[("/file.deb", "bytes=" + str(haveSize) + "-")])
+		# only the rest came over the connection
+		self.assertEqual(self.stats.byteCount, FILE_SIZE - haveSize)
+
+	def testCompleteFileGets416(self):
+		self.writePart(self.data)
+		self.assertEqual(self.download(FILE_SIZE, self.sha256), self.sha256)
+		self.assertEqual(self.readLocal(), self.data)
+		self.assertEqual(self.server.requestList,
+			[("/file.deb", "bytes=" + str(FILE_SIZE) + "-")])
+		self.assertEqual(self.stats.byteCount, 0)
+
+	def testCompleteFileWith416IsHashed(self):
+		# a file of the full size, with other bytes, is not kept
+		self.writePart(bytes(FILE_SIZE))
+		with self.assertRaises(Exception):
+			self.download(FILE_SIZE, self.sha256)
+		self.assertFalse(os.path.exists(self.localPath))
+
+	def testPartFileWithoutRange(self):
+		self.server.isRangeSupported = False
+		self.writePart(self.data[:70000])
+		self.assertEqual(self.download(FILE_SIZE, self.sha256), self.sha256)
+		self.assertEqual(self.readLocal(), self.data)
+		self.assertEqual(self.stats.byteCount, FILE_SIZE)
+
+	def testLargerPartFileIsStartedAgain(self):
+		self.writePart(self.data + b"more")
+		self.assertEqual(self.download(FILE_SIZE, self.sha256), self.sha256)
+		self.assertEqual(self.readLocal(), self.data)
+		self.assertEqual(self.server.requestList, [("/file.deb", None)])
+
+	def testBadHashRemovesFile(self):
+		with self.assertRaises(Exception):
+			self.download(FILE_SIZE, "0" * 64)
+		self.assertFalse(os.path.exists(self.localPath))
+
+	def testHttpError(self):
+		self.server.errorStatus = 503
+		with self.assertRaises(Exception) as caught:
+			self.download(FILE_SIZE, self.sha256)
+		self.assertIn("http error 503", str(caught.exception))
+
+	def testConnectionIsUsedAgain(self):
+		self.download(FILE_SIZE, self.sha256)
+		os.remove(self.localPath)
+		self.download(FILE_SIZE, self.sha256)
+		self.assertEqual(len(self.server.requestList), 2)
+		connList = list(self.pool.idleConns.values())[0]
+		self.assertEqual(len(connList), 1)
+
+if(__name__ == "__main__"):
+	unittest.main()
@@ -0,0 +1,268 @@
+#
+# Index patches, checked against diff --ed,
+# and applied from a local dir acting as the mirror
+#
+
+import contextlib
+import gzip
+import hashlib
+import io
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from mirrorServer import DebList
+
+HAVE_DIFF = (shutil.which("diff") != None)
+
+def makeAmd64():
+	archInfo = DebList.ArchInfo()
+	archInfo.name = "amd64"
+	archInfo.longName = "binary-amd64"
+	archInfo.listName = "Packages"
+	return archInfo
+
+def makePackagesData(count, seed):
+	rand = random.Random(seed)
+	stanzaList = []
+	i = 0
+	while(i < count):
+		version = "1." + str(rand.randrange(3))
+		stanzaList.append("Package: pkg" + str(i) + "\n"
+			+ "Version: " + version + "\n"
+			+ "Description: a package\n"
+			+ " more about it\n"
+			+ " .\n"
+			+ " the end\n"
+			+ "Filename: pool/main/p/pkg" + str(i) + "/pkg" + str(i)
+			+ "_" + version + "_amd64.deb\n"
+			+ "Size: " + str(rand.randrange(1000000)) + "\n"
+			+ "SHA256: " + ("%064x" % rand.getrandbits(256)) + "\n")
+		i += 1
+	return "\n".join(stanzaList).encode("utf-8")
+
+def changePackagesData(data, seed):
+	# some packages get a new version, some go and some are new
+	rand = random.Random(seed)
+	stanzaList = data.decode("utf-8").rstrip("\n").split("\n\n")
+	i = 0
+	while(i < 20):
+		index = rand.randrange(len(stanzaList))
+		op = rand.randrange(3)
+		if(op == 0):
+			stanzaList[index] = stanzaList[index].replace("_1.", "_2.").replace(
+				"Version: 1.", "Version: 2.")
+		if(op == 1):
+			stanzaList.pop(index)
+		if(op == 2):
+			stanzaList.insert(index, stanzaList[index].replace(
+				"Package: ", "Package: new").replace("/pkg", "/newpkg"))
+		i += 1
+	return ("\n\n".join(stanzaList) + "\n").encode("utf-8")
+
+def getEdPatch(tempDir, oldData, newData):
+	oldPath = os.path.join(tempDir, "old")
+	newPath = os.path.join(tempDir, "new")
+	for path, data in ((oldPath, oldData), (newPath, newData)):
+		fileObj = open(path, "wb")
+		fileObj.write(data)
+		fileObj.close()
+	return subprocess.run(["diff", "--ed", oldPath, newPath],
+		stdout=subprocess.PIPE, check=False).stdout
+
+def getSha256Line(data, name):
+	return " " + hashlib.sha256(data).hexdigest() + " " + str(len(data)) + " " + name
+
+def applyPatchData(oldData, patchData):
+	lineList = oldData.split(b"\n")
+	if(lineList[-1] == b""): lineList.pop()
+	newList = DebList.applyEdPatch(lineList, DebList.parseEdPatch(patchData))
+	return b"\n".join(newList) + b"\n"
+
+@unittest.skipIf(not HAVE_DIFF, "diff is not installed")
+class EdPatchTest(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def checkPatch(self, oldData, newData):
+		patchData = getEdPatch(self.tempDir, oldData, newData)
+		self.assertEqual(applyPatchData(oldData, patchData), newData)
+
+	def testRandomChanges(self):
+		rand = random.Random(3)
+		i = 0
+		while(i < 50):
+			lineList = []
+			for k in range(rand.randrange(1, 200)):
+				lineList.append(b"line " + str(rand.randrange(30)).encode("ascii"))
+			newList = list(lineList)
+			for k in range(rand.randrange(1, 10)):
+				index = rand.randrange(len(newList) + 1)
+				op = rand.randrange(3)
+				if(op == 0 and index < len(newList)): del newList[index:(index + 3)]
+				if(op == 1): newList.insert(index, b"new " + str(k).encode("ascii"))
+				if(op == 2 and index < len(newList)): newList[index] = b"changed"
+			self.checkPatch(b"\n".join(lineList) + b"\n", b"\n".join(newList) + b"\n")
+			i += 1
+
+	def testLineOfJustDot(self):
+		# diff --ed ends the text before it, and puts it back with s/.//
+		self.checkPatch(b"a\nb\nc\n", b"a\n.\nb\n..\nc\n.\n")
+		self.checkPatch(b".\nx\n", b"y\n.\n.\nx\n")
+
+	def testPackagesChanges(self):
+		oldData = makePackagesData(300, 1)
+		self.checkPatch(oldData, changePackagesData(oldData, 2))
+
+class EdPatchErrorTest(unittest.TestCase):
+	def testCommandNotValid(self):
+		with self.assertRaises(Exception):
+			DebList.parseEdPatch(b"5x\n")
+
+	def testTextNotEnded(self):
+		with self.assertRaises(Exception):
+			DebList.parseEdPatch(b"3a\nnew line\n")
+
+	def testChangesNotDescending(self):
+		with self.assertRaises(Exception):
+			DebList.parseEdPatch(b"2d\n5d\n")
+
+	def testLineOutOfRange(self):
+		changeList = DebList.parseEdPatch(b"9d\n")
+		with self.assertRaises(Exception):
+			DebList.applyEdPatch([b"a", b"b"], changeList)
+
+@unittest.skipIf(not HAVE_DIFF, "diff is not installed")
+class LocalMirrorTest(unittest.TestCase):
+	# The mirror is a local dir, with a Packages.diff like the archive has
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.mirrorDir = os.path.join(self.tempDir, "mirror", "debian")
+		self.indexDir = os.path.join(self.mirrorDir,
+			"dists", "testing", "main", "binary-amd64")
+		os.makedirs(os.path.join(self.indexDir, "Packages.diff"))
+		self.cacheDir = os.path.join(self.tempDir, "cache")
+		self.runCount = 0
+
+	def tearDown(self):
+		shutil.rmtree(self.tempDir)
+
+	def writeMirrorFile(self, path, data):
+		fileObj = open(path, "wb")
+		fileObj.write(data)
+		fileObj.close()
+
+	def publish(self, historyList, data):
+		# historyList has the versions before data,
+		# the patches go from each one to the next
+		gzData = gzip.compress(data)
+		self.writeMirrorFile(os.path.join(self.indexDir, "Packages"), data)
+		self.writeMirrorFile(os.path.join(self.indexDir, "Packages.gz"), gzData)
+
+		diffDir = os.path.join(self.indexDir, "Packages.diff")
+		for name in os.listdir(diffDir): os.remove(os.path.join(diffDir, name))
+
+		versionList = historyList + [data]
+		historyLines = []
+		patchLines = []
+		downloadLines = []
+		i = 0
+		while(i < len(historyList)):
+			name = "2026-10-18-" + ("%04d" % i) + ".00"
+			patchData = getEdPatch(self.tempDir, versionList[i], versionList[i + 1])
+			patchGzData = gzip.compress(patchData)
+			self.writeMirrorFile(os.path.join(diffDir, name + ".gz"), patchGzData)
+			historyLines.append(getSha256Line(versionList[i], name))
+			patchLines.append(getSha256Line(patchData, name))
+			downloadLines.append(getSha256Line(patchGzData, name + ".gz"))
+			i += 1
+
+		diffIndexData = ("SHA256-Current: " + hashlib.sha256(data).hexdigest()
+			+ " " + str(len(data)) + "\n"
+			+ "SHA256-History:\n" + "".join(line + "\n" for line in historyLines)
+			+ "SHA256-Patches:\n" + "".join(line + "\n" for line in patchLines)
+			+ "SHA256-Download:\n" + "".join(line + "\n" for line in downloadLines)
+			).encode("utf-8")
+		self.writeMirrorFile(os.path.join(diffDir, "Index"), diffIndexData)
+
+		releaseData = ("Origin: Debian\n"
+			+ "SHA256:\n"
+			+ getSha256Line(data, "main/binary-amd64/Packages") + "\n"
+			+ getSha256Line(gzData, "main/binary-amd64/Packages.gz") + "\n"
+			+ getSha256Line(diffIndexData, "main/binary-amd64/Packages.diff/Index")
+			+ "\n").encode("utf-8")
+		self.writeMirrorFile(os.path.join(self.mirrorDir, "dists", "testing", "Release"),
+			releaseData)
+
+	def getList(self, cacheDir):
+		# Gives (spec tuples, what was printed)
+		self.runCount += 1
+		outputDir = os.path.join(self.tempDir, "out" + str(self.runCount))
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			myList = DebList.getListFromMirror(outputDir, self.mirrorDir,
+				["testing"], ["main"], [makeAmd64()], cacheDir, 1024 * 1024 * 1024, 2)
+		tupleList = []
+		for spec in myList:
+			tupleList.append((spec.theDir, spec.fileNameMinusPath,
+				spec.fileSize, spec.sha256))
+		return tupleList, output.getvalue()
+
+	def checkSameAsFullFetch(self, tupleList):
+		fullCacheDir = os.path.join(self.tempDir, "cache" + str(self.runCount))
+		fullList, output = self.getList(fullCacheDir)
+		self.assertEqual(tupleList, fullList)
+
+	def getCachedIndex(self):
+		path = os.path.join(self.cacheDir, "index", DebList.getMirrorCacheName(
+			DebList.getMirrorInfo(self.mirrorDir)),
+			"testing", "main", "binary-amd64", "Packages")
+		fileObj = open(path, "rb")
+		data = fileObj.read()
+		fileObj.close()
+		return data
+
+	def testIndexIsPatched(self):
+		data0 = makePackagesData(500, 1)
+		self.publish([], data0)
+		tupleList, output = self.getList(self.cacheDir)
+		self.assertIn("Index downloaded", output)
+		self.assertEqual(len(tupleList), 500)
+
+		# the cache is one version behind the first patch it needs
+		data1 = changePackagesData(data0, 2)
+		data2 = changePackagesData(data1, 3)
+		self.publish([data0, data1], data2)
+		tupleList, output = self.getList(self.cacheDir)
+		self.assertIn("Index patched: 2 patches", output)
+		self.assertNotIn("Index downloaded", output)
+		self.assertEqual(self.getCachedIndex(), data2)
+		self.checkSameAsFullFetch(tupleList)
+
+		tupleList2, output = self.getList(self.cacheDir)
+		self.assertIn("Index not changed", output)
+		self.assertEqual(tupleList2, tupleList)
+
+	def testBrokenChainIsFetchedWhole(self):
+		data0 = makePackagesData(500, 1)
+		self.publish([], data0)
+		self.getList(self.cacheDir)
+
+		# the patches start after the cached version
+		data1 = changePackagesData(data0, 2)
+		data2 = changePackagesData(data1, 3)
+		self.publish([data1], data2)
+		tupleList, output = self.getList(self.cacheDir)
+		self.assertIn("Index patches not used", output)
+		self.assertIn("Index downloaded", output)
+		self.assertEqual(self.getCachedIndex(), data2)
+		self.checkSameAsFullFetch(tupleList)
+
+if(__name__ == "__main__"):
+	unittest.main()
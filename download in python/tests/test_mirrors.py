@@ -0,0 +1,141 @@
+#
+# downloadFiles over several local mirrors,
+# one slow, one refusing connections and one giving errors
+#
+
+import contextlib
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from mirrorServer import DebList, MirrorServer, getRefusingUrl
+
+FILE_COUNT = 40
+FILE_SIZE = 32 * 1024
+
+class MirrorTest(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.mkdtemp()
+		self.outputDir = os.path.join(self.tempDir, "out")
+		os.makedirs(self.outputDir)
+		mirrorDir = os.path.join(self.tempDir, "mirror")
+
+		rand = random.Random(1)
+		self.specList = []
+		i = 0
+		while(i < FILE_COUNT):
+			spec = DebList.RepoFileSpec()
+			spec.theDir = "main/p/pkg" + str(i)
+			spec.fileNameMinusPath = "pkg" + str(i) + "_1.0_all.deb"
+			data = bytes(rand.getrandbits(8) for k in range(FILE_SIZE))
+			spec.fileSize = len(data)
+			spec.sha256 = hashlib.sha256(data).hexdigest()
+			self.specList.append(spec)
+
+			fileDir = os.path.join(mirrorDir, "debian", "pool", spec.theDir)
+			os.makedirs(fileDir)
+			fileObj = open(os.path.join(fileDir, spec.fileNameMinusPath), "wb")
+			fileObj.write(data)
+			fileObj.close()
+			i += 1
+
+		self.serverList = []
+		self.fastServer = self.addServer(mirrorDir)
+		self.slowServer = self.addServer(mirrorDir)
+		self.slowServer.delay = 0.2
+		self.errorServer = self.addServer(mirrorDir)
+		self.errorServer.errorStatus = 500
+
+	def tearDown(self):
+		for server in self.serverList: server.close()
+		shutil.rmtree(self.tempDir)
+
+	def addServer(self, rootDir):
+		server = MirrorServer(rootDir)
+		self.serverList.append(server)
+		return server
+
+	def runDownload(self, mirrorList):
+		# Gives what downloadFiles printed
+		options = DebList.DownloadOptions()
+		options.progressSeconds = 60.0
+		options.segmentThreshold = None
+		digestCache = DebList.FileDigestCache(
+			os.path.join(self.tempDir, "digests.csv"))
+
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			DebList.downloadFiles(self.outputDir, mirrorList, self.specList,
+				4, digestCache, options)
+		return output.getvalue()
+
+	def getMirrorSummary(self, output, mirror):
+		# Gives (file count, error count, is down)
+		for line in output.split("\n"):
+			if(not line.startswith("Mirror " + mirror + ": ")): continue
+			fields = line[len("Mirror " + mirror + ": "):].split(", ")
+			errorCount = None
+			for field in fields:
+				if(field.startswith("errors ")): errorCount = int(field[len("errors "):])
+			return int(fields[0].split(" ")[0]), errorCount, "down" in fields
+		self.fail("no summary for mirror: " + mirror)
+
+	def checkFiles(self):
+		for spec in self.specList:
+			path = os.path.join(self.outputDir, "pool", spec.theDir,
+				spec.fileNameMinusPath)
+			self.assertEqual(DebList.getFileSha256(path), spec.sha256)
+
+	def testSpreadIsWeightedBySpeed(self):
+		fastUrl = self.fastServer.getUrl("/debian")
+		slowUrl = self.slowServer.getUrl("/debian")
+		output = self.runDownload([fastUrl, slowUrl])
+		self.checkFiles()
+
+		fastCount, fastErrors, fastDown = self.getMirrorSummary(output, fastUrl)
+		slowCount, slowErrors, slowDown = self.getMirrorSummary(output, slowUrl)
+		self.assertEqual(fastCount + slowCount, FILE_COUNT)
+		self.assertEqual(fastCount, self.fastServer.getFileRequestCount())
+		self.assertEqual(slowCount, self.slowServer.getFileRequestCount())
+		# the probe finds the slow mirror some hundred times slower
+		self.assertGreater(fastCount, slowCount * 4)
+		self.assertEqual((fastErrors, slowErrors), (0, 0))
+		self.assertFalse(fastDown or slowDown)
+
+	def testFailover(self):
+		fastUrl = self.fastServer.getUrl("/debian")
+		errorUrl = self.errorServer.getUrl("/debian")
+		refusingUrl = getRefusingUrl("/debian")
+		output = self.runDownload([errorUrl, refusingUrl, fastUrl])
+		self.checkFiles()
+
+		self.assertEqual(self.getMirrorSummary(output, fastUrl),
+			(FILE_COUNT, 0, False))
+		errorCount, errorErrors, errorDown = self.getMirrorSummary(output, errorUrl)
+		refusingCount, refusingErrors, refusingDown = self.getMirrorSummary(
+			output, refusingUrl)
+		self.assertEqual((errorCount, refusingCount), (0, 0))
+		self.assertGreaterEqual(errorErrors, DebList.MIRROR_MAX_ERRORS)
+		self.assertGreaterEqual(refusingErrors, DebList.MIRROR_MAX_ERRORS)
+		self.assertTrue(errorDown and refusingDown)
+
+	def testAllMirrorsFail(self):
+		errorUrl = self.errorServer.getUrl("/debian")
+		refusingUrl = getRefusingUrl("/debian")
+		with self.assertRaises(Exception) as caught:
+			self.runDownload([errorUrl, refusingUrl])
+		self.assertIn("download failed for " + str(FILE_COUNT) + " files",
+			str(caught.exception))
+
+		# each file is tried again on the next run
+		journal = DebList.DownloadJournal(
+			os.path.join(self.outputDir, "download-journal.csv"))
+		journal.close()
+		for spec in self.specList: self.assertFalse(journal.isDone(spec))
+
+if(__name__ == "__main__"):
+	unittest.main()